@@ -0,0 +1,203 @@
+"""
+Асинхронный интерфейс к database.py.
+
+Функции database.py синхронные и при конкуренции за файл базы данных могут
+блокироваться. Здесь они выполняются в отдельных потоках, чтобы не
+останавливать цикл событий бота:
+
+- все записи идут через один поток-писатель, поэтому они выполняются
+  последовательно и не конкурируют друг с другом за блокировку SQLite;
+- чтения выполняются в небольшом пуле потоков-читателей.
+
+Каждый поток получает соединение из общего пула database.get_pool().
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_READ_THREADS = 2
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_read_executor = ThreadPoolExecutor(
+    max_workers=getattr(config, "DB_READ_THREADS", DEFAULT_READ_THREADS),
+    thread_name_prefix="db-reader",
+)
+
+
+# Выполнение функции в потоке базы данных с учетом ее длительности
+# и числа SQL-запросов в метриках (метка - имя функции)
+def _measured_call(func, args, kwargs):
+    statements = database.statement_count()
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        labels = (getattr(func, "__name__", "unknown"),)
+        metrics.DB_CALL_DURATION.observe(time.perf_counter() - started, labels)
+        metrics.DB_STATEMENTS.inc(database.statement_count() - statements, labels)
+
+
+# Выполнение функции чтения в пуле потоков-читателей
+async def run_read(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(_measured_call, func, args, kwargs))
+
+
+# Выполнение функции записи в потоке-писателе
+async def run_write(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, functools.partial(_measured_call, func, args, kwargs))
+
+
+# Функция для остановки потоков (например, при завершении процесса)
+def shutdown(wait=True):
+    _write_executor.shutdown(wait=wait)
+    _read_executor.shutdown(wait=wait)
+
+
+# Периодический перенос журнала WAL в основной файл базы данных
+async def run_checkpoints(interval=None):
+    if interval is None:
+        interval = getattr(config, "DB_CHECKPOINT_INTERVAL", database.DEFAULT_CHECKPOINT_INTERVAL)
+    if not interval:
+        return
+    
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_write(database.checkpoint)
+        except Exception as e:
+            logger.error("Ошибка при создании контрольной точки WAL: %s", e)
+
+
+# Фоновые задачи пересчета расписания (ссылки хранятся, чтобы задачи
+# не были удалены сборщиком мусора до завершения)
+_background_tasks = set()
+
+
+# Пересчет расписания пользователя после смены часового пояса
+async def _reproject(user_id):
+    try:
+        count = await run_write(database.reproject_user_schedule, user_id)
+        if count is not None:
+            logger.info("Пересчитано напоминаний пользователя %s: %s", user_id, count)
+    except Exception as e:
+        logger.error("Ошибка при пересчете расписания пользователя %s: %s", user_id, e)
+
+
+# Запуск пересчета расписания пользователя в фоне без ожидания результата
+def schedule_reprojection(user_id):
+    task = asyncio.get_running_loop().create_task(_reproject(user_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+# Возобновление пересчетов, прерванных остановкой бота
+async def resume_reprojections():
+    for user_id in await run_read(database.get_pending_reprojections):
+        schedule_reprojection(user_id)
+
+
+# Чтение
+
+# Новый пользователь добавляется в базу в потоке записи
+async def get_user_timezone(user_id):
+    timezone = await run_read(database.find_user_timezone, user_id)
+    if timezone is None:
+        timezone = await run_write(database.get_user_timezone, user_id)
+    return timezone
+
+async def get_user_events(user_id):
+    return await run_read(database.get_user_events, user_id)
+
+async def get_user_events_with_reminders(user_id):
+    return await run_read(database.get_user_events_with_reminders, user_id)
+
+async def get_user_events_page(user_id, after=None, backward=False, limit=10, since=None, with_reminders=False):
+    return await run_read(database.get_user_events_page, user_id, after, backward, limit, since, with_reminders)
+
+async def get_event(event_id):
+    return await run_read(database.get_event, event_id)
+
+async def get_event_details(event_id, user_id):
+    return await run_read(database.get_event_details, event_id, user_id)
+
+async def get_event_with_reminder_count(event_id, user_id):
+    return await run_read(database.get_event_with_reminder_count, event_id, user_id)
+
+async def get_event_reminders(event_id):
+    return await run_read(database.get_event_reminders, event_id)
+
+async def get_reminder(reminder_id):
+    return await run_read(database.get_reminder, reminder_id)
+
+async def get_reminder_count(event_id):
+    return await run_read(database.get_reminder_count, event_id)
+
+
+# Запись
+
+# Смена часового пояса не ждет пересчета расписания: он выполняется в фоне
+# следующим заданием потока-писателя
+async def set_user_timezone(user_id, timezone):
+    await run_write(database.set_user_timezone, user_id, timezone)
+    schedule_reprojection(user_id)
+
+async def add_event(user_id, name, event_date, event_time):
+    return await run_write(database.add_event, user_id, name, event_date, event_time)
+
+async def insert_events(user_id, events):
+    return await run_write(database.insert_events, user_id, events)
+
+# Асинхронный вариант database.import_events. Очередная часть событий читается
+# из events в потоке-читателе, а вставляется отдельным заданием потока-писателя,
+# поэтому долгий импорт не задерживает запись других пользователей.
+# on_progress - корутина, вызываемая после каждой части с (событий, напоминаний).
+async def import_events(user_id, events, chunk_size=500, on_progress=None):
+    total_events = total_reminders = 0
+    iterator = iter(events)
+    
+    while True:
+        chunk = await run_read(lambda: list(itertools.islice(iterator, chunk_size)))
+        if not chunk:
+            break
+        total_reminders += await insert_events(user_id, chunk)
+        total_events += len(chunk)
+        if on_progress is not None:
+            await on_progress(total_events, total_reminders)
+    
+    return total_events, total_reminders
+
+async def add_reminder(event_id, reminder_date, reminder_time):
+    return await run_write(database.add_reminder, event_id, reminder_date, reminder_time)
+
+async def add_relative_reminder(event_id, offset_minutes):
+    return await run_write(database.add_relative_reminder, event_id, offset_minutes)
+
+async def set_event_recurrence(event_id, user_id, rrule):
+    return await run_write(database.set_event_recurrence, event_id, user_id, rrule)
+
+async def skip_next_occurrence(event_id, user_id):
+    return await run_write(database.skip_next_occurrence, event_id, user_id)
+
+async def delete_event(event_id):
+    return await run_write(database.delete_event, event_id)
+
+async def delete_reminder(reminder_id):
+    return await run_write(database.delete_reminder, reminder_id)
@@ -0,0 +1,93 @@
+"""
+Общие вспомогательные функции для бенчмарков.
+
+Бенчмарки не требуют заполненного config.py: конфигурация берется из
+config.py.example, а база данных создается во временном каталоге.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_config(**overrides):
+    """Загружает config.py.example как модуль config с переопределениями"""
+    module = types.ModuleType("config")
+    with open(os.path.join(ROOT, "config.py.example"), encoding="utf-8") as f:
+        exec(f.read(), module.__dict__)
+    
+    if "DB_NAME" not in overrides:
+        overrides["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="calendar-bench-"), "calendar.db")
+    if "LOG_FILE" not in overrides:
+        overrides["LOG_FILE"] = os.devnull
+    if "SCHEDULER_LOG_FILE" not in overrides:
+        overrides["SCHEDULER_LOG_FILE"] = os.devnull
+    
+    module.__dict__.update(overrides)
+    sys.modules["config"] = module
+    return module
+
+
+def percentile(samples, p):
+    """Возвращает p-й перцентиль (0-100) списка значений"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(func, repeat):
+    """Выполняет func repeat раз и возвращает список длительностей в микросекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def report(title, samples):
+    """Печатает строку со сводной статистикой по замерам"""
+    print(
+        f"{title:<45} n={len(samples):<6} "
+        f"p50={percentile(samples, 50):9.1f}us "
+        f"p95={percentile(samples, 95):9.1f}us "
+        f"p99={percentile(samples, 99):9.1f}us"
+    )
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов, выполненных через соединения пула database"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, statement):
+        # Управление транзакциями, PRAGMA и операторы внутри триггеров не считаются
+        keyword = statement.lstrip()[:6].upper()
+        if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH S", "WITH R", "REPLAC"):
+            with self._lock:
+                self.count += 1
+
+
+def count_queries(database):
+    """Подключает QueryCounter ко всем новым соединениям пула (вызывать до init_db)"""
+    counter = QueryCounter()
+    create_connection = database.ConnectionPool._create_connection
+
+    def create_traced_connection(pool):
+        conn = create_connection(pool)
+        conn.set_trace_callback(counter.record)
+        return conn
+
+    database.ConnectionPool._create_connection = create_traced_connection
+    return counter
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота целиком: ConversationHandler из main.build_application()
+против заглушки Telegram Bot API (fake_bot_api) в том же процессе.
+
+База данных заполняется синтетическими пользователями с событиями
+и напоминаниями (datasets.populate), после чего смоделированные
+пользователи из этого набора одновременно проходят сценарий:
+/start -> «Добавить событие» -> название -> дата -> время -> напоминание
+за час -> главное меню -> список событий -> детали события -> главное меню.
+Бот получает обновления через getUpdates, как от Telegram, и отвечает
+заглушке, а пользователь нажимает кнопки из полученных сообщений.
+
+Печатаются перцентили задержки обработки по шагам сценария (от выдачи
+обновления боту до окончания всех его обработчиков), пропускная способность
+и число SQL-запросов на обновление. Запросы на каждом шаге считаются
+отдельно на одном пользователе без конкурирующей нагрузки.
+
+Запуск:
+    python benchmarks/bench_bot.py --users 10000 --sessions 200
+    python benchmarks/bench_bot.py --users 1000000 --events 3 --sessions 500
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import time
+
+from _common import count_queries, load_config, percentile
+
+config = load_config(BOT_TOKEN="123456:bench", PERSISTENCE_UPDATE_INTERVAL=60, SCHEDULER_MODE="process", FEED_ENABLED=False)
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import async_database
+import database
+import logging_setup
+import main as bot_main
+from datasets import populate
+from fake_bot_api import BOT_USER, FakeBotApi
+
+_update_ids = itertools.count(1)
+
+
+def message_update(user_id, text):
+    update = {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return update
+
+
+def callback_update(user_id, data):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "chat_instance": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+                "from": BOT_USER,
+                "text": "меню",
+            },
+        },
+    }
+
+
+class Session:
+    """Смоделированный пользователь, проходящий сценарий шаг за шагом"""
+
+    def __init__(self, bench, user_id):
+        self.bench = bench
+        self.user_id = user_id
+
+    # Отправка обновления и ожидание окончания его обработки
+    async def send(self, step, update):
+        done = asyncio.get_running_loop().create_future()
+        self.bench.pending[update["update_id"]] = (step, done)
+        self.bench.api.add_updates([update])
+        await done
+
+    def button(self, prefix):
+        for data in self.bench.api.buttons(self.user_id):
+            if data.startswith(prefix):
+                return data
+        raise RuntimeError(f"у пользователя {self.user_id} нет кнопки {prefix}: {self.bench.api.buttons(self.user_id)}")
+
+    async def run(self, think_time):
+        event_date = (datetime.date.today() + datetime.timedelta(days=7)).strftime("%d.%m.%Y")
+        steps = [
+            ("/start", lambda: message_update(self.user_id, "/start")),
+            ("add_event", lambda: callback_update(self.user_id, "add_event")),
+            ("event_name", lambda: message_update(self.user_id, f"Встреча {self.user_id}")),
+            ("event_date", lambda: message_update(self.user_id, event_date)),
+            ("event_time", lambda: message_update(self.user_id, "10:30")),
+            ("add_reminder_now", lambda: callback_update(self.user_id, self.button("add_reminder_now"))),
+            ("reminder_offset", lambda: message_update(self.user_id, "-1h")),
+            ("back_to_menu", lambda: callback_update(self.user_id, "back_to_menu")),
+            ("view_events", lambda: callback_update(self.user_id, "view_events")),
+            ("view_event", lambda: callback_update(self.user_id, self.button("view_event_"))),
+            ("back_to_menu", lambda: callback_update(self.user_id, "back_to_menu")),
+        ]
+        for step, make in steps:
+            await self.send(step, make())
+            if think_time:
+                await asyncio.sleep(think_time)
+        await self.send("/cancel", message_update(self.user_id, "/cancel"))
+
+
+class Bench:
+    def __init__(self, api, queries):
+        self.api = api
+        self.queries = queries
+        # update_id -> (шаг сценария, future окончания обработки)
+        self.pending = {}
+        # шаг -> список задержек в миллисекундах
+        self.latencies = {}
+        self.handled = 0
+
+    # Последний обработчик (группа после ConversationHandler): обновление обработано
+    async def on_processed(self, update, context):
+        step, done = self.pending.pop(update.update_id)
+        delivered_at = self.api.delivered_at.get(update.update_id)
+        if delivered_at is not None:
+            self.latencies.setdefault(step, []).append((time.perf_counter() - delivered_at) * 1000)
+        self.handled += 1
+        done.set_result(None)
+
+
+# Число SQL-запросов на каждом шаге сценария для одного пользователя
+async def profile_queries(bench, user_id):
+    counts = {}
+    original_send = Session.send
+
+    async def counted_send(session, step, update):
+        before = bench.queries.count
+        await original_send(session, step, update)
+        # Запись в базу могла завершиться чуть позже ответа бота
+        await asyncio.sleep(0.05)
+        counts.setdefault(step, []).append(bench.queries.count - before)
+
+    Session.send = counted_send
+    try:
+        await Session(bench, user_id).run(0)
+    finally:
+        Session.send = original_send
+    return counts
+
+
+async def run(args):
+    # Логи пишутся так же, как в работающем боте (в os.devnull)
+    logging_setup.setup_logging(config.LOG_FILE)
+    queries = count_queries(database)
+    database.init_db()
+
+    started = time.perf_counter()
+    users, events, reminders = populate(args.users, args.events, args.reminders)
+    print(f"Набор данных: {users} пользователей, {events} событий, {reminders} напоминаний "
+          f"({time.perf_counter() - started:.1f} с)")
+
+    api = FakeBotApi()
+    await api.start()
+    bench = Bench(api, queries)
+    application = bot_main.build_application(base_url=api.base_url)
+    application.add_handler(TypeHandler(Update, bench.on_processed), group=1)
+
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    query_counts = await profile_queries(bench, args.users)
+    bench.latencies.clear()
+
+    sessions = [Session(bench, user_id) for user_id in range(1, min(args.sessions, args.users) + 1)]
+    queries_before, handled_before = queries.count, bench.handled
+    started = time.perf_counter()
+    await asyncio.gather(*(session.run(args.think_ms / 1000) for session in sessions))
+    elapsed = time.perf_counter() - started
+    handled = bench.handled - handled_before
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+
+    print(f"{len(sessions)} пользователей одновременно: {handled} обновлений за {elapsed:.1f} с "
+          f"({handled / elapsed:.0f} обновлений/с), "
+          f"{(queries.count - queries_before) / max(handled, 1):.1f} SQL-запросов на обновление")
+    print(f"{'шаг':<18} {'n':>6} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'запросов':>9}")
+    all_latencies = []
+    for step, samples in bench.latencies.items():
+        all_latencies.extend(samples)
+        counts = query_counts.get(step, [0])
+        print(f"{step:<18} {len(samples):>6} {percentile(samples, 50):>9.1f} {percentile(samples, 95):>9.1f} "
+              f"{percentile(samples, 99):>9.1f} {max(counts):>9}")
+    print(f"{'всего':<18} {len(all_latencies):>6} {percentile(all_latencies, 50):>9.1f} "
+          f"{percentile(all_latencies, 95):>9.1f} {percentile(all_latencies, 99):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000, help="число пользователей в наборе данных")
+    parser.add_argument("--events", type=int, default=5, help="событий у каждого пользователя")
+    parser.add_argument("--reminders", type=int, default=1, help="напоминаний у каждого события")
+    parser.add_argument("--sessions", type=int, default=200, help="сколько пользователей проходят сценарий одновременно")
+    parser.add_argument("--think-ms", type=float, default=0, help="пауза пользователя между шагами (мс)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    async_database.shutdown()
+
+
+if __name__ == "__main__":
+    main()
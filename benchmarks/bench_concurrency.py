@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк смешанной нагрузки чтения и записи из двух процессов.
+
+Два процесса (как бот и планировщик) одновременно работают с одним файлом
+базы данных: добавляют события и напоминания и читают списки событий.
+Печатается число операций в секунду и число ошибок "database is locked"
+для заданного режима журнала.
+
+Запуск:
+    python benchmarks/bench_concurrency.py --journal WAL
+    python benchmarks/bench_concurrency.py --journal DELETE --synchronous FULL --busy-timeout 0
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from _common import load_config
+
+
+def worker(number, overrides, duration, write_ratio, results):
+    load_config(**overrides)
+    import database
+    
+    rng = random.Random(number)
+    reads = writes = locked = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        user_id = rng.randint(1, 100)
+        try:
+            if rng.random() < write_ratio:
+                event_id = database.add_event(user_id, "Событие", "15.07.2031", "18:00")
+                database.add_reminder(event_id, "15.07.2031", "17:00")
+                writes += 1
+            else:
+                database.get_user_events(user_id)
+                database.get_user_events_with_reminders(user_id)
+                reads += 1
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    
+    database.close_pool()
+    results.put((number, reads, writes, locked))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journal", default="WAL", help="режим журнала (WAL, DELETE, ...)")
+    parser.add_argument("--synchronous", default="NORMAL", help="уровень PRAGMA synchronous")
+    parser.add_argument("--busy-timeout", type=int, default=5000, help="PRAGMA busy_timeout в миллисекундах")
+    parser.add_argument("--duration", type=float, default=5, help="длительность в секундах")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="доля операций записи")
+    parser.add_argument("--processes", type=int, default=2, help="число процессов")
+    args = parser.parse_args()
+    
+    overrides = {
+        "DB_NAME": os.path.join(tempfile.mkdtemp(prefix="calendar-bench-"), "calendar.db"),
+        "DB_JOURNAL_MODE": args.journal,
+        "DB_SYNCHRONOUS": args.synchronous,
+        "DB_BUSY_TIMEOUT": args.busy_timeout,
+    }
+    load_config(**overrides)
+    import database
+    database.init_db()
+    database.close_pool()
+    
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(number, overrides, args.duration, args.write_ratio, results))
+        for number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    
+    total_reads = total_writes = total_locked = 0
+    print(f"Журнал: {args.journal}, synchronous: {args.synchronous}, busy_timeout: {args.busy_timeout} мс")
+    for _ in processes:
+        number, reads, writes, locked = results.get()
+        total_reads += reads
+        total_writes += writes
+        total_locked += locked
+        print(f"  процесс {number}: чтений {reads}, записей {writes}, блокировок {locked}")
+    print(
+        f"Итого: {(total_reads + total_writes) / args.duration:.0f} оп/с "
+        f"(чтений {total_reads / args.duration:.0f}/с, записей {total_writes / args.duration:.0f}/с), "
+        f"ошибок блокировки: {total_locked}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк слоя доступа к данным.
+
+Сравнивает задержку одного вызова при открытии нового соединения на каждый
+запрос (как было раньше) и при работе через пул долгоживущих соединений
+database.py.
+
+Запуск:
+    python benchmarks/bench_database.py [--events 1000] [--repeat 2000]
+"""
+
+import argparse
+import sqlite3
+
+from _common import load_config, measure, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000, help="число событий в базе")
+    parser.add_argument("--repeat", type=int, default=2000, help="число вызовов на сценарий")
+    args = parser.parse_args()
+    
+    config = load_config()
+    import database
+    
+    database.init_db()
+    user_id = 42
+    for i in range(args.events):
+        event_id = database.add_event(user_id, f"Событие {i}", f"{i % 28 + 1:02d}.01.2030", "12:00")
+        database.add_reminder(event_id, f"{i % 28 + 1:02d}.01.2030", "11:00")
+    
+    # Прежняя реализация: отдельное соединение на каждый вызов
+    def get_event_per_call():
+        conn = sqlite3.connect(config.DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute("SELECT name, event_date, event_time FROM events WHERE id = ?", (1,))
+        cursor.fetchone()
+        conn.close()
+    
+    def get_reminders_per_call():
+        conn = sqlite3.connect(config.DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, reminder_date, reminder_time FROM reminders WHERE event_id = ? ORDER BY reminder_date, reminder_time",
+            (1,)
+        )
+        cursor.fetchall()
+        conn.close()
+    
+    def get_timezone_per_call():
+        conn = sqlite3.connect(config.DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute("SELECT timezone FROM user_settings WHERE user_id = ?", (user_id,))
+        cursor.fetchone()
+        conn.close()
+    
+    database.get_user_timezone(user_id)
+    
+    print(f"База: {config.DB_NAME}, событий: {args.events}")
+    report("get_event: соединение на вызов", measure(get_event_per_call, args.repeat))
+    report("get_event: пул", measure(lambda: database.get_event(1), args.repeat))
+    report("get_event_reminders: соединение на вызов", measure(get_reminders_per_call, args.repeat))
+    report("get_event_reminders: пул", measure(lambda: database.get_event_reminders(1), args.repeat))
+    report("get_user_timezone: соединение на вызов", measure(get_timezone_per_call, args.repeat))
+    report("get_user_timezone: пул", measure(lambda: database.get_user_timezone(user_id), args.repeat))
+    
+    database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
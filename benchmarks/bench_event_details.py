@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк просмотра деталей события.
+
+Сравнивает прежний путь (get_event + get_event_reminders, два обращения
+к базе данных) и составной запрос get_event_details для событий с разным
+числом напоминаний. Замеры выполняются через async_database, как
+в обработчиках бота.
+
+get_event_details читает результат из кэша списков, пока данные пользователя
+не изменились, поэтому составной запрос замеряется без кэша
+(database._read_event_details), а чтение через кэш - отдельной строкой.
+
+Запуск:
+    python benchmarks/bench_event_details.py [--reminders 1 10 100 1000] [--repeat 500]
+"""
+
+import argparse
+import asyncio
+import time
+
+from _common import load_config, report
+
+
+async def measure_async(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+async def run(args):
+    import database
+    import async_database
+    
+    database.init_db()
+    user_id = 42
+    
+    for count in args.reminders:
+        event_id = database.add_event(user_id, f"Событие с {count} напоминаниями", "15.07.2031", "18:00")
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO reminders (event_id, reminder_date, reminder_time, fire_at) VALUES (?, ?, ?, ?)",
+                [(event_id, "14.07.2031", f"{i // 60 % 24:02d}:{i % 60:02d}", 1942000000 + i * 60) for i in range(count)]
+            )
+        
+        async def separate():
+            await async_database.get_event(event_id)
+            await async_database.get_event_reminders(event_id)
+        
+        def read_details():
+            with database.connection() as conn:
+                return database._read_event_details(conn, event_id, user_id)
+        
+        async def composite():
+            await async_database.run_read(read_details)
+        
+        async def cached():
+            await async_database.get_event_details(event_id, user_id)
+        
+        print(f"Напоминаний у события: {count}")
+        report("  get_event + get_event_reminders", await measure_async(separate, args.repeat))
+        report("  составной запрос (без кэша)", await measure_async(composite, args.repeat))
+        report("  get_event_details (кэш списков)", await measure_async(cached, args.repeat))
+    
+    async_database.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, nargs="+", default=[1, 10, 100, 1000], help="число напоминаний у события")
+    parser.add_argument("--repeat", type=int, default=500, help="число повторов на сценарий")
+    args = parser.parse_args()
+    
+    load_config()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест обработчиков бота.
+
+Множество смоделированных пользователей одновременно проходят сценарий
+«добавить событие -> список событий -> детали события», пока в отдельном
+потоке другой писатель (как процесс планировщика) периодически удерживает
+блокировку базы данных. Печатаются перцентили задержки обработчиков
+и задержка цикла событий.
+
+Режим --mode sync воспроизводит прежнее поведение: функции database.py
+вызываются прямо в цикле событий.
+
+Запуск:
+    python benchmarks/bench_handlers.py [--users 200] [--mode async|sync]
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from _common import load_config, percentile, report
+from fakes import FakeContext, callback_update, text_update
+
+
+def patch_sync(async_database, database):
+    """Подменяет асинхронные обертки прямыми синхронными вызовами"""
+    def make(func):
+        async def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+        return wrapper
+    
+    for name in dir(async_database):
+        func = getattr(database, name, None)
+        if callable(func) and asyncio.iscoroutinefunction(getattr(async_database, name)) and not name.startswith("run_"):
+            setattr(async_database, name, make(func))
+
+
+def contending_writer(database, stop, hold):
+    """Периодически удерживает блокировку записи, как другой процесс"""
+    while not stop.is_set():
+        with database.transaction(immediate=True) as conn:
+            conn.execute("UPDATE app_state SET value = value WHERE key = 'reminders_version'")
+            time.sleep(hold)
+        time.sleep(hold)
+
+
+async def user_session(user_id, event_handlers, samples, start_at, think_time):
+    context = FakeContext()
+    arrival = start_at
+    
+    # Задержка считается от планового момента прихода обновления, поэтому
+    # в нее входит и время ожидания, пока цикл событий был заблокирован
+    async def timed(name, handler, update):
+        nonlocal arrival
+        await asyncio.sleep(max(0, arrival - time.perf_counter()))
+        await handler(update, context)
+        finished = time.perf_counter()
+        samples.setdefault(name, []).append((finished - arrival) * 1e6)
+        arrival = max(arrival, finished) + think_time
+    
+    await timed("add_event_name", event_handlers.add_event_name, text_update(user_id, f"Событие {user_id}"))
+    await timed("add_event_date", event_handlers.add_event_date, text_update(user_id, "15.07.2031"))
+    await timed("add_event_time", event_handlers.add_event_time, text_update(user_id, "18:00"))
+    await timed("show_events", event_handlers.show_events, callback_update(user_id, "view_events"))
+    event_id = context.user_data["event_id"]
+    await timed("view_event_details", event_handlers.view_event_details, callback_update(user_id, f"view_event_{event_id}"))
+
+
+async def loop_lag_probe(stop, lags):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - started - 0.001) * 1e6)
+
+
+async def run(args):
+    import database
+    import async_database
+    from handlers import event_handlers
+    
+    if args.mode == "sync":
+        patch_sync(async_database, database)
+    
+    database.init_db()
+    stop = threading.Event()
+    writer = threading.Thread(target=contending_writer, args=(database, stop, args.hold / 1000), daemon=True)
+    writer.start()
+    
+    samples = {}
+    lags = []
+    probe_stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(probe_stop, lags))
+    
+    rng = random.Random(1)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        user_session(user_id, event_handlers, samples, started + rng.uniform(0, args.duration), args.think / 1000)
+        for user_id in range(1, args.users + 1)
+    ))
+    elapsed = time.perf_counter() - started
+    
+    probe_stop.set()
+    await probe
+    stop.set()
+    writer.join()
+    
+    print(f"Режим: {args.mode}, пользователей: {args.users}, время: {elapsed:.2f} с")
+    all_samples = []
+    for name, values in samples.items():
+        report(name, values)
+        all_samples.extend(values)
+    report("все обработчики", all_samples)
+    report("задержка цикла событий", lags)
+    print(f"p99 задержки обработчика: {percentile(all_samples, 99) / 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="число одновременных пользователей")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--duration", type=float, default=2, help="за сколько секунд пользователи начинают сценарий")
+    parser.add_argument("--think", type=float, default=50, help="пауза пользователя между шагами в миллисекундах")
+    parser.add_argument("--hold", type=float, default=5, help="сколько миллисекунд конкурирующий писатель держит блокировку")
+    args = parser.parse_args()
+    
+    load_config()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест планировщика напоминаний: check_reminders() против
+заглушки Telegram Bot API (fake_bot_api) в том же процессе.
+
+База данных заполняется синтетическими пользователями с событиями
+и напоминаниями в будущем (datasets.populate), а затем добавляются --due
+напоминаний, срабатывающих равномерно в ближайшие --window секунд.
+Планировщик работает, пока все они не будут доставлены.
+
+Печатаются перцентили длительности итерации планировщика, задержки
+доставки (от времени срабатывания напоминания до получения сообщения
+заглушкой) и число SQL-запросов на итерацию.
+
+Запуск:
+    python benchmarks/bench_scheduler.py --users 10000 --due 2000 --window 10
+    python benchmarks/bench_scheduler.py --users 1000000 --events 3 --due 20000 --window 30
+"""
+
+import argparse
+import asyncio
+import time
+
+from _common import count_queries, load_config, percentile
+
+config = load_config(BOT_TOKEN="123456:bench")
+
+from telegram import Bot
+
+import async_database
+import database
+import logging_setup
+from datasets import populate, populate_due
+from fake_bot_api import FakeBotApi
+from reminder_scheduler import check_reminders
+
+
+async def run(args):
+    # Логи пишутся так же, как в работающем боте (в os.devnull)
+    logging_setup.setup_logging(config.LOG_FILE)
+    queries = count_queries(database)
+    database.init_db()
+
+    started = time.perf_counter()
+    users, events, reminders = populate(args.users, args.events, args.reminders)
+    due = populate_due(args.due, args.window, args.users)
+    print(f"Набор данных: {users} пользователей, {events} событий, {reminders} напоминаний, "
+          f"{len(due)} срабатывают в ближайшие {args.window} с ({time.perf_counter() - started:.1f} с)")
+
+    api = FakeBotApi()
+    await api.start()
+
+    ticks = []
+    tick_queries = []
+    last_count = queries.count
+
+    def on_tick(duration, claimed):
+        nonlocal last_count
+        ticks.append(duration * 1000)
+        tick_queries.append(queries.count - last_count)
+        last_count = queries.count
+
+    # Сообщения напоминаний содержат название события, по которому находится fire_at
+    def delivered():
+        return sum(1 for message in api.messages if message[1] == "sendMessage")
+
+    async with Bot(token="123456:bench", base_url=api.base_url) as bot:
+        scheduler = asyncio.create_task(check_reminders(bot, on_tick=on_tick))
+        deadline = time.time() + args.window + args.timeout
+        while delivered() < len(due) and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        scheduler.cancel()
+        await asyncio.gather(scheduler, return_exceptions=True)
+    await api.stop()
+
+    lags = []
+    for received_at, method, chat_id, text in api.messages:
+        for line in text.splitlines():
+            if line.startswith("Событие: ") and line[len("Событие: "):] in due:
+                lags.append((received_at - due[line[len("Событие: "):]]) * 1000)
+
+    print(f"Доставлено {len(lags)} из {len(due)} напоминаний за {len(ticks)} итераций")
+    print(f"{'':<22} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for title, samples in (
+        ("итерация, мс", ticks),
+        ("задержка доставки, мс", lags),
+        ("SQL-запросов на итерацию", tick_queries),
+    ):
+        print(f"{title:<22} {percentile(samples, 50):>9.1f} {percentile(samples, 95):>9.1f} "
+              f"{percentile(samples, 99):>9.1f} {max(samples, default=0):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000, help="число пользователей в наборе данных")
+    parser.add_argument("--events", type=int, default=5, help="событий у каждого пользователя")
+    parser.add_argument("--reminders", type=int, default=1, help="напоминаний у каждого события")
+    parser.add_argument("--due", type=int, default=2000, help="сколько напоминаний срабатывает во время замера")
+    parser.add_argument("--window", type=float, default=10, help="за сколько секунд срабатывают эти напоминания")
+    parser.add_argument("--timeout", type=float, default=60, help="сколько ждать доставки после окна (секунды)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    async_database.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности получения обновлений: webhook и long polling.
+
+Записанные обновления (текстовые сообщения от нескольких пользователей)
+доставляются боту одним из двух способов:
+
+- polling: бот опрашивает заглушку Bot API (fake_bot_api) через getUpdates;
+- webhook: обновления отправляются POST-запросами на встроенный сервер
+  webhook_server по нескольким постоянным соединениям, как это делает Telegram.
+
+Обработчик имитирует шаг разговора: читает состояние из user_data, обращается
+к базе данных, отвечает пользователю через заглушку Bot API и сохраняет
+новое состояние. Печатаются число обновлений в секунду, задержка от получения
+обновления до конца обработки и число нарушений порядка обновлений одного
+пользователя (с --processor simple оно обычно больше нуля).
+
+Запуск:
+    python benchmarks/bench_webhook.py --mode polling --concurrency 1
+    python benchmarks/bench_webhook.py --mode webhook --concurrency 32
+    python benchmarks/bench_webhook.py --mode webhook --concurrency 32 --processor simple
+    python benchmarks/bench_webhook.py --mode polling --rate 50   # задержка при умеренной нагрузке
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from _common import load_config, percentile
+
+load_config()
+
+from telegram.ext import Application, MessageHandler, SimpleUpdateProcessor, filters
+
+import async_database
+import database
+from fake_bot_api import FakeBotApi
+from update_processor import PerUserUpdateProcessor
+from webhook_server import WebhookServer
+
+SECRET_TOKEN = "bench-secret"
+
+
+# Функция для формирования записанных обновлений: каждый пользователь
+# отправляет steps сообщений «шаг N» сериями по burst сообщений подряд
+# (например, несколько быстрых нажатий), серии пользователей чередуются
+def make_updates(users, steps, burst):
+    updates = []
+    update_id = 1
+    for first_step in range(0, steps, burst):
+        for user_id in range(1, users + 1):
+            for step in range(first_step, min(first_step + burst, steps)):
+                updates.append({
+                    "update_id": update_id,
+                    "message": {
+                        "message_id": update_id,
+                        "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+                        "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+                        "text": f"шаг {step}",
+                    },
+                })
+                update_id += 1
+    return updates
+
+
+# Ожидание момента отправки обновления с номером index при заданной нагрузке
+# (rate обновлений в секунду; 0 - все обновления сразу)
+async def wait_due(started, index, rate):
+    if rate:
+        delay = started + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Stats:
+    def __init__(self, total):
+        self.total = total
+        self.handled = 0
+        self.out_of_order = 0
+        self.finished_at = {}
+        self.done = asyncio.Event()
+
+
+def make_handler(stats, work):
+    async def handle(update, context):
+        step = int(update.message.text.split()[1])
+        expected = context.user_data.get("step", -1) + 1
+        if step != expected:
+            stats.out_of_order += 1
+
+        await async_database.get_user_timezone(update.effective_user.id)
+        if work:
+            await asyncio.sleep(work)
+        await context.bot.send_message(update.effective_chat.id, f"Шаг {step} выполнен")
+        context.user_data["step"] = step
+
+        stats.finished_at[update.update_id] = time.perf_counter()
+        stats.handled += 1
+        if stats.handled == stats.total:
+            stats.done.set()
+    return handle
+
+
+# Отправка обновлений на webhook по connections постоянным соединениям.
+# Как и Telegram, обновления одного пользователя идут по одному соединению
+# по очереди, поэтому их порядок сохраняется. Клиент написан на потоках asyncio,
+# чтобы его накладные расходы не искажали замер.
+async def post_updates(port, path, updates, connections, rate, sent_at):
+    started = time.perf_counter()
+    batches = [[] for _ in range(connections)]
+    for index, update in enumerate(updates):
+        batches[update["message"]["from"]["id"] % connections].append((index, update))
+
+    async def sender(batch):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for index, update in batch:
+                await wait_due(started, index, rate)
+                body = json.dumps(update).encode("utf-8")
+                sent_at[update["update_id"]] = time.perf_counter()
+                writer.write((
+                    f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"X-Telegram-Bot-Api-Secret-Token: {SECRET_TOKEN}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n"
+                ).encode("latin-1") + body)
+                await writer.drain()
+                status = await reader.readline()
+                if b" 200 " not in status:
+                    raise RuntimeError(f"webhook ответил: {status.decode('latin-1').strip()}")
+                while (await reader.readline()).strip():
+                    pass
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(sender(batch) for batch in batches if batch))
+
+
+async def run(args):
+    database.init_db()
+    updates = make_updates(args.users, args.steps, args.burst)
+    stats = Stats(len(updates))
+
+    api = FakeBotApi()
+    await api.start()
+
+    if args.processor == "simple":
+        processor = SimpleUpdateProcessor(args.concurrency)
+    else:
+        processor = PerUserUpdateProcessor(args.concurrency)
+    application = (
+        Application.builder()
+        .token("123456:bench")
+        .base_url(api.base_url)
+        .concurrent_updates(processor)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, make_handler(stats, args.work_ms / 1000)))
+
+    await application.initialize()
+    await application.start()
+
+    started = time.perf_counter()
+    if args.mode == "polling":
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        for index, update in enumerate(updates):
+            await wait_due(started, index, args.rate)
+            api.add_updates([update])
+        await stats.done.wait()
+        received_at = api.delivered_at
+        await application.updater.stop()
+    else:
+        server = WebhookServer(application, port=0, path="/telegram", secret_token=SECRET_TOKEN)
+        await server.start()
+        received_at = {}
+        await post_updates(server.port, "/telegram", updates, args.connections, args.rate, received_at)
+        await stats.done.wait()
+        await server.stop()
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+
+    latencies = [(stats.finished_at[update_id] - received_at[update_id]) * 1000 for update_id in stats.finished_at]
+    print(
+        f"{args.mode:<8} processor={args.processor:<8} concurrency={args.concurrency:<3} "
+        f"updates={len(updates)}: {len(updates) / elapsed:7.0f} upd/s, "
+        f"p50={percentile(latencies, 50):7.1f}ms p95={percentile(latencies, 95):7.1f}ms, "
+        f"нарушений порядка: {stats.out_of_order}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="webhook", help="способ получения обновлений")
+    parser.add_argument("--processor", choices=("per-user", "simple"), default="per-user",
+                        help="per-user - PerUserUpdateProcessor, simple - без очередей пользователей")
+    parser.add_argument("--concurrency", type=int, default=32, help="число обновлений, обрабатываемых одновременно")
+    parser.add_argument("--connections", type=int, default=40, help="число соединений webhook (max_connections)")
+    parser.add_argument("--users", type=int, default=200, help="число пользователей")
+    parser.add_argument("--steps", type=int, default=10, help="число сообщений от каждого пользователя")
+    parser.add_argument("--burst", type=int, default=2, help="сколько сообщений пользователь отправляет подряд")
+    parser.add_argument("--rate", type=float, default=0, help="нагрузка в обновлениях в секунду (0 - все сразу)")
+    parser.add_argument("--work-ms", type=float, default=5, help="имитация ожидания внутри обработчика (мс)")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    async_database.shutdown()
+
+
+if __name__ == "__main__":
+    main()
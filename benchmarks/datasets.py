@@ -0,0 +1,123 @@
+"""
+Синтетические наборы данных для бенчмарков.
+
+populate заполняет базу данных пользователями, событиями и напоминаниями
+напрямую через executemany, минуя обработчики, поэтому даже миллион
+пользователей загружается за несколько минут. Данные детерминированы
+(параметр seed), чтобы замеры разных версий были сравнимы.
+"""
+
+import random
+import time
+
+import database
+from timeutils import DATE_FORMAT, TIME_FORMAT, timestamp_to_local
+
+TIMEZONES = ["Europe/Moscow", "Europe/Kaliningrad", "Asia/Yekaterinburg", "Asia/Novosibirsk", "Asia/Vladivostok"]
+
+# Смещения относительных напоминаний в минутах
+OFFSETS = [15, 60, 1440]
+
+# Сколько пользователей записывается одной транзакцией
+CHUNK_USERS = 10000
+
+
+def _next_id(conn, table):
+    return (conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]) + 1
+
+
+def populate(users, events_per_user=5, reminders_per_event=1, seed=1, first_user_id=1, span_days=90):
+    """Создает пользователей с событиями в ближайшие span_days дней и напоминаниями к ним.
+
+    Половина напоминаний задается датой и временем, половина - смещением
+    от начала события. Все напоминания срабатывают в будущем (не раньше чем
+    через сутки). Возвращает (пользователей, событий, напоминаний).
+    """
+    rng = random.Random(seed)
+    start = int(time.time()) + 2 * 86400
+    total_events = total_reminders = 0
+
+    for chunk_start in range(first_user_id, first_user_id + users, CHUNK_USERS):
+        chunk_end = min(chunk_start + CHUNK_USERS, first_user_id + users)
+        settings, events, reminders = [], [], []
+        with database.transaction() as conn:
+            event_id = _next_id(conn, "events")
+            reminder_id = _next_id(conn, "reminders")
+            for user_id in range(chunk_start, chunk_end):
+                timezone = rng.choice(TIMEZONES)
+                settings.append((user_id, timezone))
+                for number in range(events_per_user):
+                    starts_at = start + rng.randrange(span_days * 1440) * 60
+                    local = timestamp_to_local(starts_at, timezone)
+                    events.append((
+                        event_id, user_id, f"Событие {number + 1}",
+                        local.strftime(DATE_FORMAT), local.strftime(TIME_FORMAT), starts_at,
+                    ))
+                    for index in range(reminders_per_event):
+                        offset = OFFSETS[index % len(OFFSETS)]
+                        fire_at = starts_at - offset * 60
+                        if (reminder_id + index) % 2:
+                            fire_local = timestamp_to_local(fire_at, timezone)
+                            reminders.append((
+                                reminder_id, event_id, fire_local.strftime(DATE_FORMAT),
+                                fire_local.strftime(TIME_FORMAT), fire_at, None,
+                            ))
+                        else:
+                            reminders.append((reminder_id, event_id, None, None, fire_at, offset))
+                        reminder_id += 1
+                    event_id += 1
+
+            conn.executemany("INSERT OR REPLACE INTO user_settings (user_id, timezone) VALUES (?, ?)", settings)
+            conn.executemany(
+                "INSERT INTO events (id, user_id, name, event_date, event_time, starts_at) VALUES (?, ?, ?, ?, ?, ?)",
+                events,
+            )
+            conn.executemany(
+                "INSERT INTO reminders (id, event_id, reminder_date, reminder_time, fire_at, offset_minutes) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                reminders,
+            )
+        total_events += len(events)
+        total_reminders += len(reminders)
+
+    return users, total_events, total_reminders
+
+
+def populate_due(count, window, users, seed=1):
+    """Создает count напоминаний, срабатывающих равномерно в ближайшие window секунд.
+
+    Каждое напоминание относится к отдельному событию с уникальным названием
+    у одного из пользователей 1..users. Возвращает словарь
+    название события -> fire_at, по которому считается задержка доставки.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    due = {}
+    events, reminders = [], []
+    with database.transaction() as conn:
+        event_id = _next_id(conn, "events")
+        reminder_id = _next_id(conn, "reminders")
+        timezones = dict(conn.execute("SELECT user_id, timezone FROM user_settings WHERE user_id <= ?", (users,)))
+        for number in range(count):
+            user_id = rng.randint(1, users)
+            fire_at = int(now + 1 + number * window / count)
+            name = f"due-{number}"
+            local = timestamp_to_local(fire_at + 3600, timezones.get(user_id, "Europe/Moscow"))
+            events.append((
+                event_id, user_id, name, local.strftime(DATE_FORMAT), local.strftime(TIME_FORMAT), fire_at + 3600,
+            ))
+            reminders.append((reminder_id, event_id, None, None, fire_at, 60))
+            due[name] = fire_at
+            event_id += 1
+            reminder_id += 1
+
+        conn.executemany(
+            "INSERT INTO events (id, user_id, name, event_date, event_time, starts_at) VALUES (?, ?, ?, ?, ?, ?)",
+            events,
+        )
+        conn.executemany(
+            "INSERT INTO reminders (id, event_id, reminder_date, reminder_time, fire_at, offset_minutes) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            reminders,
+        )
+    return due
@@ -0,0 +1,143 @@
+"""
+Заглушка Telegram Bot API для бенчмарков.
+
+HTTP-сервер на asyncio отвечает на методы, которые вызывает бот: getMe,
+getUpdates (с ожиданием новых обновлений, как long polling), sendMessage,
+editMessageText и другие. Бот подключается к заглушке через
+Application.builder().base_url(api.base_url). Обновления для getUpdates
+добавляются методом add_updates, а отправленные ботом сообщения
+записываются в messages и last_message (последнее сообщение в чате
+с его клавиатурой), чтобы смоделированный пользователь мог нажать кнопку.
+"""
+
+import asyncio
+import collections
+import itertools
+import json
+import time
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Бенчмарк", "username": "bench_calendar_bot"}
+
+# Максимальное число обновлений в одном ответе getUpdates (как у Telegram)
+MAX_UPDATES_PER_REQUEST = 100
+
+
+class FakeBotApi:
+    """Сервер, отвечающий на запросы к Bot API как Telegram"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.calls = collections.Counter()
+        # Момент, когда обновление было отдано боту через getUpdates (update_id -> perf_counter)
+        self.delivered_at = {}
+        # Отправленные и измененные сообщения: (time.time(), метод, chat_id, текст)
+        self.messages = []
+        # chat_id -> параметры последнего отправленного или измененного сообщения
+        self.last_message = {}
+        self._updates = collections.deque()
+        self._new_updates = None
+        self._message_ids = itertools.count(1)
+        self._server = None
+        self._connections = set()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._new_updates = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def add_updates(self, updates):
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+
+                params = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+                method = path.split("?", 1)[0].rsplit("/", 1)[-1]
+                self.calls[method] += 1
+                result = await self._call(method, params)
+
+                data = json.dumps({"ok": True, "result": result}).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _call(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            self.messages.append((time.time(), method, chat_id, params.get("text", "")))
+            self.last_message[chat_id] = params
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    # Данные кнопок (callback_data) последнего сообщения в чате
+    def buttons(self, chat_id):
+        markup = self.last_message.get(chat_id, {}).get("reply_markup")
+        if not markup:
+            return []
+        rows = json.loads(markup).get("inline_keyboard", [])
+        return [button["callback_data"] for row in rows for button in row if "callback_data" in button]
+
+    async def _get_updates(self, offset, timeout):
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = list(itertools.islice(self._updates, MAX_UPDATES_PER_REQUEST))
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return batch
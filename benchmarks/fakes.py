@@ -0,0 +1,73 @@
+"""
+Заглушки объектов Telegram для вызова обработчиков бота без сети.
+
+Реализуют только те атрибуты и методы Update/CallbackQuery/Message,
+которые используются обработчиками в handlers/.
+"""
+
+import itertools
+
+_message_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id, first_name="Тест"):
+        self.id = user_id
+        self.first_name = first_name
+
+
+class FakeMessage:
+    def __init__(self, text=None, document=None):
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.document = document
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        self.replies.append((text, reply_markup))
+        return FakeMessage(text)
+
+    async def reply_document(self, document, **kwargs):
+        self.replies.append((document, None))
+        return FakeMessage()
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.edits = getattr(self, "edits", [])
+        self.edits.append((text, reply_markup))
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, message=None):
+        self.data = data
+        self.message = message or FakeMessage()
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append((text, reply_markup))
+        return True
+
+
+class FakeUpdate:
+    def __init__(self, user_id, text=None, callback_data=None):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text) if text is not None else None
+        self.callback_query = FakeCallbackQuery(callback_data) if callback_data is not None else None
+
+
+class FakeContext:
+    def __init__(self):
+        self.user_data = {}
+
+
+def text_update(user_id, text):
+    """Обновление с текстовым сообщением пользователя"""
+    return FakeUpdate(user_id, text=text)
+
+
+def callback_update(user_id, data):
+    """Обновление с нажатием inline-кнопки"""
+    return FakeUpdate(user_id, callback_data=data)
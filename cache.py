@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Маркер отсутствия значения в кэше (None может быть допустимым значением)
+MISSING = object()
+
+
+class LRUCache:
+    """Потокобезопасный кэш с вытеснением давно не использованных записей.
+
+    Хранит не больше maxsize записей. Если задан ttl, запись считается
+    устаревшей через ttl секунд после сохранения. Счетчики hits/misses/
+    evictions доступны через stats().
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        """Возвращает значение по ключу или default, если его нет или оно устарело"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Сохраняет значение, вытесняя самую старую запись при переполнении"""
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Удаляет запись из кэша"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Очищает кэш (счетчики сохраняются)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Возвращает размер кэша и счетчики попаданий, промахов и вытеснений"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
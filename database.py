@@ -1,5 +1,13 @@
 import sqlite3
+import datetime
+import itertools
 import logging
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+import pytz
 
 # Импорт конфигурации
 try:
@@ -8,209 +16,1518 @@ except ImportError:
     print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
     exit(1)
 
+from cache import LRUCache, MISSING
+import recurrence
+from timeutils import DATE_FORMAT, TIME_FORMAT, get_timezone, local_to_timestamp, localize, timestamp_to_local, timezone_cache
+
 logger = logging.getLogger(__name__)
 
+# Размер пула соединений и кэша подготовленных выражений по умолчанию
+DEFAULT_POOL_SIZE = 4
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+
+# Настройки SQLite по умолчанию для одновременной работы бота и планировщика
+DEFAULT_JOURNAL_MODE = "WAL"
+DEFAULT_SYNCHRONOUS = "NORMAL"
+DEFAULT_BUSY_TIMEOUT = 5000  # миллисекунды
+DEFAULT_CACHE_SIZE = -16000  # отрицательное значение - размер в КиБ
+DEFAULT_MMAP_SIZE = 64 * 1024 * 1024
+DEFAULT_WAL_AUTOCHECKPOINT = 1000  # страницы
+DEFAULT_CHECKPOINT_INTERVAL = 300  # секунды
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL"}
+_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_CHECKPOINT_MODES = {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}
+
+
+# Функция для получения настроек соединения из config.py
+def _connection_pragmas():
+    synchronous = str(getattr(config, "DB_SYNCHRONOUS", DEFAULT_SYNCHRONOUS)).upper()
+    if synchronous not in _SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Недопустимое значение DB_SYNCHRONOUS: {synchronous}")
+    
+    return [
+        f"PRAGMA busy_timeout = {int(getattr(config, 'DB_BUSY_TIMEOUT', DEFAULT_BUSY_TIMEOUT))}",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA cache_size = {int(getattr(config, 'DB_CACHE_SIZE', DEFAULT_CACHE_SIZE))}",
+        f"PRAGMA mmap_size = {int(getattr(config, 'DB_MMAP_SIZE', DEFAULT_MMAP_SIZE))}",
+        f"PRAGMA wal_autocheckpoint = {int(getattr(config, 'DB_WAL_AUTOCHECKPOINT', DEFAULT_WAL_AUTOCHECKPOINT))}",
+    ]
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с базой данных SQLite.
+
+    Соединения создаются лениво (не больше size штук) и переиспользуются
+    между вызовами, поэтому стоимость открытия файла и разбора схемы
+    оплачивается один раз. Каждое соединение хранит собственный кэш
+    подготовленных выражений (cached_statements), так что повторные
+    запросы с одинаковым текстом SQL не компилируются заново.
+
+    Внутри одного потока соединение «прилипает» к потоку на время
+    использования: вложенные вызовы connection()/transaction() получают
+    то же самое соединение и не занимают второе из пула.
+    """
+
+    def __init__(self, db_name, size=DEFAULT_POOL_SIZE, cached_statements=DEFAULT_STATEMENT_CACHE_SIZE, pragmas=(),
+                 count_statements=False):
+        self.db_name = db_name
+        self.size = size
+        self.cached_statements = cached_statements
+        self.pragmas = list(pragmas)
+        self.count_statements = count_statements
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _create_connection(self):
+        # isolation_level=None отключает неявные BEGIN модуля sqlite3:
+        # границы транзакций задаются явно через transaction()
+        conn = sqlite3.connect(
+            self.db_name,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        if self.count_statements:
+            conn.set_trace_callback(_count_statement)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._create_connection()
+                self._all.append(conn)
+                return conn
+        
+        # Все соединения заняты - ждем, пока какое-нибудь освободится
+        return self._idle.get()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            # Незавершенная транзакция не должна попасть к следующему вызывающему
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение из пула на время блока with"""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._idle = queue.LifoQueue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Число SQL-запросов, выполненных в текущем потоке (считается, только если
+# включены метрики: обратный вызов на каждый запрос стоит около микросекунды)
+_statements = threading.local()
+
+def _count_statement(statement):
+    # Запросы внутри триггеров приходят с префиксом «--» и не считаются отдельно
+    if not statement.startswith("--"):
+        _statements.count = getattr(_statements, "count", 0) + 1
+
+# Функция для получения числа SQL-запросов, выполненных в текущем потоке
+def statement_count():
+    return getattr(_statements, "count", 0)
+
+# Функция для получения общего пула соединений процесса
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    config.DB_NAME,
+                    size=getattr(config, "DB_POOL_SIZE", DEFAULT_POOL_SIZE),
+                    cached_statements=getattr(config, "DB_STATEMENT_CACHE_SIZE", DEFAULT_STATEMENT_CACHE_SIZE),
+                    pragmas=_connection_pragmas(),
+                    count_statements=getattr(config, "METRICS_ENABLED", False),
+                )
+    return _pool
+
+# Функция для закрытия пула соединений (например, при завершении процесса)
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+# Соединение из пула для чтения
+@contextmanager
+def connection():
+    with get_pool().connection() as conn:
+        yield conn
+
+# Транзакция: фиксируется при успешном выходе из блока и откатывается при исключении.
+# Вложенные транзакции в том же потоке присоединяются к внешней.
+# По умолчанию блокировка записи берется сразу (BEGIN IMMEDIATE): транзакция,
+# начавшаяся с чтения, не может получить блокировку записи, пока ее держит
+# другое соединение, и SQLite сразу возвращает "database is locked".
+@contextmanager
+def transaction(immediate=True):
+    with get_pool().connection() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+# Функция для включения режима журнала из DB_JOURNAL_MODE.
+# Режим WAL сохраняется в файле базы данных, поэтому достаточно установить
+# его один раз; в этом режиме читатели не блокируются писателями, а бот
+# и планировщик могут одновременно работать с одним файлом.
+def _configure_journal(conn):
+    journal_mode = str(getattr(config, "DB_JOURNAL_MODE", DEFAULT_JOURNAL_MODE)).upper()
+    if journal_mode not in _JOURNAL_MODES:
+        raise ValueError(f"Недопустимое значение DB_JOURNAL_MODE: {journal_mode}")
+    
+    current = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+    if current.upper() != journal_mode:
+        logger.warning("Не удалось включить режим журнала %s, используется %s", journal_mode, current)
+
+# Функция для принудительного переноса журнала WAL в основной файл базы данных.
+# Автоматические контрольные точки SQLite не срабатывают, пока у журнала есть
+# активные читатели, поэтому при постоянной нагрузке журнал может расти.
+# Возвращает (busy, страниц в журнале, перенесено страниц).
+def checkpoint(mode="PASSIVE"):
+    mode = mode.upper()
+    if mode not in _CHECKPOINT_MODES:
+        raise ValueError(f"Недопустимый режим контрольной точки: {mode}")
+    
+    with connection() as conn:
+        result = tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+    
+    logger.debug("Контрольная точка WAL (%s): %s", mode, result)
+    return result
+
 # Функция для инициализации базы данных
 def init_db():
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+    with connection() as conn:
+        _configure_journal(conn)
     
-    # Создаем таблицу для событий
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS events (
-        id INTEGER PRIMARY KEY,
-        user_id INTEGER NOT NULL,
-        name TEXT NOT NULL,
-        event_date TEXT NOT NULL,
-        event_time TEXT NOT NULL
+    with transaction() as conn:
+        # Создаем таблицу для событий
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            event_date TEXT NOT NULL,
+            event_time TEXT NOT NULL
+        )
+        ''')
+        
+        # Создаем таблицу для напоминаний
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY,
+            event_id INTEGER NOT NULL,
+            reminder_date TEXT NOT NULL,
+            reminder_time TEXT NOT NULL,
+            FOREIGN KEY (event_id) REFERENCES events (id)
+        )
+        ''')
+        
+        # Создаем таблицу для настроек пользователей
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL DEFAULT '{config.DEFAULT_TIMEZONE}'
+        )
+        ''')
+        
+        # Создаем таблицу служебного состояния (счетчики версий и т.п.)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        ''')
+        
+        _apply_migrations(conn)
+    
+    logger.info("База данных инициализирована")
+
+# Миграция 1: абсолютное время событий и напоминаний в секундах Unix (UTC) и индексы.
+# Текстовые поля даты и времени остаются для отображения, а starts_at/fire_at
+# позволяют сортировать события и выбирать наступившие напоминания одним
+# диапазонным запросом по индексу независимо от часового пояса пользователя.
+def _migrate_utc_columns(conn):
+    conn.execute("ALTER TABLE events ADD COLUMN starts_at INTEGER")
+    conn.execute("ALTER TABLE reminders ADD COLUMN fire_at INTEGER")
+    
+    rows = conn.execute("""
+        SELECT e.id, e.event_date, e.event_time, COALESCE(s.timezone, ?)
+        FROM events e
+        LEFT JOIN user_settings s ON s.user_id = e.user_id
+    """, (config.DEFAULT_TIMEZONE,)).fetchall()
+    conn.executemany(
+        "UPDATE events SET starts_at = ? WHERE id = ?",
+        [(_safe_timestamp(date, time, timezone), event_id) for event_id, date, time, timezone in rows]
+    )
+    
+    rows = conn.execute("""
+        SELECT r.id, r.reminder_date, r.reminder_time, COALESCE(s.timezone, ?)
+        FROM reminders r
+        JOIN events e ON e.id = r.event_id
+        LEFT JOIN user_settings s ON s.user_id = e.user_id
+    """, (config.DEFAULT_TIMEZONE,)).fetchall()
+    conn.executemany(
+        "UPDATE reminders SET fire_at = ? WHERE id = ?",
+        [(_safe_timestamp(date, time, timezone), reminder_id) for reminder_id, date, time, timezone in rows]
     )
-    ''')
     
-    # Создаем таблицу для напоминаний
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS reminders (
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user_starts_at ON events (user_id, starts_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders (fire_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_event_id ON reminders (event_id)")
+
+# Миграция 2: поля захвата напоминаний планировщиком.
+# Захват (claimed_by/claimed_at) не дает двум экземплярам планировщика
+# отправить одно и то же напоминание.
+def _migrate_reminder_claims(conn):
+    conn.execute("ALTER TABLE reminders ADD COLUMN claimed_by TEXT")
+    conn.execute("ALTER TABLE reminders ADD COLUMN claimed_at INTEGER")
+
+# Миграция 3: индекс напоминаний события в порядке срабатывания.
+# Заменяет индекс reminders(event_id): напоминания события читаются
+# уже отсортированными, без временного B-дерева.
+def _migrate_reminders_event_fire_at_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_event_fire_at ON reminders (event_id, fire_at)")
+    conn.execute("DROP INDEX IF EXISTS idx_reminders_event_id")
+
+# Миграция 4: секретные токены для подписки на календарь пользователя по HTTP
+def _migrate_feed_tokens(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS feed_tokens (
+        user_id INTEGER PRIMARY KEY,
+        token TEXT NOT NULL UNIQUE
+    )
+    """)
+
+# Миграция 5: повторяющиеся события.
+# Серия хранится одной строкой: rrule - правило повторения, exdates - даты-исключения,
+# ends_at - момент (UTC), позже которого повторений нет (NULL - бесконечная серия).
+# Напоминания серии хранят смещение offset_minutes от начала повторения
+# и после отправки переносятся на следующее повторение.
+def _migrate_recurrence(conn):
+    conn.execute("ALTER TABLE events ADD COLUMN rrule TEXT")
+    conn.execute("ALTER TABLE events ADD COLUMN exdates TEXT")
+    conn.execute("ALTER TABLE events ADD COLUMN ends_at INTEGER")
+    conn.execute("ALTER TABLE reminders ADD COLUMN offset_minutes INTEGER")
+
+# Миграция 6: напоминания, заданные смещением от начала события.
+# Для них хранятся только offset_minutes и fire_at, поэтому таблица пересоздается
+# с необязательными reminder_date и reminder_time (SQLite не умеет снимать NOT NULL).
+# Триггеры вычисляют fire_at из events.starts_at при добавлении такого напоминания
+# и при каждом изменении начала события, в том числе при смене часового пояса.
+# Для серий fire_at вычисляет планировщик по следующему повторению.
+def _migrate_relative_reminders(conn):
+    conn.execute("""
+    CREATE TABLE reminders_new (
         id INTEGER PRIMARY KEY,
         event_id INTEGER NOT NULL,
-        reminder_date TEXT NOT NULL,
-        reminder_time TEXT NOT NULL,
+        reminder_date TEXT,
+        reminder_time TEXT,
+        fire_at INTEGER,
+        claimed_by TEXT,
+        claimed_at INTEGER,
+        offset_minutes INTEGER,
         FOREIGN KEY (event_id) REFERENCES events (id)
     )
-    ''')
+    """)
+    conn.execute("""
+        INSERT INTO reminders_new (id, event_id, reminder_date, reminder_time, fire_at, claimed_by, claimed_at, offset_minutes)
+        SELECT id, event_id, reminder_date, reminder_time, fire_at, claimed_by, claimed_at, offset_minutes FROM reminders
+    """)
+    conn.execute("DROP TABLE reminders")
+    conn.execute("ALTER TABLE reminders_new RENAME TO reminders")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders (fire_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_event_fire_at ON reminders (event_id, fire_at)")
+    
+    # Локальное время напоминаний серий больше не хранится: оно следует из fire_at
+    conn.execute("UPDATE reminders SET reminder_date = NULL, reminder_time = NULL WHERE offset_minutes IS NOT NULL")
     
-    # Создаем таблицу для настроек пользователей
-    cursor.execute(f'''
-    CREATE TABLE IF NOT EXISTS user_settings (
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS reminders_resolve_offset
+    AFTER INSERT ON reminders
+    WHEN NEW.offset_minutes IS NOT NULL AND NEW.fire_at IS NULL
+    BEGIN
+        UPDATE reminders
+        SET fire_at = (SELECT starts_at FROM events WHERE id = NEW.event_id) - NEW.offset_minutes * 60
+        WHERE id = NEW.id;
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS events_starts_at_moves_reminders
+    AFTER UPDATE OF starts_at ON events
+    WHEN NEW.rrule IS NULL
+    BEGIN
+        UPDATE reminders
+        SET fire_at = NEW.starts_at - offset_minutes * 60
+        WHERE event_id = NEW.id AND offset_minutes IS NOT NULL;
+    END
+    """)
+
+# Миграция 7: очередь пересчета расписания после смены часового пояса.
+# Запись добавляется вместе со сменой пояса и удаляется в транзакции пересчета,
+# поэтому прерванный пересчет возобновляется после перезапуска бота.
+def _migrate_timezone_reprojections(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS timezone_reprojections (
+        user_id INTEGER PRIMARY KEY,
+        requested_at INTEGER NOT NULL
+    )
+    """)
+
+# Миграция 8: состояние разговоров и user_data обработчиков бота (см. persistence.py)
+def _migrate_conversation_state(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS conversations (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (name, key)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_data (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """)
+
+# Миграция 9: счетчики версий данных пользователей. Версия увеличивается
+# при каждом изменении событий и напоминаний пользователя и служит ключом
+# кэша списков (см. user_list_cache). Отдельная таблица, а не колонка
+# user_settings: INSERT OR REPLACE настроек не должен сбрасывать версию.
+def _migrate_user_versions(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_versions (
         user_id INTEGER PRIMARY KEY,
-        timezone TEXT NOT NULL DEFAULT '{config.DEFAULT_TIMEZONE}'
+        version INTEGER NOT NULL
+    )
+    """)
+
+# Миграция 10: частичный индекс захваченных напоминаний. По нему планировщик
+# находит напоминания, захват которых истек (упавший экземпляр не отправил их),
+# независимо от своего водяного знака.
+def _migrate_reminder_claims_index(conn):
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reminders_claimed_at ON reminders (claimed_at) "
+        "WHERE claimed_by IS NOT NULL"
     )
-    ''')
+
+# Список миграций схемы. Номер примененной миграции хранится в PRAGMA user_version,
+# поэтому новые миграции нужно только добавлять в конец списка.
+_MIGRATIONS = [
+    _migrate_utc_columns,
+    _migrate_reminder_claims,
+    _migrate_reminders_event_fire_at_index,
+    _migrate_feed_tokens,
+    _migrate_recurrence,
+    _migrate_relative_reminders,
+    _migrate_timezone_reprojections,
+    _migrate_conversation_state,
+    _migrate_user_versions,
+    _migrate_reminder_claims_index,
+]
+
+# Функция для применения недостающих миграций (вызывается внутри транзакции)
+def _apply_migrations(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+        logger.info("Применена миграция базы данных %s: %s", number, migration.__name__)
+
+# Максимальное число параметров в одном запросе (ограничение старых версий SQLite)
+_MAX_SQL_VARIABLES = 999
+
+# Функция для разбиения списка на части не длиннее size
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Функция для перевода локального времени в секунды Unix без исключений
+def _safe_timestamp(date_str, time_str, timezone_str):
+    try:
+        return local_to_timestamp(date_str, time_str, timezone_str)
+    except (ValueError, pytz.UnknownTimeZoneError) as e:
+        logger.warning("Не удалось перевести %s %s (%s) в UTC: %s", date_str, time_str, timezone_str, e)
+        return None
+
+# Функция для перевода локального datetime без часового пояса в секунды Unix
+def _local_datetime_to_timestamp(local, timezone_str):
+    return int(localize(get_timezone(timezone_str), local).timestamp())
+
+# Функция для перевода секунд Unix в локальный datetime без часового пояса
+def _timestamp_to_local_datetime(timestamp, timezone_str):
+    return timestamp_to_local(timestamp, timezone_str).replace(tzinfo=None)
+
+# Функция для разбора серии повторяющегося события.
+# Возвращает (начало серии, правило, даты-исключения) или None для одиночного события.
+def _series(event_date, event_time, rrule, exdates):
+    if not rrule:
+        return None
+    try:
+        return (
+            recurrence.series_start(event_date, event_time),
+            recurrence.parse_rrule(rrule),
+            recurrence.parse_exdates(exdates),
+        )
+    except ValueError as e:
+        logger.warning("Некорректное правило повторения %s: %s", rrule, e)
+        return None
+
+# Функция для вычисления момента окончания серии в UTC (None - бесконечная серия)
+def _series_ends_at(series, timezone_str):
+    if series is None:
+        return None
+    end = recurrence.series_end(series[0], series[1])
+    return _local_datetime_to_timestamp(end, timezone_str) if end is not None else None
+
+# Функция для вычисления ближайшего срабатывания напоминания серии не раньше after_ts.
+# Возвращает локальное время напоминания или None, если повторений больше нет.
+def _next_series_reminder(series, offset_minutes, timezone_str, after_ts):
+    dtstart, rule, exdates = series
+    offset = datetime.timedelta(minutes=offset_minutes)
+    after = _timestamp_to_local_datetime(after_ts, timezone_str) + offset
+    occurrence = recurrence.next_occurrence(dtstart, rule, exdates, after)
+    return occurrence - offset if occurrence is not None else None
+
+# Функция для привязки напоминания с локальным временем reminder_local к серии:
+# смещение отсчитывается от ближайшего повторения не раньше напоминания,
+# а само напоминание переносится на ближайшее срабатывание не раньше now_ts.
+# Возвращает (смещение в минутах, локальное время срабатывания) или None,
+# если после reminder_local повторений нет.
+def _attach_series_reminder(series, reminder_local, timezone_str, now_ts):
+    dtstart, rule, exdates = series
+    occurrence = recurrence.next_occurrence(dtstart, rule, exdates, reminder_local)
+    if occurrence is None:
+        return None
+    offset_minutes = int((occurrence - reminder_local).total_seconds() // 60)
+    local = _next_series_reminder(series, offset_minutes, timezone_str, now_ts)
+    if local is None:
+        return None
+    return offset_minutes, local
+
+# Запрос данных, нужных для переноса напоминаний на следующее повторение серии
+_RESCHEDULE_QUERY = """
+    SELECT r.id, r.offset_minutes, e.event_date, e.event_time, e.rrule, e.exdates,
+           COALESCE(s.timezone, ?), r.fire_at
+    FROM reminders r
+    JOIN events e ON e.id = r.event_id
+    LEFT JOIN user_settings s ON s.user_id = e.user_id
+"""
+
+# Функция для переноса напоминаний на ближайшие повторения серий не раньше now_ts
+# (вызывается внутри транзакции). rows - строки запроса _RESCHEDULE_QUERY;
+# completed - напоминания только что отправлены, и их текущее повторение пропускается.
+# Напоминания одиночных событий и закончившихся серий удаляются.
+# Возвращает (число перенесенных, число удаленных напоминаний).
+def _reschedule_reminders(conn, rows, now_ts, completed=False):
+    updates = []
+    deletes = []
+    for reminder_id, offset_minutes, event_date, event_time, rrule, exdates, timezone, fire_at in rows:
+        series = _series(event_date, event_time, rrule, exdates)
+        local = None
+        if series is not None and offset_minutes is not None:
+            after_ts = now_ts
+            if completed and fire_at is not None:
+                # Повторение, для которого напоминание уже сработало, не выбирается снова
+                after_ts = max(now_ts, fire_at + 1)
+            local = _next_series_reminder(series, offset_minutes, timezone, after_ts)
+        
+        if local is None:
+            deletes.append((reminder_id,))
+        else:
+            updates.append((_local_datetime_to_timestamp(local, timezone), reminder_id))
     
-    conn.commit()
-    conn.close()
-    logger.info("База данных инициализирована")
+    conn.executemany("""
+        UPDATE reminders
+        SET reminder_date = NULL, reminder_time = NULL, fire_at = ?, claimed_by = NULL, claimed_at = NULL
+        WHERE id = ?
+    """, updates)
+    conn.executemany("DELETE FROM reminders WHERE id = ?", deletes)
+    return len(updates), len(deletes)
 
-# Функция для добавления события
-def add_event(user_id, name, event_date, event_time):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+# Функция для получения часового пояса пользователя без создания настроек
+def _timezone_for_user(conn, user_id):
+    timezone = user_timezone_cache.get(user_id)
+    if timezone is not MISSING:
+        return timezone
     
-    cursor.execute(
-        "INSERT INTO events (user_id, name, event_date, event_time) VALUES (?, ?, ?, ?)",
-        (user_id, name, event_date, event_time)
+    result = conn.execute(
+        "SELECT timezone FROM user_settings WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    return result[0] if result else config.DEFAULT_TIMEZONE
+
+# Функция для увеличения счетчика версий напоминаний (вызывается внутри транзакции)
+def _bump_reminders_version(conn):
+    conn.execute(
+        "INSERT INTO app_state (key, value) VALUES ('reminders_version', 1) "
+        "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+    )
+
+# Функция для увеличения счетчика версий данных пользователя (вызывается внутри транзакции)
+def _bump_user_version(conn, user_id):
+    conn.execute(
+        "INSERT INTO user_versions (user_id, version) VALUES (?, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+        (user_id,)
+    )
+
+# Функция для увеличения счетчиков версий пользователей, которых возвращает
+# запрос users_query (столбец user_id), например владельца удаляемого события
+def _bump_user_versions_of(conn, users_query, params):
+    conn.execute(
+        f"INSERT INTO user_versions (user_id, version) SELECT DISTINCT user_id, 1 FROM ({users_query}) WHERE true "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+        params
     )
+
+# Функция для получения версии данных пользователя (0, если данные не менялись)
+def get_user_version(user_id):
+    with connection() as conn:
+        return _user_version(conn, user_id)
+
+# Функция для чтения версии данных пользователя в открытом соединении
+def _user_version(conn, user_id):
+    row = conn.execute("SELECT version FROM user_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+# Кэш списков событий пользователей: (запрос, user_id, параметры) -> (версия, результат).
+# Запись действительна, пока версия данных пользователя не изменилась, поэтому
+# повторная навигация по спискам стоит одного чтения версии по первичному ключу.
+# Изменения из других процессов видны сразу: версия хранится в базе данных.
+# Результаты возвращаются без копирования и не должны изменяться вызывающим кодом.
+user_list_cache = LRUCache(maxsize=getattr(config, "LIST_CACHE_SIZE", 10000))
+
+# Функция для чтения списка пользователя через кэш (вызывается внутри connection()).
+# Версия читается до данных: если запись успеет изменить данные между
+# чтениями, более новый результат сохранится под старой версией, и следующее
+# чтение с новой версией просто прочитает данные снова.
+def _cached_user_read(conn, name, user_id, params, load):
+    version = _user_version(conn, user_id)
+    key = (name, user_id, params)
+    cached = user_list_cache.get(key, None)
+    if cached is not None and cached[0] == version:
+        return cached[1]
     
-    event_id = cursor.lastrowid
+    result = load()
+    user_list_cache.set(key, (version, result))
+    return result
+
+# Подписчики на изменения напоминаний в этом процессе (например, встроенный планировщик)
+_change_listeners = []
+
+# Функция для подписки на изменения напоминаний.
+# callback вызывается без аргументов после фиксации транзакции, возможно из другого потока.
+def add_change_listener(callback):
+    _change_listeners.append(callback)
+
+# Функция для отмены подписки на изменения напоминаний
+def remove_change_listener(callback):
+    if callback in _change_listeners:
+        _change_listeners.remove(callback)
+
+# Функция для уведомления подписчиков об изменении напоминаний
+def _notify_reminders_changed():
+    for callback in list(_change_listeners):
+        try:
+            callback()
+        except Exception as e:
+            logger.error("Ошибка в обработчике изменений напоминаний: %s", e)
+
+# Функция для получения значения служебного параметра
+def get_state(key, default=None):
+    with connection() as conn:
+        result = conn.execute(
+            "SELECT value FROM app_state WHERE key = ?",
+            (key,)
+        ).fetchone()
+    return result[0] if result else default
+
+# Функция для сохранения значения служебного параметра
+def set_state(key, value):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO app_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+# Функция для получения счетчика версий напоминаний.
+# Счетчик меняется при каждом добавлении или удалении напоминаний пользователем,
+# что позволяет планировщику не перечитывать очередь без необходимости.
+def get_reminders_version():
+    return get_state("reminders_version", 0)
+
+# Кэш часовых поясов пользователей. Часовой пояс читается при каждом нажатии
+# «Текущее время» и при добавлении событий, а меняется редко.
+# Изменения из других процессов обнаруживаются по счетчику settings_version,
+# который проверяется не чаще раза в SETTINGS_VERSION_CHECK_INTERVAL секунд.
+user_timezone_cache = LRUCache(
+    maxsize=getattr(config, "USER_CACHE_SIZE", 10000),
+    ttl=getattr(config, "USER_CACHE_TTL", 600),
+)
+_settings_version = None
+_settings_version_checked_at = 0.0
+
+# Функция для сброса кэша настроек, если настройки изменились в другом процессе
+def _sync_settings_cache():
+    global _settings_version, _settings_version_checked_at
+    now = time.monotonic()
+    if now - _settings_version_checked_at < getattr(config, "SETTINGS_VERSION_CHECK_INTERVAL", 1):
+        return
+    
+    version = get_state("settings_version", 0)
+    if version != _settings_version:
+        if _settings_version is not None:
+            user_timezone_cache.clear()
+        _settings_version = version
+    _settings_version_checked_at = now
+
+# Функция для получения статистики кэшей настроек пользователей
+def cache_stats():
+    return {
+        "user_timezone": user_timezone_cache.stats(),
+        "tzinfo": timezone_cache.stats(),
+        "user_lists": user_list_cache.stats(),
+    }
+
+# Функция для получения часового пояса пользователя
+def get_user_timezone(user_id):
+    timezone = find_user_timezone(user_id)
+    if timezone is not None:
+        return timezone
+    
+    # Если пользователя нет в базе, добавляем его с часовым поясом по умолчанию
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO user_settings (user_id, timezone) VALUES (?, ?)",
+            (user_id, config.DEFAULT_TIMEZONE)
+        )
+        timezone = conn.execute(
+            "SELECT timezone FROM user_settings WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()[0]
+    
+    user_timezone_cache.set(user_id, timezone)
+    return timezone
+
+# Функция для получения часового пояса пользователя только чтением
+# (None, если пользователя еще нет в базе)
+def find_user_timezone(user_id):
+    _sync_settings_cache()
+    timezone = user_timezone_cache.get(user_id)
+    if timezone is not MISSING:
+        return timezone
+    
+    with connection() as conn:
+        result = conn.execute(
+            "SELECT timezone FROM user_settings WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+    if result is None:
+        return None
+    
+    user_timezone_cache.set(user_id, result[0])
+    return result[0]
+
+# Функция для установки часового пояса пользователя.
+# Сохраняет настройку и ставит пересчет расписания пользователя в очередь:
+# сам пересчет выполняет reproject_user_schedule (в боте - в фоне, см. async_database).
+def set_user_timezone(user_id, timezone):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO user_settings (user_id, timezone) VALUES (?, ?)",
+            (user_id, timezone)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO timezone_reprojections (user_id, requested_at) VALUES (?, ?)",
+            (user_id, int(time.time()))
+        )
+        conn.execute(
+            "INSERT INTO app_state (key, value) VALUES ('settings_version', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
     
-    conn.commit()
-    conn.close()
+    user_timezone_cache.invalidate(user_id)
+    logger.info("Часовой пояс пользователя %s изменен на %s", user_id, timezone, extra={"user_id": user_id})
+
+# Функция для получения пользователей, ожидающих пересчета расписания
+def get_pending_reprojections():
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT user_id FROM timezone_reprojections ORDER BY requested_at")]
+
+# Функция для пересчета абсолютного времени событий и ожидающих напоминаний
+# пользователя в его текущем часовом поясе одной транзакцией. Локальное время
+# событий и напоминаний не меняется. Пересчет идемпотентен: все значения
+# вычисляются из локального времени и текущего пояса, поэтому записи, добавленные
+# уже в новом поясе, не сдвигаются. Возвращает число пересчитанных напоминаний
+# или None, если пересчет не требуется.
+def reproject_user_schedule(user_id):
+    now_ts = int(time.time())
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM timezone_reprojections WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return None
+        timezone = _timezone_for_user(conn, user_id)
+        
+        # Напоминания со смещением от начала одиночного события переносит триггер на events.starts_at
+        events = conn.execute(
+            "SELECT id, event_date, event_time, rrule, exdates FROM events WHERE user_id = ?",
+            (user_id,)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE events SET starts_at = ?, ends_at = ? WHERE id = ?",
+            [
+                (_safe_timestamp(date, time, timezone),
+                 _series_ends_at(_series(date, time, rrule, exdates), timezone),
+                 event_id)
+                for event_id, date, time, rrule, exdates in events
+            ]
+        )
+        
+        reminders = conn.execute("""
+            SELECT r.id, r.reminder_date, r.reminder_time
+            FROM reminders r
+            JOIN events e ON e.id = r.event_id
+            WHERE e.user_id = ? AND r.offset_minutes IS NULL
+        """, (user_id,)).fetchall()
+        conn.executemany(
+            "UPDATE reminders SET fire_at = ? WHERE id = ?",
+            [(_safe_timestamp(date, time, timezone), reminder_id) for reminder_id, date, time in reminders]
+        )
+        
+        # Напоминания серий переносятся на ближайшее повторение в новом поясе.
+        # Просроченные и отправляемые сейчас напоминания не трогаются: после
+        # отправки complete_reminders перенесет их уже в новом поясе.
+        series_reminders = conn.execute(_RESCHEDULE_QUERY + """
+            WHERE e.user_id = ? AND e.rrule IS NOT NULL AND r.offset_minutes IS NOT NULL
+              AND r.fire_at > ? AND r.claimed_by IS NULL
+        """, (config.DEFAULT_TIMEZONE, user_id, now_ts)).fetchall()
+        updated, _ = _reschedule_reminders(conn, series_reminders, now_ts)
+        
+        conn.execute("DELETE FROM timezone_reprojections WHERE user_id = ?", (user_id,))
+        _bump_reminders_version(conn)
+        _bump_user_version(conn, user_id)
     
-    logger.info(f"Добавлено событие: {name} для пользователя {user_id}")
+    _notify_reminders_changed()
+    logger.info("Расписание пользователя %s пересчитано в часовом поясе %s", user_id, timezone)
+    return len(reminders) + updated
+
+# Функция для добавления события
+def add_event(user_id, name, event_date, event_time):
+    with transaction() as conn:
+        starts_at = _safe_timestamp(event_date, event_time, _timezone_for_user(conn, user_id))
+        cursor = conn.execute(
+            "INSERT INTO events (user_id, name, event_date, event_time, starts_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, name, event_date, event_time, starts_at)
+        )
+        event_id = cursor.lastrowid
+        _bump_user_version(conn, user_id)
+    
+    logger.info("Добавлено событие: %s для пользователя %s", name, user_id,
+                extra={"user_id": user_id, "sampled": True})
     return event_id
 
-# Функция для добавления напоминания
-def add_reminder(event_id, reminder_date, reminder_time):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+# Функция для массового импорта событий с напоминаниями.
+# events - итерируемый объект с элементами (name, event_date, event_time, [(reminder_date, reminder_time), ...])
+# или importers.ImportedEvent с правилом повторения, который читается частями по chunk_size событий: каждая часть вставляется
+# функцией insert_events в отдельной транзакции, поэтому объем памяти ограничен
+# размером части. После каждой части вызывается on_progress(событий, напоминаний).
+# Возвращает (число событий, число напоминаний).
+def import_events(user_id, events, chunk_size=500, on_progress=None):
+    total_events = total_reminders = 0
+    iterator = iter(events)
     
-    cursor.execute(
-        "INSERT INTO reminders (event_id, reminder_date, reminder_time) VALUES (?, ?, ?)",
-        (event_id, reminder_date, reminder_time)
-    )
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        total_reminders += insert_events(user_id, chunk)
+        total_events += len(chunk)
+        if on_progress is not None:
+            on_progress(total_events, total_reminders)
+    
+    return total_events, total_reminders
+
+# Функция для вставки списка событий с напоминаниями одной транзакцией через executemany.
+# Возвращает число добавленных напоминаний.
+def insert_events(user_id, events):
+    timezone = get_user_timezone(user_id)
     
-    reminder_id = cursor.lastrowid
+    with transaction() as conn:
+        # Транзакция начата с блокировкой записи, поэтому идентификаторы
+        # можно назначить заранее и сразу связать с ними напоминания
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events").fetchone()[0]
+        
+        # Одинаковые дата и время в импортируемых файлах повторяются часто,
+        # а перевод в UTC через pytz - самая дорогая часть вставки
+        timestamps = {}
+        def timestamp(date_str, time_str):
+            key = (date_str, time_str)
+            if key not in timestamps:
+                timestamps[key] = _safe_timestamp(date_str, time_str, timezone)
+            return timestamps[key]
+        
+        now_ts = time.time()
+        event_rows = []
+        reminder_rows = []
+        for event_id, event in enumerate(events, next_id):
+            name, event_date, event_time, reminders = event[:4]
+            rrule, exdates = (event[4], event[5]) if len(event) > 4 else (None, None)
+            series = _series(event_date, event_time, rrule, exdates)
+            event_rows.append((event_id, user_id, name, event_date, event_time,
+                               timestamp(event_date, event_time),
+                               rrule if series else None, exdates if series else None,
+                               _series_ends_at(series, timezone)))
+            
+            for reminder_date, reminder_time in reminders:
+                if series is not None:
+                    # Напоминания серии переносятся на ближайшее повторение
+                    attached = _attach_series_reminder(
+                        series, recurrence.series_start(reminder_date, reminder_time), timezone, now_ts
+                    )
+                    if attached is not None:
+                        offset_minutes, local = attached
+                        reminder_rows.append((event_id, None, None,
+                                              _local_datetime_to_timestamp(local, timezone), offset_minutes))
+                        continue
+                reminder_rows.append((event_id, reminder_date, reminder_time,
+                                      timestamp(reminder_date, reminder_time), None))
+        
+        conn.executemany("""
+            INSERT INTO events (id, user_id, name, event_date, event_time, starts_at, rrule, exdates, ends_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, event_rows)
+        if reminder_rows:
+            conn.executemany(
+                "INSERT INTO reminders (event_id, reminder_date, reminder_time, fire_at, offset_minutes) VALUES (?, ?, ?, ?, ?)",
+                reminder_rows
+            )
+            _bump_reminders_version(conn)
+        _bump_user_version(conn, user_id)
     
-    conn.commit()
-    conn.close()
+    if reminder_rows:
+        _notify_reminders_changed()
     
-    logger.info(f"Добавлено напоминание для события {event_id}")
+    logger.info("Импортировано %s событий и %s напоминаний для пользователя %s", len(event_rows), len(reminder_rows), user_id,
+                extra={"user_id": user_id})
+    return len(reminder_rows)
+
+# Функция для добавления напоминания
+# Для повторяющегося события напоминание привязывается к ближайшему повторению
+# не раньше указанного времени и затем срабатывает перед каждым повторением.
+def add_reminder(event_id, reminder_date, reminder_time):
+    with transaction() as conn:
+        event = conn.execute(
+            "SELECT user_id, event_date, event_time, rrule, exdates FROM events WHERE id = ?",
+            (event_id,)
+        ).fetchone()
+        timezone = _timezone_for_user(conn, event[0]) if event else config.DEFAULT_TIMEZONE
+        
+        offset_minutes = None
+        fire_at = _safe_timestamp(reminder_date, reminder_time, timezone)
+        series = _series(*event[1:]) if event else None
+        if series is not None:
+            attached = _attach_series_reminder(
+                series, recurrence.series_start(reminder_date, reminder_time), timezone, time.time()
+            )
+            if attached is not None:
+                offset_minutes, local = attached
+                reminder_date = reminder_time = None
+                fire_at = _local_datetime_to_timestamp(local, timezone)
+        
+        cursor = conn.execute(
+            "INSERT INTO reminders (event_id, reminder_date, reminder_time, fire_at, offset_minutes) VALUES (?, ?, ?, ?, ?)",
+            (event_id, reminder_date, reminder_time, fire_at, offset_minutes)
+        )
+        reminder_id = cursor.lastrowid
+        _bump_reminders_version(conn)
+        if event is not None:
+            _bump_user_version(conn, event[0])
+    
+    _notify_reminders_changed()
+    logger.info("Добавлено напоминание для события %s", event_id)
     return reminder_id
 
-# Функция для получения событий пользователя
-def get_user_events(user_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+# Функция для добавления напоминания за offset_minutes минут до начала события
+# (отрицательное смещение - после начала). Хранится только смещение: время
+# срабатывания одиночного события вычисляет триггер, а для серии - ближайшее
+# повторение. Возвращает идентификатор напоминания или None, если событие
+# не найдено или у серии больше нет повторений.
+def add_relative_reminder(event_id, offset_minutes):
+    with transaction() as conn:
+        event = conn.execute(
+            "SELECT user_id, event_date, event_time, rrule, exdates FROM events WHERE id = ?",
+            (event_id,)
+        ).fetchone()
+        if event is None:
+            return None
+        
+        fire_at = None
+        series = _series(*event[1:])
+        if series is not None:
+            timezone = _timezone_for_user(conn, event[0])
+            local = _next_series_reminder(series, offset_minutes, timezone, time.time())
+            if local is None:
+                return None
+            fire_at = _local_datetime_to_timestamp(local, timezone)
+        
+        cursor = conn.execute(
+            "INSERT INTO reminders (event_id, fire_at, offset_minutes) VALUES (?, ?, ?)",
+            (event_id, fire_at, offset_minutes)
+        )
+        reminder_id = cursor.lastrowid
+        _bump_reminders_version(conn)
+        _bump_user_version(conn, event[0])
     
-    cursor.execute(
-        "SELECT id, name, event_date, event_time FROM events WHERE user_id = ? ORDER BY event_date, event_time",
-        (user_id,)
-    )
+    _notify_reminders_changed()
+    logger.info("Добавлено напоминание за %s мин. до события %s", offset_minutes, event_id)
+    return reminder_id
+
+# Функция для установки правила повторения события (rrule=None - сделать событие одиночным).
+# Существующие напоминания привязываются к повторениям и переносятся на ближайшее.
+# Если повторение отменяется, событие переносится на ближайшее будущее повторение.
+# Возвращает False, если событие не найдено; при некорректном правиле выбрасывает ValueError.
+def set_event_recurrence(event_id, user_id, rrule):
+    if rrule is not None:
+        rrule = recurrence.format_rrule(recurrence.parse_rrule(rrule))
+    
+    with transaction() as conn:
+        event = conn.execute(
+            "SELECT event_date, event_time, rrule, exdates FROM events WHERE id = ? AND user_id = ?",
+            (event_id, user_id)
+        ).fetchone()
+        if event is None:
+            return False
+        
+        timezone = _timezone_for_user(conn, user_id)
+        now_ts = time.time()
+        event_date, event_time, old_rrule, exdates = event
+        
+        if rrule is None:
+            old_series = _series(event_date, event_time, old_rrule, exdates)
+            if old_series is not None:
+                after = _timestamp_to_local_datetime(now_ts, timezone)
+                occurrence = recurrence.next_occurrence(*old_series, after=after)
+                if occurrence is not None:
+                    event_date, event_time = occurrence.strftime(DATE_FORMAT), occurrence.strftime(TIME_FORMAT)
+            
+            # Напоминания серии остаются на том же расстоянии от события:
+            # их время пересчитывает триггер на events.starts_at
+            conn.execute("""
+                UPDATE events SET event_date = ?, event_time = ?, starts_at = ?,
+                                  rrule = NULL, exdates = NULL, ends_at = NULL
+                WHERE id = ?
+            """, (event_date, event_time, _safe_timestamp(event_date, event_time, timezone), event_id))
+        else:
+            series = _series(event_date, event_time, rrule, exdates)
+            conn.execute(
+                "UPDATE events SET rrule = ?, ends_at = ? WHERE id = ?",
+                (rrule, _series_ends_at(series, timezone), event_id)
+            )
+            
+            # Напоминания без смещения получают его от ближайшего повторения
+            reminders = conn.execute(
+                "SELECT id, reminder_date, reminder_time, offset_minutes FROM reminders WHERE event_id = ?",
+                (event_id,)
+            ).fetchall()
+            offsets = []
+            for reminder_id, reminder_date, reminder_time, offset_minutes in reminders:
+                if offset_minutes is not None:
+                    continue
+                reminder_local = recurrence.series_start(reminder_date, reminder_time)
+                occurrence = recurrence.next_occurrence(*series, after=reminder_local)
+                if occurrence is not None:
+                    offsets.append((int((occurrence - reminder_local).total_seconds() // 60), reminder_id))
+            conn.executemany("UPDATE reminders SET offset_minutes = ? WHERE id = ?", offsets)
+            
+            rows = conn.execute(
+                f"{_RESCHEDULE_QUERY} WHERE r.event_id = ? AND r.offset_minutes IS NOT NULL",
+                (config.DEFAULT_TIMEZONE, event_id)
+            ).fetchall()
+            _reschedule_reminders(conn, rows, now_ts)
+        
+        _bump_reminders_version(conn)
+        _bump_user_version(conn, user_id)
     
-    events = cursor.fetchall()
-    conn.close()
+    _notify_reminders_changed()
+    logger.info("Для события %s установлено правило повторения: %s", event_id, rrule)
+    return True
+
+# Функция для пропуска ближайшего повторения серии (добавляется в даты-исключения).
+# Напоминания, относившиеся к пропущенному повторению, переносятся на следующее.
+# Возвращает дату пропущенного повторения или None.
+def skip_next_occurrence(event_id, user_id):
+    with transaction() as conn:
+        event = conn.execute(
+            "SELECT event_date, event_time, rrule, exdates FROM events WHERE id = ? AND user_id = ?",
+            (event_id, user_id)
+        ).fetchone()
+        series = _series(*event) if event else None
+        if series is None:
+            return None
+        
+        timezone = _timezone_for_user(conn, user_id)
+        now_ts = time.time()
+        occurrence = recurrence.next_occurrence(*series, after=_timestamp_to_local_datetime(now_ts, timezone))
+        if occurrence is None:
+            return None
+        
+        skipped = occurrence.strftime(DATE_FORMAT)
+        exdates = series[2] | {skipped}
+        conn.execute(
+            "UPDATE events SET exdates = ? WHERE id = ?",
+            (recurrence.format_exdates(exdates), event_id)
+        )
+        
+        rows = conn.execute(
+            f"{_RESCHEDULE_QUERY} WHERE r.event_id = ? AND r.offset_minutes IS NOT NULL",
+            (config.DEFAULT_TIMEZONE, event_id)
+        ).fetchall()
+        _reschedule_reminders(conn, rows, now_ts)
+        _bump_reminders_version(conn)
+        _bump_user_version(conn, user_id)
     
-    return events
+    _notify_reminders_changed()
+    logger.info("Пропущено повторение %s события %s", skipped, event_id)
+    return skipped
+
+# Функция для получения событий пользователя (через кэш списков)
+def get_user_events(user_id):
+    with connection() as conn:
+        return _cached_user_read(conn, "events", user_id, (), lambda: conn.execute(
+            "SELECT id, name, event_date, event_time FROM events WHERE user_id = ? ORDER BY starts_at, id",
+            (user_id,)
+        ).fetchall())
 
-# Функция для получения событий пользователя с напоминаниями
+# Функция для получения событий пользователя с напоминаниями (через кэш списков)
 def get_user_events_with_reminders(user_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+    with connection() as conn:
+        return _cached_user_read(conn, "events_with_reminders", user_id, (), lambda: conn.execute("""
+            SELECT DISTINCT e.id, e.name, e.event_date, e.event_time 
+            FROM events e
+            JOIN reminders r ON e.id = r.event_id
+            WHERE e.user_id = ?
+            ORDER BY e.starts_at, e.id
+        """, (user_id,)).fetchall())
+
+# Функция для постраничного получения событий пользователя.
+# Использует пагинацию по ключу (starts_at, id): каждая страница читается
+# из индекса events(user_id, starts_at) за O(limit) независимо от ее номера.
+#   after - курсор (starts_at, id), после которого начинается страница;
+#   backward - читать страницу перед курсором (для кнопки «Назад»);
+#   since - не показывать события, начавшиеся раньше этого момента (None - показывать все);
+#     серии показываются, пока у них есть повторения, с датой ближайшего из них;
+#   with_reminders - только события, у которых есть напоминания.
+# Возвращает (события в хронологическом порядке, есть ли еще события в направлении чтения).
+# Событие - (id, name, event_date, event_time, starts_at, rrule); курсор - (starts_at, id).
+# Страницы кэшируются по версии данных пользователя, поэтому since стоит
+# округлять (обработчики округляют до минуты), иначе каждое чтение - промах.
+def get_user_events_page(user_id, after=None, backward=False, limit=10, since=None, with_reminders=False):
+    params = (after, backward, limit, since, with_reminders)
+    with connection() as conn:
+        return _cached_user_read(
+            conn, "events_page", user_id, params,
+            lambda: _read_user_events_page(conn, user_id, *params)
+        )
+
+def _read_user_events_page(conn, user_id, after, backward, limit, since, with_reminders):
+    conditions = ["e.user_id = ?", "e.starts_at IS NOT NULL"]
+    params = [user_id]
+    
+    if since is not None:
+        conditions.append("(e.starts_at >= ? OR (e.rrule IS NOT NULL AND (e.ends_at IS NULL OR e.ends_at >= ?)))")
+        params.extend((since, since))
+    
+    if after is not None:
+        conditions.append("(e.starts_at, e.id) < (?, ?)" if backward else "(e.starts_at, e.id) > (?, ?)")
+        params.extend(after)
+    
+    if with_reminders:
+        conditions.append("EXISTS (SELECT 1 FROM reminders r WHERE r.event_id = e.id)")
     
-    cursor.execute("""
-        SELECT DISTINCT e.id, e.name, e.event_date, e.event_time 
+    order = "DESC" if backward else "ASC"
+    params.append(limit + 1)
+    
+    rows = conn.execute(f"""
+        SELECT e.id, e.name, e.event_date, e.event_time, e.starts_at, e.rrule, e.exdates
         FROM events e
-        JOIN reminders r ON e.id = r.event_id
-        WHERE e.user_id = ?
-        ORDER BY e.event_date, e.event_time
-    """, (user_id,))
+        WHERE {" AND ".join(conditions)}
+        ORDER BY e.starts_at {order}, e.id {order}
+        LIMIT ?
+    """, params).fetchall()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
     
-    events = cursor.fetchall()
-    conn.close()
+    if since is not None and any(row[5] for row in rows):
+        # Повторения вычисляются только для серий на этой странице
+        after = _timestamp_to_local_datetime(since, _timezone_for_user(conn, user_id))
+        rows = [_with_next_occurrence(row, after) for row in rows]
     
-    return events
+    return [row[:6] for row in rows], has_more
+
+# Функция для замены даты и времени серии датой и временем ближайшего повторения не раньше after
+def _with_next_occurrence(row, after):
+    event_id, name, event_date, event_time, starts_at, rrule, exdates = row
+    series = _series(event_date, event_time, rrule, exdates)
+    occurrence = recurrence.next_occurrence(*series, after=after) if series else None
+    if occurrence is not None:
+        event_date, event_time = occurrence.strftime(DATE_FORMAT), occurrence.strftime(TIME_FORMAT)
+    return event_id, name, event_date, event_time, starts_at, rrule, exdates
+
+# Функция для потокового чтения событий пользователя с напоминаниями (для экспорта).
+# Строки читаются с курсора частями по batch_size, поэтому память не растет
+# с размером календаря; соединение занято, пока генератор не исчерпан.
+# Выдает (id, name, event_date, event_time, starts_at, rrule, exdates,
+# [(reminder_date, reminder_time, fire_at, offset_minutes), ...]) в порядке начала событий.
+def iter_user_events_for_export(user_id, batch_size=500):
+    with connection() as conn:
+        cursor = conn.execute("""
+            SELECT e.id, e.name, e.event_date, e.event_time, e.starts_at, e.rrule, e.exdates,
+                   r.id, r.reminder_date, r.reminder_time, r.fire_at, r.offset_minutes
+            FROM events e
+            LEFT JOIN reminders r ON r.event_id = e.id
+            WHERE e.user_id = ?
+            ORDER BY e.starts_at, e.id, r.fire_at, r.id
+        """, (user_id,))
+        
+        event = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for event_id, name, event_date, event_time, starts_at, rrule, exdates, reminder_id, *reminder in rows:
+                if event is None or event[0] != event_id:
+                    if event is not None:
+                        yield event
+                    event = (event_id, name, event_date, event_time, starts_at, rrule, exdates, [])
+                if reminder_id is not None:
+                    event[7].append(tuple(reminder))
+        
+        if event is not None:
+            yield event
+
+# Функция для получения токена подписки на календарь пользователя (создается при первом запросе)
+def get_feed_token(user_id):
+    with connection() as conn:
+        row = conn.execute("SELECT token FROM feed_tokens WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            return row[0]
+        
+        with transaction():
+            conn.execute(
+                "INSERT OR IGNORE INTO feed_tokens (user_id, token) VALUES (?, ?)",
+                (user_id, secrets.token_urlsafe(24))
+            )
+            return conn.execute("SELECT token FROM feed_tokens WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+# Функция для получения пользователя по токену подписки
+def get_feed_user(token):
+    with connection() as conn:
+        row = conn.execute("SELECT user_id FROM feed_tokens WHERE token = ?", (token,)).fetchone()
+        return row[0] if row else None
 
 # Функция для получения информации о событии
 def get_event(event_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+    with connection() as conn:
+        return conn.execute(
+            "SELECT name, event_date, event_time FROM events WHERE id = ?",
+            (event_id,)
+        ).fetchone()
+
+# Функция для получения события вместе со всеми его напоминаниями за одно обращение
+# к базе данных. Событие возвращается, только если оно принадлежит пользователю user_id.
+# Напоминания читаются тем же соединением в порядке индекса reminders(event_id, fire_at):
+# это быстрее одного JOIN, который повторял бы поля события в каждой строке.
+# Возвращает ((name, event_date, event_time, rrule, exdates),
+# [(id, reminder_date, reminder_time, offset_minutes), ...]) или None.
+# У напоминаний, заданных смещением, дата и время - None.
+# Результат кэшируется по версии данных пользователя.
+def get_event_details(event_id, user_id):
+    with connection() as conn:
+        return _cached_user_read(
+            conn, "event_details", user_id, (event_id,),
+            lambda: _read_event_details(conn, event_id, user_id)
+        )
+
+def _read_event_details(conn, event_id, user_id):
+    event = conn.execute(
+        "SELECT name, event_date, event_time, rrule, exdates FROM events WHERE id = ? AND user_id = ?",
+        (event_id, user_id)
+    ).fetchone()
     
-    cursor.execute(
-        "SELECT name, event_date, event_time FROM events WHERE id = ?",
-        (event_id,)
-    )
+    if event is None:
+        return None
     
-    event = cursor.fetchone()
-    conn.close()
+    reminders = conn.execute(
+        "SELECT id, reminder_date, reminder_time, offset_minutes FROM reminders WHERE event_id = ? ORDER BY fire_at, id",
+        (event_id,)
+    ).fetchall()
     
-    return event
+    return event, reminders
+
+# Функция для получения события и количества его напоминаний одним запросом.
+# Возвращает (name, event_date, event_time, reminder_count) или None,
+# если события нет или оно принадлежит другому пользователю.
+def get_event_with_reminder_count(event_id, user_id):
+    with connection() as conn:
+        return conn.execute("""
+            SELECT e.name, e.event_date, e.event_time,
+                   (SELECT COUNT(*) FROM reminders r WHERE r.event_id = e.id)
+            FROM events e
+            WHERE e.id = ? AND e.user_id = ?
+        """, (event_id, user_id)).fetchone()
 
 # Функция для получения напоминаний для события
 def get_event_reminders(event_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT id, reminder_date, reminder_time FROM reminders WHERE event_id = ? ORDER BY reminder_date, reminder_time",
-        (event_id,)
-    )
-    
-    reminders = cursor.fetchall()
-    conn.close()
-    
-    return reminders
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, reminder_date, reminder_time, offset_minutes FROM reminders WHERE event_id = ? ORDER BY fire_at, id",
+            (event_id,)
+        ).fetchall()
 
 # Функция для получения информации о напоминании
 def get_reminder(reminder_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT reminder_date, reminder_time FROM reminders WHERE id = ?",
-        (reminder_id,)
-    )
-    
-    reminder = cursor.fetchone()
-    conn.close()
-    
-    return reminder
+    with connection() as conn:
+        return conn.execute(
+            "SELECT reminder_date, reminder_time, offset_minutes FROM reminders WHERE id = ?",
+            (reminder_id,)
+        ).fetchone()
 
 # Функция для удаления события и всех связанных напоминаний
 def delete_event(event_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
-    
-    # Сначала удаляем напоминания
-    cursor.execute(
-        "DELETE FROM reminders WHERE event_id = ?",
-        (event_id,)
-    )
-    
-    # Затем удаляем событие
-    cursor.execute(
-        "DELETE FROM events WHERE id = ?",
-        (event_id,)
-    )
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _bump_user_versions_of(conn, "SELECT user_id FROM events WHERE id = ?", (event_id,))
+        
+        # Сначала удаляем напоминания
+        conn.execute(
+            "DELETE FROM reminders WHERE event_id = ?",
+            (event_id,)
+        )
+        
+        # Затем удаляем событие
+        conn.execute(
+            "DELETE FROM events WHERE id = ?",
+            (event_id,)
+        )
+        _bump_reminders_version(conn)
     
-    logger.info(f"Удалено событие {event_id} и все связанные напоминания")
+    _notify_reminders_changed()
+    logger.info("Удалено событие %s и все связанные напоминания", event_id)
 
 # Функция для удаления напоминания
 def delete_reminder(reminder_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+    with transaction() as conn:
+        _bump_user_versions_of(
+            conn,
+            "SELECT e.user_id FROM reminders r JOIN events e ON e.id = r.event_id WHERE r.id = ?",
+            (reminder_id,)
+        )
+        conn.execute(
+            "DELETE FROM reminders WHERE id = ?",
+            (reminder_id,)
+        )
+        _bump_reminders_version(conn)
     
-    cursor.execute(
-        "DELETE FROM reminders WHERE id = ?",
-        (reminder_id,)
-    )
+    _notify_reminders_changed()
+    logger.info("Удалено напоминание %s", reminder_id)
+
+# Функция для атомарного захвата напоминаний планировщиком.
+# Одной транзакцией помечает свободные (или захваченные раньше lease_before)
+# напоминания из reminder_ids как захваченные owner и возвращает
+# идентификаторы, которые удалось захватить. Удаленные пользователем
+# и захваченные другим экземпляром напоминания в результат не попадают.
+def claim_reminders(reminder_ids, owner, now_ts, lease_before):
+    if not reminder_ids:
+        return []
     
-    conn.commit()
-    conn.close()
+    claimed = []
+    with transaction() as conn:
+        for chunk in _chunks(list(reminder_ids), _MAX_SQL_VARIABLES - 3):
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"""
+                UPDATE reminders SET claimed_by = ?, claimed_at = ?
+                WHERE id IN ({placeholders})
+                  AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)
+            """, (owner, now_ts, *chunk, owner, lease_before))
+            claimed.extend(row[0] for row in conn.execute(
+                f"SELECT id FROM reminders WHERE id IN ({placeholders}) AND claimed_by = ?",
+                (*chunk, owner)
+            ))
     
-    logger.info(f"Удалено напоминание {reminder_id}")
+    return claimed
 
-# Функция для получения количества напоминаний для события
-def get_reminder_count(event_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+# Функция для завершения отправленных напоминаний одной транзакцией.
+# Напоминания одиночных событий удаляются, а напоминания серий переносятся
+# на следующее повторение (вычисляется только оно). Удаление не меняет
+# счетчик версий: планировщик уже извлек эти напоминания из своей очереди;
+# при переносе счетчик увеличивается, чтобы очередь загрузила новое время.
+def complete_reminders(reminder_ids):
+    if not reminder_ids:
+        return
     
-    cursor.execute(
-        "SELECT COUNT(*) FROM reminders WHERE event_id = ?",
-        (event_id,)
-    )
+    with transaction() as conn:
+        rows = []
+        for chunk in _chunks(list(reminder_ids), _MAX_SQL_VARIABLES - 1):
+            placeholders = ", ".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"{_RESCHEDULE_QUERY} WHERE r.id IN ({placeholders})",
+                (config.DEFAULT_TIMEZONE, *chunk)
+            ))
+            # Отправленные напоминания удаляются или переносятся: списки их владельцев меняются
+            _bump_user_versions_of(
+                conn,
+                f"SELECT e.user_id FROM reminders r JOIN events e ON e.id = r.event_id WHERE r.id IN ({placeholders})",
+                chunk
+            )
+        rescheduled, _ = _reschedule_reminders(conn, rows, time.time(), completed=True)
+        if rescheduled:
+            _bump_reminders_version(conn)
+    
+    if rescheduled:
+        _notify_reminders_changed()
+
+_REMINDERS_SELECT = """
+    SELECT r.fire_at, r.id, e.user_id, e.name, e.event_date, e.event_time,
+           e.rrule, r.offset_minutes, COALESCE(s.timezone, ?)
+    FROM reminders r
+    JOIN events e ON r.event_id = e.id
+    LEFT JOIN user_settings s ON s.user_id = e.user_id
+"""
+
+# Функция для получения напоминаний, срабатывающих в интервале [from_ts, until_ts],
+# вместе с данными события. Использует индекс по fire_at и не зависит
+# от часовых поясов пользователей.
+# Если передан lease_before, добавляются и более ранние напоминания, захват
+# которых истек (захвачены до lease_before и так и не отправлены).
+# Для напоминаний серии вместо начала серии возвращаются дата и время повторения.
+def get_reminders_between(from_ts, until_ts, lease_before=None):
+    query = f"{_REMINDERS_SELECT} WHERE r.fire_at BETWEEN ? AND ?"
+    params = [config.DEFAULT_TIMEZONE, from_ts, until_ts]
+    if lease_before is not None:
+        query += f"""
+            UNION ALL
+            {_REMINDERS_SELECT}
+            WHERE r.claimed_by IS NOT NULL AND r.claimed_at < ? AND r.fire_at < ?
+        """
+        params += [config.DEFAULT_TIMEZONE, lease_before, from_ts]
     
-    count = cursor.fetchone()[0]
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute(f"{query} ORDER BY 1", params).fetchall()
     
-    return count
\ No newline at end of file
+    result = []
+    for fire_at, reminder_id, user_id, name, event_date, event_time, rrule, offset_minutes, timezone in rows:
+        if rrule and offset_minutes is not None:
+            occurrence = _timestamp_to_local_datetime(fire_at, timezone) + datetime.timedelta(minutes=offset_minutes)
+            event_date, event_time = occurrence.strftime(DATE_FORMAT), occurrence.strftime(TIME_FORMAT)
+        result.append((fire_at, reminder_id, user_id, name, event_date, event_time))
+    return result
+
+# Функция для получения момента самого раннего захвата, который еще
+# не истек к lease_before (None, если таких захватов нет)
+def get_earliest_claim(lease_before):
+    with connection() as conn:
+        return conn.execute(
+            "SELECT MIN(claimed_at) FROM reminders WHERE claimed_by IS NOT NULL AND claimed_at >= ?",
+            (lease_before,)
+        ).fetchone()[0]
+
+# Функция для получения количества напоминаний для события
+def get_reminder_count(event_id):
+    with connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM reminders WHERE event_id = ?",
+            (event_id,)
+        ).fetchone()[0]
+
+# Функция для получения сохраненных состояний разговора name: [(ключ, состояние), ...].
+# Разговоры, не менявшиеся дольше max_age секунд, удаляются и не возвращаются.
+def get_conversations(name, max_age=None):
+    with transaction() as conn:
+        if max_age:
+            conn.execute(
+                "DELETE FROM conversations WHERE name = ? AND updated_at < ?",
+                (name, int(time.time()) - max_age)
+            )
+        return conn.execute(
+            "SELECT key, state FROM conversations WHERE name = ?",
+            (name,)
+        ).fetchall()
+
+# Функция для получения сохраненных user_data пользователя (строка JSON или None)
+def get_user_data(user_id):
+    with connection() as conn:
+        result = conn.execute(
+            "SELECT data FROM user_data WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        return result[0] if result else None
+
+# Функция для записи накопленных изменений состояния бота одной транзакцией.
+# conversations - [(имя, ключ, состояние или None для завершенного разговора), ...],
+# user_data - [(user_id, JSON или None для удаления), ...].
+def save_conversation_state(conversations, user_data):
+    now_ts = int(time.time())
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)",
+            [(name, key, state, now_ts) for name, key, state in conversations if state is not None]
+        )
+        conn.executemany(
+            "DELETE FROM conversations WHERE name = ? AND key = ?",
+            [(name, key) for name, key, state in conversations if state is None]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)",
+            [(user_id, data, now_ts) for user_id, data in user_data if data is not None]
+        )
+        conn.executemany(
+            "DELETE FROM user_data WHERE user_id = ?",
+            [(user_id,) for user_id, data in user_data if data is None]
+        )
@@ -0,0 +1,180 @@
+"""
+Потоковая выгрузка событий пользователя в формате iCalendar (.ics).
+
+Календарь формируется по одному событию: строки с курсора базы данных
+(database.iter_user_events_for_export) сразу превращаются в текст
+и записываются в файл частями, поэтому объем памяти не зависит
+от размера календаря.
+"""
+
+import datetime
+
+import pytz
+
+import config
+import database
+import recurrence
+from timeutils import DATE_FORMAT, get_timezone, localize, parse_local
+
+# Идентификатор программы, формирующей календарь
+PRODID = "-//telegram-calendar-bot//RU"
+
+# Примерный размер текста, накапливаемого перед записью в файл (символы)
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# Максимальная длина строки iCalendar без переноса (октеты)
+_LINE_LIMIT = 75
+
+
+# Функция для экранирования текстовых значений iCalendar
+def _escape(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+# Функция для «сворачивания» длинной строки: продолжение начинается с пробела.
+# Строка делится по границам символов, чтобы не разрывать многобайтный UTF-8.
+def _fold(line):
+    if len(line.encode("utf-8")) <= _LINE_LIMIT:
+        return line + "\r\n"
+
+    parts = []
+    current = ""
+    size = 0
+    limit = _LINE_LIMIT
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append(current)
+            current = ""
+            size = 0
+            limit = _LINE_LIMIT - 1
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+# Функция для форматирования момента времени в UTC (формат 20270301T090000Z)
+def _format_utc(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+# Функция для получения момента времени: из сохраненного значения в UTC
+# или, если его нет, из локальных даты и времени пользователя
+def _timestamp(timestamp, date_str, time_str, timezone):
+    if timestamp is not None:
+        return timestamp
+    if date_str is None or time_str is None:
+        return None
+    try:
+        return int(localize(timezone, parse_local(date_str, time_str)).timestamp())
+    except ValueError:
+        return None
+
+
+# Функция для формирования строк повторения серии: DTSTART в часовом поясе
+# пользователя (чтобы повторения не сдвигались при переходе на летнее время),
+# RRULE и EXDATE. Возвращает None, если правило повторения некорректно.
+def _series_lines(event_date, event_time, rrule, exdates, timezone):
+    try:
+        dtstart = recurrence.series_start(event_date, event_time)
+        rule = recurrence.parse_rrule(rrule)
+    except ValueError:
+        return None
+
+    if rule.until is not None:
+        # В RRULE с DTSTART в часовом поясе UNTIL указывается в UTC
+        until = int(localize(timezone, rule.until).timestamp())
+        rrule = recurrence.format_rrule(rule._replace(until=None)) + f";UNTIL={_format_utc(until)}"
+    else:
+        rrule = recurrence.format_rrule(rule)
+
+    tzid = timezone.zone
+    lines = [f"DTSTART;TZID={tzid}:{dtstart.strftime('%Y%m%dT%H%M%S')}", f"RRULE:{rrule}"]
+    for exdate in sorted(recurrence.parse_exdates(exdates)):
+        excluded = datetime.datetime.strptime(exdate, DATE_FORMAT).replace(hour=dtstart.hour, minute=dtstart.minute)
+        lines.append(f"EXDATE;TZID={tzid}:{excluded.strftime('%Y%m%dT%H%M%S')}")
+    return lines
+
+
+# Функция для форматирования смещения напоминания от начала события (TRIGGER)
+def _format_trigger(offset_minutes):
+    sign = "-" if offset_minutes >= 0 else ""
+    return f"{sign}PT{abs(offset_minutes)}M"
+
+
+# Функция для формирования текста одного VEVENT
+def format_event(event, timezone, dtstamp):
+    event_id, name, event_date, event_time, starts_at, rrule, exdates, reminders = event
+    series_lines = _series_lines(event_date, event_time, rrule, exdates, timezone) if rrule else None
+    starts_at = _timestamp(starts_at, event_date, event_time, timezone)
+    if starts_at is None:
+        return ""
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event_id}@telegram-calendar-bot",
+        f"DTSTAMP:{dtstamp}",
+    ]
+    lines.extend(series_lines or [f"DTSTART:{_format_utc(starts_at)}"])
+    lines.append(f"SUMMARY:{_escape(name)}")
+
+    for reminder_date, reminder_time, fire_at, offset_minutes in reminders:
+        if offset_minutes is not None:
+            # Напоминание задано смещением от начала (для серии - от каждого повторения)
+            trigger = f"TRIGGER:{_format_trigger(offset_minutes)}"
+        else:
+            fire_at = _timestamp(fire_at, reminder_date, reminder_time, timezone)
+            if fire_at is None:
+                continue
+            trigger = f"TRIGGER;VALUE=DATE-TIME:{_format_utc(fire_at)}"
+        lines.extend([
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{_escape(name)}",
+            trigger,
+            "END:VALARM",
+        ])
+    lines.append("END:VEVENT")
+
+    return "".join(_fold(line) for line in lines)
+
+
+# Генератор текста календаря пользователя частями примерно по WRITE_BUFFER_SIZE символов
+def iter_calendar(user_id, timezone_str):
+    timezone = get_timezone(timezone_str)
+    dtstamp = _format_utc(int(datetime.datetime.now(pytz.utc).timestamp()))
+
+    buffer = [
+        "BEGIN:VCALENDAR\r\n",
+        "VERSION:2.0\r\n",
+        _fold(f"PRODID:{PRODID}"),
+        "CALSCALE:GREGORIAN\r\n",
+        _fold(f"X-WR-TIMEZONE:{timezone_str}"),
+    ]
+    size = 0
+    for event in database.iter_user_events_for_export(user_id):
+        text = format_event(event, timezone, dtstamp)
+        buffer.append(text)
+        size += len(text)
+        if size >= WRITE_BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+
+    buffer.append("END:VCALENDAR\r\n")
+    yield "".join(buffer)
+
+
+# Функция для записи календаря пользователя в открытый двоичный файл.
+# Возвращает число записанных байт. Выполняется в потоках-читателях,
+# поэтому пользователь без настроек не добавляется в базу.
+def write_calendar(f, user_id):
+    timezone_str = database.find_user_timezone(user_id) or config.DEFAULT_TIMEZONE
+    written = 0
+    for chunk in iter_calendar(user_id, timezone_str):
+        data = chunk.encode("utf-8")
+        f.write(data)
+        written += len(data)
+    return written
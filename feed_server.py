@@ -0,0 +1,210 @@
+"""
+HTTP-сервер подписки на календарь (iCalendar).
+
+Календарь пользователя доступен по адресу /feed/<токен>.ics, где токен
+выдается командой /export. Сервер работает в процессе бота на asyncio
+без дополнительных зависимостей.
+
+Календарные клиенты опрашивают подписку периодически, поэтому ответ
+снабжается заголовками ETag и Last-Modified: пока версия данных пользователя
+(database.get_user_version) не изменилась, клиент получает
+304 Not Modified без формирования файла.
+"""
+
+import asyncio
+import hashlib
+import logging
+import tempfile
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+import async_database
+import database
+from cache import LRUCache, MISSING
+from exporters import write_calendar
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEED_HOST = "127.0.0.1"
+DEFAULT_FEED_PORT = 8080
+
+# Путь подписки: /feed/<токен>.ics
+FEED_PATH_PREFIX = "/feed/"
+FEED_PATH_SUFFIX = ".ics"
+
+# Размер части файла при отправке ответа (байт)
+SEND_CHUNK_SIZE = 64 * 1024
+
+# Календари меньше этого размера формируются в памяти, большие - во временном файле
+SPOOL_SIZE = 1024 * 1024
+
+# Ограничения на запрос клиента
+MAX_HEADER_LINES = 100
+REQUEST_TIMEOUT = 10
+
+
+# Функция для получения адреса подписки пользователя (None, если сервер отключен)
+def feed_url(token):
+    base_url = getattr(config, "FEED_BASE_URL", "")
+    if not getattr(config, "FEED_ENABLED", False) or not base_url:
+        return None
+    return f"{base_url.rstrip('/')}{FEED_PATH_PREFIX}{token}{FEED_PATH_SUFFIX}"
+
+
+class FeedServer:
+    """HTTP-сервер подписки на календари пользователей"""
+
+    def __init__(self, host=DEFAULT_FEED_HOST, port=DEFAULT_FEED_PORT):
+        self.host = host
+        self.port = port
+        self._server = None
+        # Токен -> (ETag, время первого появления этой версии календаря)
+        self._versions = LRUCache(maxsize=10000)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Сервер подписки на календарь запущен на %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # Обработка одного HTTP-соединения (один запрос, затем соединение закрывается)
+    async def _handle(self, reader, writer):
+        try:
+            method, path, headers = await asyncio.wait_for(self._read_request(reader), REQUEST_TIMEOUT)
+            await self._respond(writer, method, path, headers)
+        except (asyncio.TimeoutError, ValueError):
+            await self._send_status(writer, 400, "Bad Request")
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка при обработке запроса подписки: %s", e)
+            await self._send_status(writer, 500, "Internal Server Error")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise ValueError("некорректная строка запроса")
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("слишком много заголовков")
+
+        return parts[0].upper(), parts[1], headers
+
+    async def _respond(self, writer, method, path, headers):
+        if method not in ("GET", "HEAD"):
+            await self._send_status(writer, 405, "Method Not Allowed")
+            return
+
+        path = path.split("?", 1)[0]
+        if not (path.startswith(FEED_PATH_PREFIX) and path.endswith(FEED_PATH_SUFFIX)):
+            await self._send_status(writer, 404, "Not Found")
+            return
+
+        token = path[len(FEED_PATH_PREFIX):-len(FEED_PATH_SUFFIX)]
+        user_id = await async_database.run_read(database.get_feed_user, token)
+        if user_id is None:
+            await self._send_status(writer, 404, "Not Found")
+            return
+
+        etag, last_modified = await self._version(token, user_id)
+        validators = [
+            ("ETag", etag),
+            ("Last-Modified", formatdate(last_modified, usegmt=True)),
+            ("Cache-Control", "private, no-cache"),
+        ]
+
+        if self._not_modified(headers, etag, last_modified):
+            await self._send(writer, 304, "Not Modified", validators)
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            size = await async_database.run_read(write_calendar, f, user_id)
+            await self._send(writer, 200, "OK", validators + [
+                ("Content-Type", "text/calendar; charset=utf-8"),
+                ("Content-Length", str(size)),
+            ])
+            if method == "GET":
+                f.seek(0)
+                while True:
+                    chunk = f.read(SEND_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+
+    # Получение ETag и времени изменения календаря по версии данных пользователя.
+    # Время изменения - момент, когда сервер впервые увидел текущую версию.
+    async def _version(self, token, user_id):
+        data_version = await async_database.run_read(database.get_user_version, user_id)
+        # Только чтение: запрос подписки не должен добавлять пользователя в базу
+        timezone_str = await async_database.run_read(database.find_user_timezone, user_id) or config.DEFAULT_TIMEZONE
+        digest = hashlib.sha1(repr((user_id, data_version, timezone_str)).encode("utf-8")).hexdigest()[:20]
+        etag = f'W/"{digest}"'
+
+        cached = self._versions.get(token)
+        if cached is not MISSING and cached[0] == etag:
+            return cached
+        version = (etag, int(time.time()))
+        self._versions.set(token, version)
+        return version
+
+    @staticmethod
+    def _not_modified(headers, etag, last_modified):
+        if "if-none-match" in headers:
+            candidates = [value.strip() for value in headers["if-none-match"].split(",")]
+            return etag in candidates or "*" in candidates
+        if "if-modified-since" in headers:
+            try:
+                since = parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return last_modified <= since
+        return False
+
+    async def _send(self, writer, status, reason, headers):
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def _send_status(self, writer, status, reason):
+        try:
+            await self._send(writer, status, reason, [("Content-Length", "0")])
+        except ConnectionError:
+            pass
+
+
+# Функция для запуска сервера подписки по настройкам из config.py (None, если отключен)
+async def start_feed_server():
+    if not getattr(config, "FEED_ENABLED", False):
+        return None
+
+    server = FeedServer(
+        getattr(config, "FEED_HOST", DEFAULT_FEED_HOST),
+        getattr(config, "FEED_PORT", DEFAULT_FEED_PORT),
+    )
+    await server.start()
+    return server
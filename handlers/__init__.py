@@ -2,4 +2,7 @@
 from .common import *
 from .event_handlers import *
 from .reminder_handlers import *
-from .settings_handlers import *
\ No newline at end of file
+from .settings_handlers import *
+from .import_handlers import *
+from .export_handlers import *
+from .recurrence_handlers import *
\ No newline at end of file
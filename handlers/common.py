@@ -1,8 +1,6 @@
 import logging
 import datetime
-import sqlite3
-import pytz
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ContextTypes
 
 # Импорт конфигурации
@@ -12,12 +10,11 @@ except ImportError:
     print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
     exit(1)
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL),
-    filename=config.LOG_FILE
-)
+import async_database
+import recurrence
+from timeutils import format_offset, get_timezone
+from .keyboards import MAIN_MENU, BACK_TO_MENU, user_keyboard
+
 logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
@@ -36,68 +33,174 @@ logger = logging.getLogger(__name__)
     CONFIRMING_EVENT_DELETION,
     CHOOSING_REMINDER_TO_DELETE,
     CONFIRMING_REMINDER_DELETION,
-) = range(14)
+    IMPORTING_FILE,
+    CHOOSING_RECURRENCE,
+    ENTERING_RECURRENCE_END,
+) = range(17)
 
-# Функция для получения часового пояса пользователя
-def get_user_timezone(user_id):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT timezone FROM user_settings WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
+# Названия состояний для метрик (в том же порядке)
+STATE_NAMES = dict(enumerate([
+    "CHOOSING_ACTION",
+    "ADDING_EVENT_NAME",
+    "ADDING_EVENT_DATE",
+    "ADDING_EVENT_TIME",
+    "ADDING_REMINDER",
+    "CHOOSING_EVENT_FOR_REMINDER",
+    "ADDING_REMINDER_DATE",
+    "ADDING_REMINDER_TIME",
+    "CHOOSING_EVENT_TO_VIEW",
+    "CHOOSING_TIMEZONE",
+    "CHOOSING_EVENT_TO_DELETE",
+    "CONFIRMING_EVENT_DELETION",
+    "CHOOSING_REMINDER_TO_DELETE",
+    "CONFIRMING_REMINDER_DELETION",
+    "IMPORTING_FILE",
+    "CHOOSING_RECURRENCE",
+    "ENTERING_RECURRENCE_END",
+]))
+
+# Функция для получения текущего времени в часовом поясе пользователя
+async def get_user_current_time(user_id):
+    timezone_str = await async_database.get_user_timezone(user_id)
+    return datetime.datetime.now(get_timezone(timezone_str))
+
+# Количество ближайших повторений серии, показываемых в подробностях события
+UPCOMING_OCCURRENCES = 3
+
+# Функция для описания серии: правило повторения и ближайшие повторения
+async def describe_series(user_id, event_date, event_time, rrule, exdates):
+    try:
+        dtstart = recurrence.series_start(event_date, event_time)
+        rule = recurrence.parse_rrule(rrule)
+    except ValueError:
+        return ""
     
-    if result:
-        timezone = result[0]
+    now = (await get_user_current_time(user_id)).replace(tzinfo=None)
+    occurrences = recurrence.upcoming_occurrences(
+        dtstart, rule, recurrence.parse_exdates(exdates), now, UPCOMING_OCCURRENCES
+    )
+    text = f"\nПовторение: {recurrence.describe(rule)}"
+    if occurrences:
+        text += "\nБлижайшие: " + ", ".join(occurrence.strftime("%d.%m.%Y %H:%M") for occurrence in occurrences)
     else:
-        # Если пользователя нет в базе, добавляем его с часовым поясом по умолчанию
-        timezone = config.DEFAULT_TIMEZONE
-        cursor.execute("INSERT INTO user_settings (user_id, timezone) VALUES (?, ?)",
-                      (user_id, timezone))
-        conn.commit()
-    
-    conn.close()
-    return timezone
+        text += "\nСерия завершена."
+    return text
 
-# Функция для установки часового пояса пользователя
-def set_user_timezone(user_id, timezone):
-    conn = sqlite3.connect(config.DB_NAME)
-    cursor = conn.cursor()
+# Функция для подписи напоминания: дата и время или смещение от начала события
+def describe_reminder(reminder_date, reminder_time, offset_minutes):
+    if reminder_date is None:
+        return format_offset(offset_minutes)
+    return f"{reminder_date} в {reminder_time}"
+
+# Списки событий с постраничной навигацией:
+# имя списка -> (префикс callback_data кнопки события, только события с напоминаниями)
+EVENT_LISTS = {
+    "view": ("view_event_", False),
+    "rem": ("event_", False),
+    "del": ("delete_event_", False),
+    "remdel": ("delete_reminder_event_", True),
+}
+
+# Функция для разбора callback_data кнопки навигации по списку событий.
+# Формат: page_<список>_<a|u>_<s|n|p>_<starts_at>_<id>, где a - все события,
+# u - только предстоящие, s - первая страница, n - следующая, p - предыдущая.
+def parse_page_callback(data):
+    if not data or not data.startswith("page_"):
+        return False, "s", None
+    _, _, scope, direction, starts_at, event_id = data.split("_")
+    cursor = (int(starts_at), int(event_id)) if direction != "s" else None
+    return scope == "a", direction, cursor
+
+# Показать страницу списка событий с кнопками навигации
+async def show_event_page(update: Update, list_name, title, empty_text, state) -> int:
+    query = update.callback_query
+    user_id = update.effective_user.id
+    event_prefix, with_reminders = EVENT_LISTS[list_name]
+    page_size = getattr(config, "EVENTS_PAGE_SIZE", 10)
     
-    cursor.execute("INSERT OR REPLACE INTO user_settings (user_id, timezone) VALUES (?, ?)",
-                  (user_id, timezone))
+    # Кнопки навигации и переключения прошедших событий приходят сюда напрямую,
+    # а на остальные запросы (пункты меню) уже ответил handle_menu_choice
+    if query.data.startswith("page_"):
+        await query.answer()
+    include_past, direction, cursor = parse_page_callback(query.data)
     
-    conn.commit()
-    conn.close()
-
-# Функция для получения текущего времени в часовом поясе пользователя
-def get_user_current_time(user_id):
-    timezone_str = get_user_timezone(user_id)
-    timezone = pytz.timezone(timezone_str)
-    return datetime.datetime.now(timezone)
+    # Начало текущей минуты: в пределах минуты страница читается из кэша списков
+    since = None if include_past else int(datetime.datetime.now().timestamp()) // 60 * 60
+    backward = direction == "p"
+    events, has_more = await async_database.get_user_events_page(
+        user_id, cursor, backward, page_size, since, with_reminders
+    )
+    
+    # Если события на странице успели удалить, начинаем список сначала
+    if not events and cursor is not None:
+        cursor, backward, direction = None, False, "s"
+        events, has_more = await async_database.get_user_events_page(
+            user_id, None, False, page_size, since, with_reminders
+        )
+    
+    scope = "a" if include_past else "u"
+    toggle = [(
+        "Только предстоящие" if include_past else "Показать прошедшие",
+        f"page_{list_name}_{'u' if include_past else 'a'}_s_0_0"
+    )]
+    
+    if not events:
+        has_past = False
+        if not include_past:
+            past_events, _ = await async_database.get_user_events_page(user_id, None, False, 1, None, with_reminders)
+            has_past = bool(past_events)
+        
+        rows = ([toggle] if has_past else []) + [[("Назад", "back_to_menu")]]
+        await query.edit_message_text(
+            text=empty_text,
+            reply_markup=user_keyboard(user_id, list_name, (scope, has_past), lambda: rows)
+        )
+        return state if has_past else CHOOSING_ACTION
+    
+    has_prev = has_more if backward else cursor is not None
+    has_next = True if backward else has_more
+    
+    # Клавиатура строится заново, только если страница изменилась
+    def build():
+        rows = []
+        for event_id, name, date, time, starts_at, rrule in events:
+            # Для серий показывается ближайшее повторение
+            label = f"🔁 {name} ({date} {time})" if rrule else f"{name} ({date} {time})"
+            rows.append([(label, f"{event_prefix}{event_id}")])
+        
+        navigation = []
+        if has_prev:
+            first = events[0]
+            navigation.append(("◀️", f"page_{list_name}_{scope}_p_{first[4]}_{first[0]}"))
+        if has_next:
+            last = events[-1]
+            navigation.append(("▶️", f"page_{list_name}_{scope}_n_{last[4]}_{last[0]}"))
+        if navigation:
+            rows.append(navigation)
+        
+        rows.append(toggle)
+        rows.append([("Назад", "back_to_menu")])
+        return rows
+    
+    await query.edit_message_text(
+        text=title,
+        reply_markup=user_keyboard(user_id, list_name, (scope, events, has_prev, has_next), build)
+    )
+    
+    return state
 
 # Показать главное меню
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    keyboard = [
-        [InlineKeyboardButton("Добавить событие", callback_data="add_event")],
-        [InlineKeyboardButton("Добавить напоминание", callback_data="add_reminder")],
-        [InlineKeyboardButton("Просмотреть события", callback_data="view_events")],
-        [InlineKeyboardButton("Удалить событие", callback_data="delete_event")],
-        [InlineKeyboardButton("Удалить напоминание", callback_data="delete_reminder")],
-        [InlineKeyboardButton("Текущее время и дата", callback_data="current_time")],
-        [InlineKeyboardButton("Настройка часового пояса", callback_data="set_timezone")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     if update.callback_query:
         await update.callback_query.answer()
         await update.callback_query.edit_message_text(
             text="Выберите действие:",
-            reply_markup=reply_markup
+            reply_markup=MAIN_MENU
         )
     else:
         await update.message.reply_text(
             text="Выберите действие:",
-            reply_markup=reply_markup
+            reply_markup=MAIN_MENU
         )
     
     return CHOOSING_ACTION
@@ -131,20 +234,20 @@ async def handle_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await show_events_for_reminder_deletion(update, context)
     elif choice == "current_time":
         user_id = update.effective_user.id
-        now = get_user_current_time(user_id)
-        timezone_str = get_user_timezone(user_id)
+        timezone_str = await async_database.get_user_timezone(user_id)
+        now = datetime.datetime.now(get_timezone(timezone_str))
         
         formatted_date = now.strftime("%d.%m.%Y")
         formatted_time = now.strftime("%H:%M:%S")
         
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.edit_message_text(
             text=f"Текущая дата: {formatted_date}\nТекущее время: {formatted_time}\nЧасовой пояс: {timezone_str}",
-            reply_markup=reply_markup
+            reply_markup=BACK_TO_MENU
         )
         return CHOOSING_ACTION
     elif choice == "set_timezone":
         from .settings_handlers import show_timezone_selection
-        return await show_timezone_selection(update, context)
\ No newline at end of file
+        return await show_timezone_selection(update, context)
+    elif choice == "import_events":
+        from .import_handlers import request_import_file
+        return await request_import_file(update, context)
\ No newline at end of file
@@ -1,14 +1,15 @@
 import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ContextTypes
 
-import database
+import async_database
 from .common import (
     ADDING_EVENT_NAME, ADDING_EVENT_DATE, ADDING_EVENT_TIME, ADDING_REMINDER,
     CHOOSING_ACTION, CHOOSING_EVENT_TO_VIEW, CHOOSING_EVENT_TO_DELETE,
     CONFIRMING_EVENT_DELETION, CHOOSING_EVENT_FOR_REMINDER,
-    show_main_menu
+    show_main_menu, show_event_page, describe_series, describe_reminder
 )
+from . import keyboards
 
 # Добавление названия события
 async def add_event_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -51,7 +52,7 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         context.user_data["event_time"] = event_time
         
         # Сохраняем событие в базу данных
-        event_id = database.add_event(
+        event_id = await async_database.add_event(
             update.effective_user.id,
             context.user_data["event_name"],
             context.user_data["event_date"],
@@ -60,15 +61,9 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         context.user_data["event_id"] = event_id
         
-        keyboard = [
-            [InlineKeyboardButton("Да", callback_data="add_reminder_now")],
-            [InlineKeyboardButton("Нет", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
             f"Событие '{context.user_data['event_name']}' добавлено на {context.user_data['event_date']} в {context.user_data['event_time']}.\n\nХотите добавить напоминание?",
-            reply_markup=reply_markup
+            reply_markup=keyboards.ADD_REMINDER_NOW
         )
         
         return ADDING_REMINDER
@@ -80,32 +75,12 @@ async def add_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 # Показать список событий
 async def show_events(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    events = database.get_user_events(update.effective_user.id)
-    
-    if not events:
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(
-            text="У вас нет событий.",
-            reply_markup=reply_markup
-        )
-        return CHOOSING_ACTION
-    
-    keyboard = []
-    for event in events:
-        event_id, name, date, time = event
-        keyboard.append([InlineKeyboardButton(f"{name} ({date} {time})", callback_data=f"view_event_{event_id}")])
-    
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        text="Ваши события:",
-        reply_markup=reply_markup
+    return await show_event_page(
+        update, "view",
+        title="Ваши события:",
+        empty_text="У вас нет событий.",
+        state=CHOOSING_EVENT_TO_VIEW
     )
-    
-    return CHOOSING_EVENT_TO_VIEW
 
 # Просмотр деталей события
 async def view_event_details(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -114,99 +89,52 @@ async def view_event_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     event_id = int(query.data.split("_")[2])
     
-    # Получаем информацию о событии
-    event = database.get_event(event_id)
+    # Получаем информацию о событии вместе с напоминаниями
+    details = await async_database.get_event_details(event_id, update.effective_user.id)
     
-    if not event:
+    if not details:
         await query.edit_message_text(text="Событие не найдено.")
         return await show_main_menu(update, context)
     
-    name, date, time = event
+    (name, date, time, rrule, exdates), reminders = details
     
-    # Получаем напоминания для события
-    reminders = database.get_event_reminders(event_id)
+    recurrence_text = ""
+    if rrule:
+        recurrence_text = await describe_series(update.effective_user.id, date, time, rrule, exdates)
     
     reminders_text = ""
     if reminders:
         reminders_text = "\n\nНапоминания:\n"
         for i, reminder in enumerate(reminders, 1):
-            reminder_id, reminder_date, reminder_time = reminder
-            reminders_text += f"{i}. {reminder_date} в {reminder_time}\n"
+            reminder_id, reminder_date, reminder_time, offset_minutes = reminder
+            reminders_text += f"{i}. {describe_reminder(reminder_date, reminder_time, offset_minutes)}\n"
     else:
         reminders_text = "\n\nНапоминаний нет."
     
-    keyboard = [
-        [InlineKeyboardButton("Добавить напоминание", callback_data=f"event_{event_id}")],
-        [InlineKeyboardButton("Удалить событие", callback_data=f"delete_event_{event_id}")],
-        [InlineKeyboardButton("Назад к списку событий", callback_data="view_events")],
-        [InlineKeyboardButton("Главное меню", callback_data="back_to_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
-        text=f"Событие: {name}\nДата: {date}\nВремя: {time}{reminders_text}",
-        reply_markup=reply_markup
+        text=f"Событие: {name}\nДата: {date}\nВремя: {time}{recurrence_text}{reminders_text}",
+        reply_markup=keyboards.event_details(event_id, bool(rrule))
     )
     
     return CHOOSING_ACTION
 
 # Показать список событий для добавления напоминания
 async def show_events_for_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    events = database.get_user_events(update.effective_user.id)
-    
-    if not events:
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(
-            text="У вас нет событий. Сначала добавьте событие.",
-            reply_markup=reply_markup
-        )
-        return CHOOSING_ACTION
-    
-    keyboard = []
-    for event in events:
-        event_id, name, date, time = event
-        keyboard.append([InlineKeyboardButton(f"{name} ({date} {time})", callback_data=f"event_{event_id}")])
-    
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        text="Выберите событие для добавления напоминания:",
-        reply_markup=reply_markup
+    return await show_event_page(
+        update, "rem",
+        title="Выберите событие для добавления напоминания:",
+        empty_text="У вас нет событий. Сначала добавьте событие.",
+        state=CHOOSING_EVENT_FOR_REMINDER
     )
-    
-    return CHOOSING_EVENT_FOR_REMINDER
 
 # Показать список событий для удаления
 async def show_events_for_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    events = database.get_user_events(update.effective_user.id)
-    
-    if not events:
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(
-            text="У вас нет событий для удаления.",
-            reply_markup=reply_markup
-        )
-        return CHOOSING_ACTION
-    
-    keyboard = []
-    for event in events:
-        event_id, name, date, time = event
-        keyboard.append([InlineKeyboardButton(f"{name} ({date} {time})", callback_data=f"delete_event_{event_id}")])
-    
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        text="Выберите событие для удаления:",
-        reply_markup=reply_markup
+    return await show_event_page(
+        update, "del",
+        title="Выберите событие для удаления:",
+        empty_text="У вас нет событий для удаления.",
+        state=CHOOSING_EVENT_TO_DELETE
     )
-    
-    return CHOOSING_EVENT_TO_DELETE
 
 # Подтверждение удаления события
 async def confirm_event_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -216,25 +144,18 @@ async def confirm_event_deletion(update: Update, context: ContextTypes.DEFAULT_T
     event_id = int(query.data.split("_")[2])
     context.user_data["event_id_to_delete"] = event_id
     
-    # Получаем информацию о событии
-    event = database.get_event(event_id)
+    # Получаем информацию о событии и количество его напоминаний
+    event = await async_database.get_event_with_reminder_count(event_id, update.effective_user.id)
     
     if not event:
         await query.edit_message_text(text="Событие не найдено.")
         return await show_main_menu(update, context)
     
-    name, date, time = event
-    
-    # Получаем количество напоминаний для события
-    reminder_count = database.get_reminder_count(event_id)
+    name, date, time, reminder_count = event
     
     reminder_text = f"\n\nВместе с событием будут удалены все связанные напоминания ({reminder_count})." if reminder_count > 0 else ""
     
-    keyboard = [
-        [InlineKeyboardButton("Да, удалить", callback_data=f"confirm_delete_event_{event_id}")],
-        [InlineKeyboardButton("Нет, отменить", callback_data="back_to_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.confirm_event_deletion(event_id)
     
     await query.edit_message_text(
         text=f"Вы уверены, что хотите удалить событие '{name}' ({date} {time})?{reminder_text}",
@@ -251,14 +172,11 @@ async def delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     event_id = int(query.data.split("_")[3])
     
     # Удаляем событие и все связанные напоминания
-    database.delete_event(event_id)
-    
-    keyboard = [[InlineKeyboardButton("Назад в главное меню", callback_data="back_to_menu")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await async_database.delete_event(event_id)
     
     await query.edit_message_text(
         text="Событие и все связанные напоминания успешно удалены.",
-        reply_markup=reply_markup
+        reply_markup=keyboards.BACK_TO_MAIN_MENU
     )
     
     return CHOOSING_ACTION
\ No newline at end of file
@@ -0,0 +1,32 @@
+import logging
+import tempfile
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import async_database
+import database
+from exporters import write_calendar
+from feed_server import feed_url
+
+logger = logging.getLogger(__name__)
+
+# Календари меньше этого размера формируются в памяти, большие - во временном файле
+SPOOL_SIZE = 1024 * 1024
+
+# Команда /export: выгрузка событий и напоминаний пользователя в файл .ics.
+# Файл формируется в потоке-читателе частями с курсора базы данных.
+async def export_events(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    
+    caption = "Ваши события в формате iCalendar."
+    token = await async_database.run_write(database.get_feed_token, user_id)
+    url = feed_url(token)
+    if url:
+        caption += f"\n\nСсылка для подписки в календаре: {url}"
+    
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+        size = await async_database.run_read(write_calendar, f, user_id)
+        f.seek(0)
+        await update.message.reply_document(document=f, filename="calendar.ics", caption=caption)
+    
+    logger.info("Пользователь %s выгрузил календарь (%s байт)", user_id, size, extra={"user_id": user_id})
@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import tempfile
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+
+import config
+import async_database
+from importers import RowError, detect_format, iter_csv, iter_ics
+from .common import CHOOSING_ACTION, IMPORTING_FILE
+from .keyboards import BACK_TO_MENU, BACK_TO_MAIN_MENU
+
+logger = logging.getLogger(__name__)
+
+# Количество событий, вставляемых одной транзакцией
+DEFAULT_IMPORT_CHUNK_SIZE = 500
+
+# Максимальный размер загружаемого файла (байт)
+DEFAULT_IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+
+# Минимальный интервал между обновлениями сообщения о ходе импорта (секунды)
+PROGRESS_INTERVAL = 2
+
+# Сколько ошибок показывать в итоговом сообщении
+MAX_REPORTED_ERRORS = 10
+
+# Запрос файла для импорта (кнопка меню или команда /import)
+async def request_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = (
+        "Отправьте файл .ics или .csv с событиями.\n\n"
+        "CSV: название, дата (ДД.ММ.ГГГГ), время (ЧЧ:ММ) и необязательная колонка "
+        "напоминаний в формате \"ДД.ММ.ГГГГ ЧЧ:ММ\", несколько значений через \";\"."
+    )
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text=text, reply_markup=BACK_TO_MENU)
+    else:
+        await update.message.reply_text(text=text, reply_markup=BACK_TO_MENU)
+    
+    return IMPORTING_FILE
+
+# Отбрасывание ошибочных записей из потока парсера с подсчетом и сохранением первых ошибок
+def _collect_errors(records, errors):
+    for record in records:
+        if isinstance(record, RowError):
+            errors["count"] += 1
+            if len(errors["items"]) < MAX_REPORTED_ERRORS:
+                errors["items"].append(record)
+            continue
+        yield record
+
+# Формирование итогового сообщения об импорте
+def _format_summary(events_count, reminders_count, errors):
+    lines = [f"Импорт завершен.\n\nДобавлено событий: {events_count}\nДобавлено напоминаний: {reminders_count}"]
+    
+    if errors["count"]:
+        lines.append(f"\nПропущено записей с ошибками: {errors['count']}")
+        for error in errors["items"]:
+            lines.append(f"Строка {error.line}: {error.message}")
+        if errors["count"] > len(errors["items"]):
+            lines.append("...")
+    
+    return "\n".join(lines)
+
+# Обработка загруженного файла
+async def import_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    document = update.message.document
+    user_id = update.effective_user.id
+    
+    file_format = detect_format(document.file_name)
+    if file_format is None:
+        await update.message.reply_text("Поддерживаются только файлы .ics и .csv. Отправьте другой файл:")
+        return IMPORTING_FILE
+    
+    max_size = getattr(config, "IMPORT_MAX_FILE_SIZE", DEFAULT_IMPORT_MAX_FILE_SIZE)
+    if document.file_size and document.file_size > max_size:
+        await update.message.reply_text(f"Файл слишком большой. Максимальный размер: {max_size // (1024 * 1024)} МБ.")
+        return IMPORTING_FILE
+    
+    # Одно сообщение используется и для хода импорта, и для итогов
+    status = await update.message.reply_text("Загрузка файла...")
+    
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        await telegram_file.download_to_drive(path)
+    
+        timezone_str = await async_database.get_user_timezone(user_id)
+        errors = {"count": 0, "items": []}
+        last_update = time.monotonic()
+    
+        async def report_progress(events_count, reminders_count):
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = now
+            try:
+                await status.edit_text(
+                    f"Импорт... Добавлено событий: {events_count}, напоминаний: {reminders_count}"
+                )
+            except TelegramError as e:
+                logger.warning("Не удалось обновить сообщение о ходе импорта: %s", e)
+    
+        # Файл читается построчно внутри import_events, поэтому весь календарь
+        # в памяти не держится
+        with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+            if file_format == "ics":
+                records = iter_ics(f, timezone_str)
+            else:
+                records = iter_csv(f)
+            events_count, reminders_count = await async_database.import_events(
+                user_id,
+                _collect_errors(records, errors),
+                chunk_size=getattr(config, "IMPORT_CHUNK_SIZE", DEFAULT_IMPORT_CHUNK_SIZE),
+                on_progress=report_progress
+            )
+    
+        summary = _format_summary(events_count, reminders_count, errors)
+    except Exception as e:
+        logger.error("Ошибка импорта файла %s пользователя %s: %s", document.file_name, user_id, e)
+        summary = "Не удалось импортировать файл. События, добавленные до ошибки, сохранены."
+    finally:
+        os.remove(path)
+    
+    await status.edit_text(text=summary, reply_markup=BACK_TO_MAIN_MENU)
+    
+    return CHOOSING_ACTION
@@ -0,0 +1,160 @@
+"""
+Клавиатуры сообщений бота.
+
+Статические клавиатуры (главное меню, выбор часового пояса, кнопки «Назад»)
+создаются один раз при импорте модуля, а не при каждом нажатии. Все клавиатуры
+модуля - CachedInlineKeyboardMarkup: словарь для Bot API строится один раз
+при создании клавиатуры, а не при каждой отправке сообщения.
+
+Клавиатуры страниц списков событий зависят от данных пользователя и хранятся
+в LRU-кэше по пользователю вместе с содержимым страницы, из которого построены.
+Если содержимое изменилось (другая страница или пользователь добавил или удалил
+событие), клавиатура строится заново. Списки из кэша database.user_list_cache
+возвращаются теми же объектами, поэтому сравнение обычно сводится к проверке
+тождественности.
+"""
+
+import functools
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import config
+from cache import LRUCache
+
+# Сколько клавиатур событий (по одной на событие) хранится в памяти
+EVENT_KEYBOARD_CACHE_SIZE = 1024
+
+
+class CachedInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup, который сериализуется один раз при создании"""
+
+    __slots__ = ("_serialized",)
+
+    def __init__(self, inline_keyboard, *, api_kwargs=None):
+        super().__init__(inline_keyboard, api_kwargs=api_kwargs)
+        with self._unfrozen():
+            self._serialized = super().to_dict()
+
+    # Словарь не копируется: при отправке PTB только преобразует его в JSON
+    def to_dict(self, recursive=True):
+        if not recursive:
+            return super().to_dict(recursive)
+        return self._serialized
+
+
+# Функция для создания клавиатуры из строк пар (текст, callback_data)
+def build_keyboard(rows):
+    return CachedInlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row]
+        for row in rows
+    ])
+
+
+MAIN_MENU = build_keyboard([
+    [("Добавить событие", "add_event")],
+    [("Добавить напоминание", "add_reminder")],
+    [("Просмотреть события", "view_events")],
+    [("Удалить событие", "delete_event")],
+    [("Удалить напоминание", "delete_reminder")],
+    [("Текущее время и дата", "current_time")],
+    [("Импорт событий из файла", "import_events")],
+    [("Настройка часового пояса", "set_timezone")],
+])
+
+BACK_TO_MENU = build_keyboard([[("Назад", "back_to_menu")]])
+BACK_TO_MAIN_MENU = build_keyboard([[("Назад в главное меню", "back_to_menu")]])
+
+ADD_REMINDER_NOW = build_keyboard([
+    [("Да", "add_reminder_now")],
+    [("Нет", "back_to_menu")],
+])
+
+TIMEZONE_SELECTION = build_keyboard(
+    [[(tz, f"tz_{tz}")] for tz in config.AVAILABLE_TIMEZONES]
+    + [[("Назад", "back_to_menu")]]
+)
+
+
+# Функция для получения клавиатуры карточки события
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def event_details(event_id, recurring):
+    rows = [
+        [("Добавить напоминание", f"event_{event_id}")],
+        [("🔁 Повторение", f"recur_{event_id}")],
+    ]
+    if recurring:
+        rows.append([("Пропустить ближайшее повторение", f"skip_{event_id}")])
+    rows += [
+        [("Удалить событие", f"delete_event_{event_id}")],
+        [("Назад к списку событий", "view_events")],
+        [("Главное меню", "back_to_menu")],
+    ]
+    return build_keyboard(rows)
+
+
+# Функция для получения клавиатуры после добавления напоминания к событию
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def reminder_added(event_id):
+    return build_keyboard([
+        [("Добавить еще напоминание", f"event_{event_id}")],
+        [("Вернуться в главное меню", "back_to_menu")],
+    ])
+
+
+# Функция для получения клавиатуры подтверждения удаления события
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def confirm_event_deletion(event_id):
+    return build_keyboard([
+        [("Да, удалить", f"confirm_delete_event_{event_id}")],
+        [("Нет, отменить", "back_to_menu")],
+    ])
+
+
+# Функция для получения клавиатуры подтверждения удаления напоминания
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def confirm_reminder_deletion(reminder_id):
+    return build_keyboard([
+        [("Да, удалить", f"confirm_delete_reminder_{reminder_id}")],
+        [("Нет, отменить", "back_to_menu")],
+    ])
+
+
+# Функция для получения клавиатуры выбора частоты повторения события
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def recurrence_options(event_id):
+    return build_keyboard([
+        [("Ежедневно", f"rrule_{event_id}_DAILY")],
+        [("Еженедельно", f"rrule_{event_id}_WEEKLY")],
+        [("Ежемесячно", f"rrule_{event_id}_MONTHLY")],
+        [("Не повторять", f"rrule_{event_id}_NONE")],
+        [("Назад", f"view_event_{event_id}")],
+    ])
+
+
+# Функция для получения клавиатуры возврата к карточке события
+# (with_menu - добавить кнопку главного меню)
+@functools.lru_cache(maxsize=EVENT_KEYBOARD_CACHE_SIZE)
+def back_to_event(event_id, with_menu=False):
+    rows = [[("К событию", f"view_event_{event_id}")]]
+    if with_menu:
+        rows.append([("Главное меню", "back_to_menu")])
+    return build_keyboard(rows)
+
+
+# Последние клавиатуры списков событий: (user_id, список) -> (содержимое страницы, клавиатура)
+user_keyboards = LRUCache(maxsize=getattr(config, "KEYBOARD_CACHE_SIZE", 10000))
+
+
+# Функция для получения клавиатуры name пользователя. content - содержимое
+# страницы, по которому строится клавиатура; build() возвращает строки пар
+# (текст, callback_data) и вызывается, только если клавиатура для такого
+# содержимого еще не построена.
+def user_keyboard(user_id, name, content, build):
+    key = (user_id, name)
+    cached = user_keyboards.get(key, None)
+    if cached is not None and cached[0] == content:
+        return cached[1]
+
+    markup = build_keyboard(build())
+    user_keyboards.set(key, (content, markup))
+    return markup
@@ -0,0 +1,106 @@
+import datetime
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import async_database
+import recurrence
+from .common import (
+    CHOOSING_RECURRENCE, ENTERING_RECURRENCE_END,
+    show_main_menu
+)
+from . import keyboards
+
+# Показать варианты повторения события
+async def show_recurrence_options(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    
+    event_id = int(query.data.split("_")[1])
+    
+    await query.edit_message_text(
+        text="Как часто повторять событие?",
+        reply_markup=keyboards.recurrence_options(event_id)
+    )
+    
+    return CHOOSING_RECURRENCE
+
+# Выбор частоты повторения
+async def choose_recurrence_frequency(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    
+    _, event_id, frequency = query.data.split("_")
+    event_id = int(event_id)
+    
+    if frequency == "NONE":
+        found = await async_database.set_event_recurrence(event_id, update.effective_user.id, None)
+        if not found:
+            await query.edit_message_text(text="Событие не найдено.")
+            return await show_main_menu(update, context)
+    
+        await query.edit_message_text(
+            text="Событие больше не повторяется. Оно перенесено на ближайшее повторение.",
+            reply_markup=keyboards.back_to_event(event_id)
+        )
+        return CHOOSING_RECURRENCE
+    
+    context.user_data["recurrence_event_id"] = event_id
+    context.user_data["recurrence_frequency"] = frequency
+    
+    await query.edit_message_text(
+        text="Когда закончить повторение?\n\n"
+             "Введите дату окончания в формате ДД.ММ.ГГГГ, число повторений "
+             "или 0, чтобы повторять без окончания:"
+    )
+    
+    return ENTERING_RECURRENCE_END
+
+# Ввод окончания повторения
+async def set_recurrence_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = update.message.text.strip()
+    event_id = context.user_data.get("recurrence_event_id")
+    rrule = f"FREQ={context.user_data.get('recurrence_frequency')}"
+    
+    try:
+        if text.isdigit():
+            if int(text) > 0:
+                rrule += f";COUNT={int(text)}"
+        else:
+            until = datetime.datetime.strptime(text, "%d.%m.%Y")
+            rrule += f";UNTIL={until.strftime('%Y%m%d')}"
+    
+        found = await async_database.set_event_recurrence(event_id, update.effective_user.id, rrule)
+    except ValueError:
+        await update.message.reply_text(
+            "Неверное значение. Введите дату в формате ДД.ММ.ГГГГ, число повторений (не больше 1000) или 0:"
+        )
+        return ENTERING_RECURRENCE_END
+    
+    if not found:
+        await update.message.reply_text("Событие не найдено.")
+        return await show_main_menu(update, context)
+    
+    reply_markup = keyboards.back_to_event(event_id, with_menu=True)
+    
+    await update.message.reply_text(
+        text=f"Повторение установлено: {recurrence.describe(recurrence.parse_rrule(rrule))}.",
+        reply_markup=reply_markup
+    )
+    
+    return CHOOSING_RECURRENCE
+
+# Пропуск ближайшего повторения серии
+async def skip_occurrence(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    
+    event_id = int(query.data.split("_")[1])
+    skipped = await async_database.skip_next_occurrence(event_id, update.effective_user.id)
+    
+    text = f"Повторение {skipped} пропущено." if skipped else "У события нет предстоящих повторений."
+    await query.edit_message_text(
+        text=text,
+        reply_markup=keyboards.back_to_event(event_id)
+    )
+    
+    return CHOOSING_RECURRENCE
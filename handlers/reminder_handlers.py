@@ -1,13 +1,15 @@
 import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ContextTypes
 
-import database
+import async_database
+from timeutils import parse_offset
 from .common import (
     CHOOSING_ACTION, CHOOSING_EVENT_FOR_REMINDER, ADDING_REMINDER_DATE,
     ADDING_REMINDER_TIME, CHOOSING_REMINDER_TO_DELETE, CONFIRMING_REMINDER_DELETION,
-    show_main_menu
+    show_main_menu, show_event_page, describe_reminder
 )
+from . import keyboards
 
 # Выбор события для напоминания
 async def choose_event_for_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -26,7 +28,7 @@ async def choose_event_for_reminder(update: Update, context: ContextTypes.DEFAUL
         context.user_data["event_id"] = event_id
         
         # Получаем информацию о событии
-        event = database.get_event(event_id)
+        event = await async_database.get_event(event_id)
         
         if event:
             name, date, time = event
@@ -35,7 +37,8 @@ async def choose_event_for_reminder(update: Update, context: ContextTypes.DEFAUL
             context.user_data["event_time"] = time
     
     await query.edit_message_text(
-        text=f"Добавление напоминания для события '{context.user_data['event_name']}' ({context.user_data['event_date']} {context.user_data['event_time']}).\n\nВведите дату напоминания в формате ДД.ММ.ГГГГ:"
+        text=f"Добавление напоминания для события '{context.user_data['event_name']}' ({context.user_data['event_date']} {context.user_data['event_time']}).\n\nВведите дату напоминания в формате ДД.ММ.ГГГГ "
+             "или время до начала события, например -15m, -1h, -1d:"
     )
     
     return ADDING_REMINDER_DATE
@@ -44,6 +47,14 @@ async def choose_event_for_reminder(update: Update, context: ContextTypes.DEFAUL
 async def add_reminder_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     reminder_date = update.message.text
     
+    # Напоминание может быть задано смещением от начала события
+    try:
+        offset_minutes = parse_offset(reminder_date)
+    except ValueError:
+        offset_minutes = None
+    if offset_minutes is not None:
+        return await add_relative_reminder(update, context, offset_minutes)
+    
     # Проверка формата даты
     try:
         datetime.datetime.strptime(reminder_date, "%d.%m.%Y")
@@ -56,10 +67,26 @@ async def add_reminder_date(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ADDING_REMINDER_TIME
     except ValueError:
         await update.message.reply_text(
-            "Неверный формат даты. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ:"
+            "Неверный формат даты. Пожалуйста, введите дату в формате ДД.ММ.ГГГГ "
+            "или время до начала события, например -15m:"
         )
         return ADDING_REMINDER_DATE
 
+# Добавление напоминания, заданного смещением от начала события
+async def add_relative_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE, offset_minutes) -> int:
+    reminder_id = await async_database.add_relative_reminder(context.user_data["event_id"], offset_minutes)
+    
+    reply_markup = keyboards.reminder_added(context.user_data["event_id"])
+    
+    if reminder_id is None:
+        text = f"Не удалось добавить напоминание: у события '{context.user_data['event_name']}' нет предстоящих повторений."
+    else:
+        text = f"Напоминание для события '{context.user_data['event_name']}' добавлено: {describe_reminder(None, None, offset_minutes)}."
+    
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    
+    return CHOOSING_EVENT_FOR_REMINDER
+
 # Добавление времени напоминания
 async def add_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     reminder_time = update.message.text
@@ -70,17 +97,13 @@ async def add_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data["reminder_time"] = reminder_time
         
         # Сохраняем напоминание в базу данных
-        database.add_reminder(
+        await async_database.add_reminder(
             context.user_data["event_id"],
             context.user_data["reminder_date"],
             context.user_data["reminder_time"]
         )
         
-        keyboard = [
-            [InlineKeyboardButton("Добавить еще напоминание", callback_data=f"event_{context.user_data['event_id']}")],
-            [InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = keyboards.reminder_added(context.user_data["event_id"])
         
         await update.message.reply_text(
             f"Напоминание для события '{context.user_data['event_name']}' добавлено на {context.user_data['reminder_date']} в {context.user_data['reminder_time']}.",
@@ -96,32 +119,12 @@ async def add_reminder_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # Показать список событий для удаления напоминаний
 async def show_events_for_reminder_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    events = database.get_user_events_with_reminders(update.effective_user.id)
-    
-    if not events:
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.callback_query.edit_message_text(
-            text="У вас нет событий с напоминаниями.",
-            reply_markup=reply_markup
-        )
-        return CHOOSING_ACTION
-    
-    keyboard = []
-    for event in events:
-        event_id, name, date, time = event
-        keyboard.append([InlineKeyboardButton(f"{name} ({date} {time})", callback_data=f"delete_reminder_event_{event_id}")])
-    
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text(
-        text="Выберите событие, для которого хотите удалить напоминание:",
-        reply_markup=reply_markup
+    return await show_event_page(
+        update, "remdel",
+        title="Выберите событие, для которого хотите удалить напоминание:",
+        empty_text="У вас нет событий с напоминаниями.",
+        state=CHOOSING_EVENT_FOR_REMINDER
     )
-    
-    return CHOOSING_EVENT_FOR_REMINDER
 
 # Показать список напоминаний для удаления
 async def show_reminders_for_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -131,36 +134,30 @@ async def show_reminders_for_deletion(update: Update, context: ContextTypes.DEFA
     event_id = int(query.data.split("_")[3])
     context.user_data["event_id_for_reminder_deletion"] = event_id
     
-    # Получаем информацию о событии
-    event = database.get_event(event_id)
+    # Получаем информацию о событии вместе с напоминаниями
+    details = await async_database.get_event_details(event_id, update.effective_user.id)
     
-    if not event:
+    if not details:
         await query.edit_message_text(text="Событие не найдено.")
         return await show_main_menu(update, context)
     
-    name, date, time = event
+    (name, date, time, rrule, exdates), reminders = details
     context.user_data["event_name_for_reminder_deletion"] = name
     
-    # Получаем напоминания для события
-    reminders = database.get_event_reminders(event_id)
-    
     if not reminders:
-        keyboard = [[InlineKeyboardButton("Назад", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.edit_message_text(
             text=f"У события '{name}' нет напоминаний.",
-            reply_markup=reply_markup
+            reply_markup=keyboards.BACK_TO_MENU
         )
         return CHOOSING_ACTION
     
     keyboard = []
     for reminder in reminders:
-        reminder_id, reminder_date, reminder_time = reminder
-        keyboard.append([InlineKeyboardButton(f"{reminder_date} в {reminder_time}", callback_data=f"delete_reminder_{reminder_id}")])
+        reminder_id, reminder_date, reminder_time, offset_minutes = reminder
+        keyboard.append([(describe_reminder(reminder_date, reminder_time, offset_minutes), f"delete_reminder_{reminder_id}")])
     
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard.append([("Назад", "back_to_menu")])
+    reply_markup = keyboards.build_keyboard(keyboard)
     
     await query.edit_message_text(
         text=f"Выберите напоминание для события '{name}' ({date} {time}) для удаления:",
@@ -178,24 +175,20 @@ async def confirm_reminder_deletion(update: Update, context: ContextTypes.DEFAUL
     context.user_data["reminder_id_to_delete"] = reminder_id
     
     # Получаем информацию о напоминании
-    reminder = database.get_reminder(reminder_id)
+    reminder = await async_database.get_reminder(reminder_id)
     
     if not reminder:
         await query.edit_message_text(text="Напоминание не найдено.")
         return await show_main_menu(update, context)
     
-    reminder_date, reminder_time = reminder
+    reminder_date, reminder_time, offset_minutes = reminder
     
-    keyboard = [
-        [InlineKeyboardButton("Да, удалить", callback_data=f"confirm_delete_reminder_{reminder_id}")],
-        [InlineKeyboardButton("Нет, отменить", callback_data="back_to_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = keyboards.confirm_reminder_deletion(reminder_id)
     
     event_name = context.user_data.get("event_name_for_reminder_deletion", "")
     
     await query.edit_message_text(
-        text=f"Вы уверены, что хотите удалить напоминание на {reminder_date} в {reminder_time} для события '{event_name}'?",
+        text=f"Вы уверены, что хотите удалить напоминание ({describe_reminder(reminder_date, reminder_time, offset_minutes)}) для события '{event_name}'?",
         reply_markup=reply_markup
     )
     
@@ -209,14 +202,11 @@ async def delete_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     reminder_id = int(query.data.split("_")[3])
     
     # Удаляем напоминание
-    database.delete_reminder(reminder_id)
-    
-    keyboard = [[InlineKeyboardButton("Назад в главное меню", callback_data="back_to_menu")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await async_database.delete_reminder(reminder_id)
     
     await query.edit_message_text(
         text="Напоминание успешно удалено.",
-        reply_markup=reply_markup
+        reply_markup=keyboards.BACK_TO_MAIN_MENU
     )
     
     return CHOOSING_ACTION
\ No newline at end of file
@@ -1,23 +1,18 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import datetime
+from telegram import Update
 from telegram.ext import ContextTypes
 
-import config
-from .common import CHOOSING_ACTION, CHOOSING_TIMEZONE, get_user_current_time, set_user_timezone
+import async_database
+from timeutils import get_timezone
+from .common import CHOOSING_ACTION, CHOOSING_TIMEZONE
+from .keyboards import TIMEZONE_SELECTION, BACK_TO_MAIN_MENU
 
 # Показать выбор часового пояса
 async def show_timezone_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    keyboard = []
-    
-    # Создаем кнопки для каждого доступного часового пояса
-    for tz in config.AVAILABLE_TIMEZONES:
-        keyboard.append([InlineKeyboardButton(tz, callback_data=f"tz_{tz}")])
-    
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    # Клавиатура с кнопками доступных часовых поясов создается при запуске бота
     await update.callback_query.edit_message_text(
         text="Выберите ваш часовой пояс:",
-        reply_markup=reply_markup
+        reply_markup=TIMEZONE_SELECTION
     )
     
     return CHOOSING_TIMEZONE
@@ -31,19 +26,16 @@ async def set_timezone_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id = update.effective_user.id
     
     # Сохраняем часовой пояс пользователя
-    set_user_timezone(user_id, timezone)
+    await async_database.set_user_timezone(user_id, timezone)
     
     # Получаем текущее время в выбранном часовом поясе
-    now = get_user_current_time(user_id)
+    now = datetime.datetime.now(get_timezone(timezone))
     formatted_date = now.strftime("%d.%m.%Y")
     formatted_time = now.strftime("%H:%M:%S")
     
-    keyboard = [[InlineKeyboardButton("Назад в главное меню", callback_data="back_to_menu")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
         text=f"Часовой пояс установлен: {timezone}\n\nТекущая дата: {formatted_date}\nТекущее время: {formatted_time}",
-        reply_markup=reply_markup
+        reply_markup=BACK_TO_MAIN_MENU
     )
     
     return CHOOSING_ACTION
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Потоковый разбор файлов для импорта событий: iCalendar (.ics) и CSV.
+
+Парсеры читают файл построчно и выдают события по одному, поэтому объем
+памяти не зависит от размера календаря. Каждое событие приводится
+к локальному времени пользователя в форматах бота (ДД.ММ.ГГГГ и ЧЧ:ММ).
+Ошибочные записи не прерывают импорт: вместо события выдается RowError
+с номером строки и описанием проблемы.
+"""
+
+import csv
+import datetime
+import re
+from collections import namedtuple
+
+import pytz
+
+import recurrence
+from timeutils import DATE_FORMAT, TIME_FORMAT, get_timezone, localize, parse_local
+
+# Максимальная длина названия события
+MAX_NAME_LENGTH = 256
+
+# Событие для импорта: reminders - список пар (дата, время) в локальном времени пользователя,
+# rrule и exdates - правило повторения и даты-исключения серии (см. recurrence.py)
+ImportedEvent = namedtuple(
+    "ImportedEvent", ["name", "event_date", "event_time", "reminders", "rrule", "exdates"],
+    defaults=(None, None)
+)
+
+# Ошибка в записи файла: line - номер строки, с которой начинается запись
+RowError = namedtuple("RowError", ["line", "message"])
+
+
+# Функция для проверки даты и времени и приведения их к виду ДД.ММ.ГГГГ и ЧЧ:ММ
+def _normalize(date_str, time_str):
+    local = parse_local((date_str or "").strip(), (time_str or "").strip())
+    return local.strftime(DATE_FORMAT), local.strftime(TIME_FORMAT)
+
+
+# Функция для проверки и нормализации полей события
+def _validate(name, event_date, event_time):
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("пустое название события")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"название длиннее {MAX_NAME_LENGTH} символов")
+    
+    event_date, event_time = _normalize(event_date, event_time)
+    return name, event_date, event_time
+
+
+# Функция для определения формата файла по имени
+def detect_format(file_name):
+    file_name = (file_name or "").lower()
+    if file_name.endswith((".ics", ".ical", ".ifb", ".icalendar")):
+        return "ics"
+    if file_name.endswith((".csv", ".txt")):
+        return "csv"
+    return None
+
+
+# Названия колонок даты и времени в строке заголовка CSV
+CSV_DATE_COLUMNS = {"дата", "date"}
+CSV_TIME_COLUMNS = {"время", "time"}
+
+
+# Функция для проверки, является ли строка CSV заголовком: во второй и третьей
+# колонках стоят названия колонок даты и времени
+def _is_csv_header(row):
+    if len(row) < 3:
+        return False
+    return (
+        row[1].strip().lower() in CSV_DATE_COLUMNS
+        and row[2].strip().lower() in CSV_TIME_COLUMNS
+    )
+
+
+# Разбор CSV.
+# Колонки: название, дата (ДД.ММ.ГГГГ), время (ЧЧ:ММ) и необязательная колонка
+# напоминаний в формате "ДД.ММ.ГГГГ ЧЧ:ММ", несколько значений через ";".
+# Первая строка пропускается, если это заголовок (см. _is_csv_header); иначе
+# она разбирается и при ошибке попадает в отчет, как и остальные строки.
+def iter_csv(lines):
+    reader = csv.reader(lines)
+    for row in reader:
+        line = reader.line_num
+        if not row or all(not cell.strip() for cell in row):
+            continue
+        
+        if line == 1 and _is_csv_header(row):
+            continue
+        
+        if len(row) < 3:
+            yield RowError(line, "ожидается не менее трех колонок: название, дата, время")
+            continue
+        
+        try:
+            name, event_date, event_time = _validate(row[0], row[1], row[2])
+            reminders = []
+            if len(row) > 3 and row[3].strip():
+                for value in row[3].split(";"):
+                    reminder_date, _, reminder_time = value.strip().partition(" ")
+                    reminders.append(_normalize(reminder_date, reminder_time))
+        except ValueError as e:
+            yield RowError(line, str(e))
+            continue
+        
+        yield ImportedEvent(name, event_date, event_time, reminders)
+
+
+_DURATION_RE = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+
+# Функция для разбора длительности iCalendar (например, -PT15M или -P1D)
+def parse_duration(value):
+    match = _DURATION_RE.match(value.strip())
+    if not match or value.strip() in ("P", "-P", "+P", "PT", "-PT", "+PT"):
+        raise ValueError(f"некорректная длительность: {value}")
+    
+    parts = {key: int(number or 0) for key, number in match.groupdict().items() if key != "sign"}
+    duration = datetime.timedelta(**parts)
+    return -duration if match.group("sign") == "-" else duration
+
+
+# Функция для разбора значения даты-времени iCalendar в aware datetime.
+# params - параметры свойства (TZID, VALUE), default_timezone - часовой пояс
+# для «плавающего» времени без указания пояса.
+def parse_datetime(value, params, default_timezone):
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or re.fullmatch(r"\d{8}", value):
+        local = datetime.datetime.strptime(value, "%Y%m%d")
+        return localize(default_timezone, local)
+    
+    if value.endswith("Z"):
+        return pytz.utc.localize(datetime.datetime.strptime(value[:-1], "%Y%m%dT%H%M%S"))
+    
+    local = datetime.datetime.strptime(value, "%Y%m%dT%H%M%S")
+    timezone = default_timezone
+    if "TZID" in params:
+        try:
+            timezone = get_timezone(params["TZID"].strip('"'))
+        except pytz.UnknownTimeZoneError:
+            pass
+    return localize(timezone, local)
+
+
+# Функция для разбора строки свойства iCalendar: NAME;PARAM=VALUE:значение
+def _parse_property(line):
+    head, _, value = line.partition(":")
+    name, *raw_params = head.split(";")
+    params = {}
+    for raw in raw_params:
+        key, _, param_value = raw.partition("=")
+        params[key.upper()] = param_value
+    return name.upper(), params, value
+
+
+# Функция для снятия экранирования текстовых значений iCalendar
+def _unescape(value):
+    return (value.replace("\\n", " ").replace("\\N", " ")
+            .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+# Функция для склейки «свернутых» строк iCalendar (продолжение начинается с пробела)
+def _unfold(lines):
+    buffer = None
+    start_line = 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and buffer is not None:
+            buffer += line[1:]
+            continue
+        if buffer is not None:
+            yield start_line, buffer
+        buffer = line
+        start_line = number
+    if buffer is not None:
+        yield start_line, buffer
+
+
+# Разбор iCalendar. Поддерживаются VEVENT со SUMMARY, DTSTART, RRULE и EXDATE
+# и вложенные VALARM с TRIGGER (относительным или абсолютным). Время переводится
+# в часовой пояс пользователя timezone_str.
+def iter_ics(lines, timezone_str):
+    timezone = get_timezone(timezone_str)
+    event = None
+    alarm = None
+    
+    for line_number, line in _unfold(lines):
+        if not line:
+            continue
+        name, params, value = _parse_property(line)
+        
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {"line": line_number, "alarms": []}
+        elif event is None:
+            continue
+        elif name == "BEGIN" and value.upper() == "VALARM":
+            alarm = {}
+        elif name == "END" and value.upper() == "VALARM":
+            if alarm is not None and "trigger" in alarm:
+                event["alarms"].append(alarm["trigger"])
+            alarm = None
+        elif alarm is not None:
+            if name == "TRIGGER":
+                alarm["trigger"] = (params, value)
+        elif name == "SUMMARY":
+            event["summary"] = _unescape(value)
+        elif name == "DTSTART":
+            event["dtstart"] = (params, value)
+        elif name == "RRULE":
+            event["rrule"] = value
+        elif name == "EXDATE":
+            event.setdefault("exdates", []).extend((params, item) for item in value.split(","))
+        elif name == "END" and value.upper() == "VEVENT":
+            yield _build_ics_event(event, timezone)
+            event = None
+
+
+# Функция для преобразования разобранного VEVENT в событие для импорта
+def _build_ics_event(event, timezone):
+    line = event["line"]
+    if "dtstart" not in event:
+        return RowError(line, "у события нет DTSTART")
+    
+    try:
+        starts = parse_datetime(event["dtstart"][1], event["dtstart"][0], timezone).astimezone(timezone)
+        name, event_date, event_time = _validate(
+            event.get("summary"), starts.strftime(DATE_FORMAT), starts.strftime(TIME_FORMAT)
+        )
+        
+        reminders = []
+        for params, value in event["alarms"]:
+            if params.get("VALUE") == "DATE-TIME":
+                fires = parse_datetime(value, {}, timezone)
+            else:
+                fires = starts + parse_duration(value)
+            fires = fires.astimezone(timezone)
+            reminders.append((fires.strftime(DATE_FORMAT), fires.strftime(TIME_FORMAT)))
+        
+        rrule = exdates = None
+        if "rrule" in event:
+            rrule = _local_rrule(event["rrule"], timezone)
+            exdates = recurrence.format_exdates({
+                parse_datetime(value, params, timezone).astimezone(timezone).strftime(DATE_FORMAT)
+                for params, value in event.get("exdates", [])
+            })
+    except ValueError as e:
+        return RowError(line, str(e))
+    
+    return ImportedEvent(name, event_date, event_time, reminders, rrule, exdates)
+
+
+# Функция для проверки RRULE и перевода UNTIL в UTC в локальное время пользователя
+def _local_rrule(value, timezone):
+    parts = []
+    for item in value.split(";"):
+        key, _, until = item.partition("=")
+        if key.upper() == "UNTIL" and until.endswith("Z"):
+            local = parse_datetime(until, {}, timezone).astimezone(timezone)
+            item = f"UNTIL={local.strftime('%Y%m%dT%H%M%S')}"
+        parts.append(item)
+    return recurrence.format_rrule(recurrence.parse_rrule(";".join(parts)))
@@ -0,0 +1,190 @@
+"""
+Настройка логирования процессов бота, планировщика и маршрутизатора.
+
+Обработчики и планировщик работают в цикле событий asyncio, поэтому запись
+в файл вынесена из него: корневой логгер получает QueueHandler, который
+только кладет запись в очередь, а в файл ее пишет отдельный поток
+QueueListener. Задержка диска не останавливает получение обновлений
+и отправку напоминаний.
+
+Записи пишутся по одной на строку в формате JSON (LOG_FORMAT = "json")
+или текстом, как раньше (LOG_FORMAT = "text"). Поля, переданные через
+extra (например, user_id), попадают в запись JSON отдельными ключами.
+Файл ротируется по размеру (LOG_MAX_BYTES) или по времени (LOG_ROTATE_WHEN).
+
+Частые сообщения о действиях пользователя помечаются extra={"sampled": True,
+"user_id": ...}: от одного пользователя в файл попадает не больше
+LOG_SAMPLE_LIMIT таких сообщений каждого вида за LOG_SAMPLE_INTERVAL секунд,
+а число пропущенных указывается в следующей записи (поле suppressed).
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+LOG_FORMAT_JSON = "json"
+LOG_FORMAT_TEXT = "text"
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+DEFAULT_LOG_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_LOG_BACKUP_COUNT = 5
+DEFAULT_LOG_SAMPLE_LIMIT = 5
+DEFAULT_LOG_SAMPLE_INTERVAL = 60
+
+# Атрибуты LogRecord, которые не являются полями, переданными через extra
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES and name != "sampled":
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Ограничение числа частых сообщений от одного пользователя.
+
+    Ограничиваются только записи с атрибутом sampled; вид сообщения
+    определяется его шаблоном (msg до подстановки аргументов).
+    """
+
+    def __init__(self, limit, interval):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._window_started = time.monotonic()
+        # (user_id, шаблон) -> [записано в текущем окне, пропущено]
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False):
+            return True
+
+        key = (getattr(record, "user_id", None), record.msg)
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_started >= self.interval:
+                # Новое окно: пропущенные в прошлом окне указываются в первой записи
+                self._counts = {key: [0, counts[1]] for key, counts in self._counts.items() if counts[1]}
+                self._window_started = now
+            counts = self._counts.setdefault(key, [0, 0])
+            if counts[0] >= self.limit:
+                counts[1] += 1
+                return False
+            counts[0] += 1
+            suppressed, counts[1] = counts[1], 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись в потоке цикла событий.
+
+    Стандартный QueueHandler.prepare подставляет аргументы и трассировку
+    в текст сообщения; здесь подставляются только аргументы (их объекты
+    могут измениться до записи), а поля extra и исключение остаются
+    отдельными для форматтера в потоке записи.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Функция для создания обработчика записи в файл с ротацией по настройкам из config.py
+def _create_file_handler(filename):
+    backup_count = getattr(config, "LOG_BACKUP_COUNT", DEFAULT_LOG_BACKUP_COUNT)
+    when = getattr(config, "LOG_ROTATE_WHEN", None)
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(
+            filename, when=when, backupCount=backup_count, encoding="utf-8"
+        )
+    return logging.handlers.RotatingFileHandler(
+        filename,
+        maxBytes=getattr(config, "LOG_MAX_BYTES", DEFAULT_LOG_MAX_BYTES),
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+
+
+# Функция для настройки логирования процесса: записи из всех потоков
+# передаются через очередь в поток, который пишет их в filename
+def setup_logging(filename, level=None):
+    global _listener
+    if _listener is not None:
+        return
+
+    if level is None:
+        level = getattr(logging, getattr(config, "LOG_LEVEL", "INFO"))
+
+    file_handler = _create_file_handler(filename)
+    if getattr(config, "LOG_FORMAT", LOG_FORMAT_JSON) == LOG_FORMAT_TEXT:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(
+        getattr(config, "LOG_SAMPLE_LIMIT", DEFAULT_LOG_SAMPLE_LIMIT),
+        getattr(config, "LOG_SAMPLE_INTERVAL", DEFAULT_LOG_SAMPLE_INTERVAL),
+    ))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+# Функция для записи оставшихся в очереди сообщений и остановки потока записи
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import os
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, ConversationHandler, MessageHandler, filters
 
 # Импорт конфигурации
@@ -9,13 +11,16 @@ except ImportError:
     exit(1)
 
 # Импорт модулей
+import async_database
 import database
+import metrics
 from handlers.common import (
     CHOOSING_ACTION, ADDING_EVENT_NAME, ADDING_EVENT_DATE, ADDING_EVENT_TIME,
     ADDING_REMINDER, CHOOSING_EVENT_FOR_REMINDER, ADDING_REMINDER_DATE,
     ADDING_REMINDER_TIME, CHOOSING_EVENT_TO_VIEW, CHOOSING_TIMEZONE,
     CHOOSING_EVENT_TO_DELETE, CONFIRMING_EVENT_DELETION,
-    CHOOSING_REMINDER_TO_DELETE, CONFIRMING_REMINDER_DELETION,
+    CHOOSING_REMINDER_TO_DELETE, CONFIRMING_REMINDER_DELETION, IMPORTING_FILE,
+    CHOOSING_RECURRENCE, ENTERING_RECURRENCE_END, STATE_NAMES,
     show_main_menu, handle_menu_choice, cancel
 )
 from handlers.event_handlers import (
@@ -31,15 +36,33 @@ from handlers.reminder_handlers import (
 from handlers.settings_handlers import (
     show_timezone_selection, set_timezone_handler
 )
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL),
-    filename=config.LOG_FILE
+from handlers.import_handlers import request_import_file, import_file
+from handlers.export_handlers import export_events
+from handlers.recurrence_handlers import (
+    show_recurrence_options, choose_recurrence_frequency, set_recurrence_end, skip_occurrence
+)
+from feed_server import start_feed_server
+from logging_setup import setup_logging
+from persistence import SQLitePersistence, DEFAULT_UPDATE_INTERVAL, DEFAULT_IDLE_TIMEOUT
+from update_processor import PerUserUpdateProcessor
+from update_router import get_worker_index, create_worker_server
+from webhook_server import run_webhook
+from reminder_scheduler import (
+    SCHEDULER_MODE_PROCESS, SCHEDULER_MODE_EMBEDDED, start_embedded, stop_embedded
 )
+
 logger = logging.getLogger(__name__)
 
+# Режимы получения обновлений от Telegram
+BOT_MODE_POLLING = "polling"
+BOT_MODE_WEBHOOK = "webhook"
+
+# Число обновлений, обрабатываемых одновременно (1 - по одному, как раньше)
+DEFAULT_CONCURRENT_UPDATES = 1
+
+# Через сколько секунд без действий пользователя разговор завершается
+DEFAULT_CONVERSATION_TIMEOUT = 3600
+
 # Команда /start
 async def start(update: ContextTypes.DEFAULT_TYPE, context) -> int:
     user = update.effective_user
@@ -48,19 +71,84 @@ async def start(update: ContextTypes.DEFAULT_TYPE, context) -> int:
     )
     return await show_main_menu(update, context)
 
-def main():
-    # Инициализация базы данных
-    database.init_db()
+# Запуск фоновых задач после инициализации приложения
+async def post_init(application: Application) -> None:
+    worker_index = get_worker_index()
+    server = await metrics.start_metrics_server(offset=worker_index or 0)
+    if server is not None:
+        application.bot_data["metrics_server"] = server
+    
+    # При нескольких процессах бота общие фоновые задачи выполняет только первый
+    if worker_index not in (None, 0):
+        return
+    
+    application.bot_data["db_checkpoints"] = asyncio.create_task(async_database.run_checkpoints())
+    await async_database.resume_reprojections()
+    
+    if getattr(config, "SCHEDULER_MODE", SCHEDULER_MODE_PROCESS) == SCHEDULER_MODE_EMBEDDED:
+        application.bot_data["reminder_scheduler"] = start_embedded(application.bot)
+    
+    feed = await start_feed_server()
+    if feed is not None:
+        application.bot_data["feed_server"] = feed
+
+# Остановка фоновых задач перед завершением приложения
+async def post_stop(application: Application) -> None:
+    feed = application.bot_data.pop("feed_server", None)
+    if feed is not None:
+        await feed.stop()
+    
+    handle = application.bot_data.pop("reminder_scheduler", None)
+    if handle is not None:
+        await stop_embedded(handle)
+    
+    checkpoints = application.bot_data.pop("db_checkpoints", None)
+    if checkpoints is not None:
+        checkpoints.cancel()
+    
+    server = application.bot_data.pop("metrics_server", None)
+    if server is not None:
+        await server.stop()
+
+# Функция для создания приложения бота со всеми обработчиками.
+# base_url позволяет направить запросы к Bot API на другой сервер
+# (например, на заглушку в бенчмарках).
+def build_application(base_url=None):
+    conversation_timeout = getattr(config, "CONVERSATION_TIMEOUT", DEFAULT_CONVERSATION_TIMEOUT) or None
+    
+    # Состояние разговоров и user_data хранятся в базе данных и переживают перезапуск бота
+    persistence = SQLitePersistence(
+        update_interval=getattr(config, "PERSISTENCE_UPDATE_INTERVAL", DEFAULT_UPDATE_INTERVAL),
+        idle_timeout=getattr(config, "USER_DATA_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT),
+        conversation_timeout=conversation_timeout,
+    )
     
     # Создание приложения
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .persistence(persistence)
+        .concurrent_updates(PerUserUpdateProcessor(
+            getattr(config, "CONCURRENT_UPDATES", DEFAULT_CONCURRENT_UPDATES)
+        ))
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
     
     # Создание обработчика разговора
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[
+            CommandHandler("start", start),
+            CommandHandler("import", request_import_file),
+        ],
         states={
             CHOOSING_ACTION: [
-                CallbackQueryHandler(handle_menu_choice, pattern="^(add_event|add_reminder|view_events|delete_event|delete_reminder|current_time|set_timezone)$"),
+                CallbackQueryHandler(handle_menu_choice, pattern="^(add_event|add_reminder|view_events|delete_event|delete_reminder|current_time|set_timezone|import_events)$"),
+                CallbackQueryHandler(show_recurrence_options, pattern="^recur_[0-9]+$"),
+                CallbackQueryHandler(skip_occurrence, pattern="^skip_[0-9]+$"),
                 CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
             ],
             ADDING_EVENT_NAME: [
@@ -78,6 +166,8 @@ def main():
             ],
             CHOOSING_EVENT_FOR_REMINDER: [
                 CallbackQueryHandler(choose_event_for_reminder, pattern="^event_[0-9]+$"),
+                CallbackQueryHandler(show_events_for_reminder, pattern="^page_rem_"),
+                CallbackQueryHandler(show_events_for_reminder_deletion, pattern="^page_remdel_"),
                 CallbackQueryHandler(show_reminders_for_deletion, pattern="^delete_reminder_event_[0-9]+$"),
                 CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
             ],
@@ -89,6 +179,7 @@ def main():
             ],
             CHOOSING_EVENT_TO_VIEW: [
                 CallbackQueryHandler(view_event_details, pattern="^view_event_[0-9]+$"),
+                CallbackQueryHandler(show_events, pattern="^page_view_"),
                 CallbackQueryHandler(confirm_event_deletion, pattern="^delete_event_[0-9]+$"),
                 CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
             ],
@@ -98,6 +189,7 @@ def main():
             ],
             CHOOSING_EVENT_TO_DELETE: [
                 CallbackQueryHandler(confirm_event_deletion, pattern="^delete_event_[0-9]+$"),
+                CallbackQueryHandler(show_events_for_deletion, pattern="^page_del_"),
                 CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
             ],
             CONFIRMING_EVENT_DELETION: [
@@ -112,15 +204,67 @@ def main():
                 CallbackQueryHandler(delete_reminder, pattern="^confirm_delete_reminder_[0-9]+$"),
                 CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
             ],
+            CHOOSING_RECURRENCE: [
+                CallbackQueryHandler(choose_recurrence_frequency, pattern="^rrule_[0-9]+_(DAILY|WEEKLY|MONTHLY|NONE)$"),
+                CallbackQueryHandler(view_event_details, pattern="^view_event_[0-9]+$"),
+                CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
+            ],
+            ENTERING_RECURRENCE_END: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, set_recurrence_end)
+            ],
+            IMPORTING_FILE: [
+                MessageHandler(filters.Document.ALL, import_file),
+                CallbackQueryHandler(show_main_menu, pattern="^back_to_menu$"),
+            ],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[
+            CommandHandler("cancel", cancel),
+            CommandHandler("import", request_import_file),
+        ],
+        name="calendar",
+        persistent=True,
+        conversation_timeout=conversation_timeout,
     )
     
+    # Время работы обработчиков по состояниям разговора (метрики)
+    metrics.instrument_handlers(conv_handler.entry_points, "entry")
+    for state, handlers in conv_handler.states.items():
+        metrics.instrument_handlers(handlers, STATE_NAMES.get(state, str(state)))
+    metrics.instrument_handlers(conv_handler.fallbacks, "fallback")
+    
     application.add_handler(conv_handler)
     
+    # Выгрузка календаря доступна из любого состояния разговора
+    application.add_handler(CommandHandler("export", export_events))
+    
+    return application
+
+def main():
+    # Процессы бота за маршрутизатором пишут логи в отдельные файлы (bot.0.log, bot.1.log, ...),
+    # чтобы ротация файла в одном процессе не мешала другим
+    worker_index = get_worker_index()
+    log_file = config.LOG_FILE
+    if worker_index is not None:
+        name, extension = os.path.splitext(log_file)
+        log_file = f"{name}.{worker_index}{extension}"
+    setup_logging(log_file)
+    
+    # Инициализация базы данных
+    database.init_db()
+    
+    application = build_application()
+    
     # Запуск бота
-    logger.info("Бот запущен")
-    application.run_polling()
+    if worker_index is not None:
+        # Обновления от Telegram получает маршрутизатор update_router (run.py при BOT_WORKERS > 1)
+        logger.info("Бот запущен как процесс %s", worker_index)
+        asyncio.run(run_webhook(application, create_worker_server(application, worker_index)))
+    elif getattr(config, "BOT_MODE", BOT_MODE_POLLING) == BOT_MODE_WEBHOOK:
+        logger.info("Бот запущен в режиме webhook")
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("Бот запущен")
+        application.run_polling()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
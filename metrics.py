@@ -0,0 +1,360 @@
+"""
+Метрики бота и планировщика напоминаний в текстовом формате Prometheus.
+
+Счетчики (Counter), гистограммы (Histogram) и показатели (Gauge) хранятся
+в памяти процесса и отдаются встроенным HTTP-сервером по адресу /metrics
+(METRICS_ENABLED, METRICS_HOST, METRICS_PORT; планировщик слушает на
+SCHEDULER_METRICS_PORT). Сервер написан на asyncio без дополнительных
+зависимостей, как и feed_server.
+
+Обновление метрики - это поиск по словарю и сложение под блокировкой
+(функции database.py выполняются в потоках), поэтому метрики можно
+обновлять на каждый вызов горячих путей.
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9100
+DEFAULT_SCHEDULER_METRICS_PORT = 9099
+
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_TIMEOUT = 10
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type = "counter"
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией при каждом чтении"""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self._functions = {}
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def set_function(self, function, labels=()):
+        """Значение будет браться из function() при каждом чтении (None - отключить)"""
+        with self._lock:
+            if function is None:
+                self._functions.pop(labels, None)
+            else:
+                self._functions[labels] = function
+
+    def value(self, labels=()):
+        function = self._functions.get(labels)
+        return function() if function is not None else self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for labels, function in functions.items():
+            try:
+                values[labels] = function()
+            except Exception as e:
+                logger.error("Ошибка при вычислении метрики %s: %s", self.name, e)
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}" for labels, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам с суммой и числом наблюдений"""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # [счетчики корзин (последняя - +Inf), сумма, число наблюдений]
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, labels=()):
+        entry = self._values.get(labels)
+        return entry[2] if entry is not None else 0
+
+    def time(self, labels=()):
+        """Контекстный менеджер, измеряющий длительность блока with"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = self._labels(labels, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, self.labels)
+
+
+# Метрики бота
+
+UPDATE_DURATION = Histogram(
+    "calendar_update_duration_seconds",
+    "Время обработки обновления Telegram (без ожидания в очереди пользователя)",
+)
+HANDLER_DURATION = Histogram(
+    "calendar_handler_duration_seconds",
+    "Время работы обработчика разговора по состоянию ConversationHandler",
+    ["state"],
+)
+
+# Метрики базы данных (вызовы database.* через async_database)
+
+DB_CALL_DURATION = Histogram(
+    "calendar_db_call_duration_seconds",
+    "Время выполнения функции database.* в потоке базы данных",
+    ["function"],
+)
+DB_STATEMENTS = Counter(
+    "calendar_db_statements_total",
+    "Число SQL-запросов, выполненных функцией database.*",
+    ["function"],
+)
+
+# Метрики планировщика напоминаний
+
+SCHEDULER_TICK_DURATION = Histogram(
+    "calendar_scheduler_tick_duration_seconds",
+    "Длительность итерации планировщика напоминаний",
+)
+SCHEDULER_BACKLOG = Gauge(
+    "calendar_scheduler_backlog",
+    "Наступившие напоминания, захваченные планировщиком и еще не доставленные",
+)
+DELIVERY_QUEUE_DEPTH = Gauge(
+    "calendar_delivery_queue_depth",
+    "Напоминания в очереди конвейера доставки",
+)
+REMINDERS_SENT = Counter(
+    "calendar_reminders_sent_total",
+    "Результаты доставки напоминаний (sent - отправлено, failed - окончательная ошибка)",
+    ["result"],
+)
+REMINDER_RETRIES = Counter(
+    "calendar_reminder_retries_total",
+    "Повторные попытки отправки напоминаний",
+)
+REMINDER_LATENESS = Histogram(
+    "calendar_reminder_lateness_seconds",
+    "Опоздание отправки напоминания относительно запланированного времени",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+
+# Функция для измерения времени работы обработчиков ConversationHandler:
+# callback каждого обработчика заменяется оберткой с меткой state
+def instrument_handlers(handlers, state):
+    for handler in handlers:
+        handler.callback = _timed_callback(handler.callback, (state,))
+
+
+def _timed_callback(callback, labels):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, labels)
+    return wrapper
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики процесса по адресу /metrics"""
+
+    def __init__(self, host=DEFAULT_METRICS_HOST, port=DEFAULT_METRICS_PORT, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Сервер метрик запущен на %s:%s%s", self.host, self.port, METRICS_PATH)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # Обработка одного запроса (соединение закрывается после ответа)
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            parts = request_line.decode("latin-1").split()
+            while (await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)).strip():
+                pass
+
+            if len(parts) != 3:
+                await self._send(writer, 400, "Bad Request")
+            elif parts[1].split("?", 1)[0] != METRICS_PATH:
+                await self._send(writer, 404, "Not Found")
+            elif parts[0].upper() != "GET":
+                await self._send(writer, 405, "Method Not Allowed")
+            else:
+                await self._send(writer, 200, "OK", self.registry.render().encode("utf-8"))
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error("Ошибка при обработке запроса метрик: %s", e)
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, reason, body=b""):
+        writer.write((
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode("latin-1") + body)
+        await writer.drain()
+
+
+# Функция для запуска сервера метрик по настройкам из config.py (None, если отключен).
+# Процессы бота за маршрутизатором (BOT_WORKERS > 1) занимают соседние порты.
+async def start_metrics_server(port=None, offset=0):
+    if not getattr(config, "METRICS_ENABLED", False):
+        return None
+    if port is None:
+        port = getattr(config, "METRICS_PORT", DEFAULT_METRICS_PORT)
+
+    server = MetricsServer(getattr(config, "METRICS_HOST", DEFAULT_METRICS_HOST), port + offset)
+    try:
+        await server.start()
+    except OSError as e:
+        logger.error("Не удалось запустить сервер метрик: %s", e)
+        return None
+    return server
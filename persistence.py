@@ -0,0 +1,159 @@
+"""
+Хранение состояния разговоров и context.user_data в базе данных SQLite.
+
+Без него ConversationHandler держит состояния (ADDING_EVENT_DATE и другие)
+и user_data (event_name, event_id, ...) только в памяти, и после перезапуска
+бота начатые диалоги терялись. SQLitePersistence сохраняет их в таблицы
+conversations и user_data.
+
+Запись отложенная: Application раз в update_interval секунд передает
+изменившиеся данные в методы update_*, а SQLitePersistence накапливает их
+и записывает одной транзакцией в потоке-писателе; при остановке бота
+оставшиеся изменения записывает flush. user_data загружается из базы при
+первом обновлении пользователя, а данные пользователей, не активных дольше
+idle_timeout, после записи освобождаются из памяти (в Application остается
+пустой словарь, который заполнится снова при следующем обновлении).
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import async_database
+import database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPDATE_INTERVAL = 10
+DEFAULT_IDLE_TIMEOUT = 3600
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранение состояний ConversationHandler и user_data в базе данных бота"""
+
+    def __init__(self, update_interval=DEFAULT_UPDATE_INTERVAL, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 conversation_timeout=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # Пользователь освобождается из памяти только после записи его изменений,
+        # поэтому тайм-аут не может быть короче двух интервалов записи
+        self.idle_timeout = max(idle_timeout, 2 * update_interval) if idle_timeout else 0
+        self.conversation_timeout = conversation_timeout
+        # Накопленные изменения: (имя разговора, ключ) -> состояние и user_id -> JSON
+        self._pending_conversations = {}
+        self._pending_user_data = {}
+        # Загруженные пользователи: user_id -> [user_data из Application, время последнего обновления]
+        self._users = {}
+        self._write_task = None
+
+    # Загрузка
+
+    async def get_conversations(self, name):
+        rows = await async_database.run_write(database.get_conversations, name, self.conversation_timeout)
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    # user_data загружается по одному пользователю в refresh_user_data
+    async def get_user_data(self):
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        entry = self._users.get(user_id)
+        if entry is None:
+            stored = await async_database.run_read(database.get_user_data, user_id)
+            if stored is not None and not user_data:
+                user_data.update(json.loads(stored))
+            entry = self._users[user_id] = [user_data, 0]
+        entry[1] = time.monotonic()
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # Изменения
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_write()
+
+    async def update_user_data(self, user_id, data):
+        try:
+            self._pending_user_data[user_id] = json.dumps(data, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.error("Не удалось сохранить user_data пользователя %s: %s", user_id, e)
+            return
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._users.pop(user_id, None)
+        self._pending_user_data[user_id] = None
+        self._schedule_write()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Запись
+
+    # Application вызывает update_* для всех изменений сразу, поэтому запись
+    # запускается отдельной задачей: она выполнится после того, как все
+    # изменения этого цикла будут накоплены, и запишет их одной транзакцией
+    def _schedule_write(self):
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self):
+        conversations = [(name, key, state) for (name, key), state in self._pending_conversations.items()]
+        user_data = list(self._pending_user_data.items())
+        self._pending_conversations = {}
+        self._pending_user_data = {}
+        if conversations or user_data:
+            try:
+                await async_database.run_write(database.save_conversation_state, conversations, user_data)
+            except Exception as e:
+                logger.error("Ошибка при сохранении состояния разговоров: %s", e)
+                # Изменения вернутся в очередь, если их не перекрыли более новые
+                for name, key, state in conversations:
+                    self._pending_conversations.setdefault((name, key), state)
+                for user_id, data in user_data:
+                    self._pending_user_data.setdefault(user_id, data)
+                return
+        self._evict_idle_users()
+
+    # Освобождение памяти от user_data пользователей без недавних обновлений
+    def _evict_idle_users(self):
+        if not self.idle_timeout:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        for user_id, (user_data, last_seen) in list(self._users.items()):
+            if last_seen < deadline and user_id not in self._pending_user_data:
+                user_data.clear()
+                del self._users[user_id]
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        await self._write()
@@ -0,0 +1,240 @@
+"""
+Повторяющиеся события в стиле RRULE (RFC 5545).
+
+Серия хранится одной строкой events: время первого повторения (event_date,
+event_time), правило повторения rrule и даты-исключения exdates. Повторения
+не сохраняются в базе данных, а вычисляются лениво: iter_occurrences сразу
+переходит к периоду, в который попадает начало окна запроса, и выдает
+повторения по одному, поэтому стоимость не зависит от давности начала серии.
+
+Поддерживается подмножество RRULE: FREQ=DAILY|WEEKLY|MONTHLY, INTERVAL,
+COUNT или UNTIL и BYDAY для еженедельных правил. Повторения вычисляются
+в локальном времени пользователя: еженедельная встреча в 10:00 остается
+в 10:00 и после перехода на летнее время.
+"""
+
+import calendar
+import datetime
+import itertools
+from collections import namedtuple
+
+from timeutils import DATE_FORMAT, TIME_FORMAT
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+
+# Максимальное число повторений в правиле с COUNT
+MAX_COUNT = 1000
+
+# Сколько периодов подряд без повторений допускается (например, 31-е число
+# в ежемесячном правиле): ограничивает перебор для правил без повторений
+MAX_EMPTY_PERIODS = 1000
+
+_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+_WEEKDAY_NAMES = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+_FREQUENCY_NAMES = {"DAILY": "ежедневно", "WEEKLY": "еженедельно", "MONTHLY": "ежемесячно"}
+_INTERVAL_UNITS = {"DAILY": "дн.", "WEEKLY": "нед.", "MONTHLY": "мес."}
+
+# Правило повторения: until - локальные дата и время (datetime без часового пояса),
+# byday - номера дней недели (0 - понедельник) для еженедельного правила
+Rule = namedtuple("Rule", ["freq", "interval", "count", "until", "byday"])
+
+
+# Функция для разбора строки RRULE (например, FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=10).
+# Значение UNTIL в UTC (с суффиксом Z) нужно предварительно перевести в локальное время.
+def parse_rrule(text):
+    parts = {}
+    for item in (text or "").strip().split(";"):
+        if not item:
+            continue
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"некорректная часть правила повторения: {item}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    freq = parts.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"неподдерживаемая частота повторения: {freq}")
+
+    try:
+        interval = int(parts.pop("INTERVAL", "1"))
+        count = int(parts.pop("COUNT")) if "COUNT" in parts else None
+    except ValueError:
+        raise ValueError("INTERVAL и COUNT должны быть целыми числами")
+    if interval < 1:
+        raise ValueError("INTERVAL должен быть положительным")
+    if count is not None and not 1 <= count <= MAX_COUNT:
+        raise ValueError(f"COUNT должен быть от 1 до {MAX_COUNT}")
+
+    until = None
+    if "UNTIL" in parts:
+        value = parts.pop("UNTIL").rstrip("Z")
+        try:
+            if "T" in value:
+                until = datetime.datetime.strptime(value, "%Y%m%dT%H%M%S")
+            else:
+                until = datetime.datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59)
+        except ValueError:
+            raise ValueError(f"некорректное значение UNTIL: {value}")
+    if count is not None and until is not None:
+        raise ValueError("COUNT и UNTIL нельзя указывать одновременно")
+
+    byday = ()
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY поддерживается только для еженедельных правил")
+        try:
+            byday = tuple(sorted({_WEEKDAYS.index(day.strip()) for day in parts.pop("BYDAY").split(",")}))
+        except ValueError:
+            raise ValueError("некорректное значение BYDAY")
+
+    # Служебный параметр, не влияющий на вычисление повторений
+    parts.pop("WKST", None)
+    if parts:
+        raise ValueError(f"неподдерживаемые параметры правила повторения: {', '.join(sorted(parts))}")
+
+    return Rule(freq, interval, count, until, byday)
+
+
+# Функция для записи правила в виде строки RRULE
+def format_rrule(rule):
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(_WEEKDAYS[day] for day in rule.byday))
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={rule.until.strftime('%Y%m%dT%H%M%S')}")
+    return ";".join(parts)
+
+
+# Функция для описания правила для пользователя (например, «еженедельно по пн, ср, 10 раз»)
+def describe(rule):
+    if rule.interval == 1:
+        text = _FREQUENCY_NAMES[rule.freq]
+    else:
+        text = f"каждые {rule.interval} {_INTERVAL_UNITS[rule.freq]}"
+    if rule.byday:
+        text += " по " + ", ".join(_WEEKDAY_NAMES[day] for day in rule.byday)
+    if rule.count is not None:
+        text += f", {rule.count} раз"
+    if rule.until is not None:
+        text += f", до {rule.until.strftime(DATE_FORMAT)}"
+    return text
+
+
+# Функции для хранения дат-исключений (ДД.ММ.ГГГГ) одной строкой через запятую
+def parse_exdates(text):
+    return {value for value in (text or "").split(",") if value}
+
+
+def format_exdates(exdates):
+    if not exdates:
+        return None
+    return ",".join(sorted(exdates, key=lambda value: datetime.datetime.strptime(value, DATE_FORMAT)))
+
+
+# Функция для получения даты-времени начала серии (первого повторения)
+def series_start(event_date, event_time):
+    return datetime.datetime.strptime(f"{event_date} {event_time}", f"{DATE_FORMAT} {TIME_FORMAT}")
+
+
+# Функция для сдвига даты на заданное число месяцев (None, если такого дня в месяце нет)
+def _add_months(value, months):
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    if value.day > calendar.monthrange(year, month)[1]:
+        return None
+    return value.replace(year=year, month=month)
+
+
+# Функция для получения номера периода, в который попадает момент after
+def _period_index(dtstart, rule, after):
+    if after is None or after <= dtstart:
+        return 0
+    if rule.freq == "DAILY":
+        periods = (after.date() - dtstart.date()).days
+    elif rule.freq == "WEEKLY":
+        week_start = dtstart.date() - datetime.timedelta(days=dtstart.weekday())
+        periods = (after.date() - week_start).days // 7
+    else:
+        periods = (after.year - dtstart.year) * 12 + after.month - dtstart.month
+    return max(0, periods // rule.interval)
+
+
+# Функция для получения повторений одного периода правила в хронологическом порядке
+def _period_occurrences(dtstart, rule, index):
+    if rule.freq == "DAILY":
+        return [dtstart + datetime.timedelta(days=index * rule.interval)]
+    if rule.freq == "WEEKLY":
+        week_start = dtstart - datetime.timedelta(days=dtstart.weekday())
+        week_start += datetime.timedelta(weeks=index * rule.interval)
+        days = rule.byday or (dtstart.weekday(),)
+        return [
+            occurrence for occurrence in (week_start + datetime.timedelta(days=day) for day in days)
+            if occurrence >= dtstart
+        ]
+    occurrence = _add_months(dtstart, index * rule.interval)
+    return [occurrence] if occurrence is not None else []
+
+
+# Генератор повторений серии (локальные datetime без часового пояса) в хронологическом порядке.
+# Выдает повторения не раньше after, пропуская даты-исключения exdates.
+# Для правил без COUNT перебор начинается сразу с периода, содержащего after;
+# правила с COUNT перебираются с начала, но не дальше MAX_COUNT повторений.
+# Бесконечные серии нужно ограничивать на стороне вызывающего (until или islice).
+def iter_occurrences(dtstart, rule, exdates=(), after=None, until=None):
+    index = 0 if rule.count is not None else _period_index(dtstart, rule, after)
+    produced = 0
+    empty_periods = 0
+
+    while True:
+        occurrences = _period_occurrences(dtstart, rule, index)
+        index += 1
+
+        if not occurrences:
+            empty_periods += 1
+            if empty_periods > MAX_EMPTY_PERIODS:
+                return
+            continue
+        empty_periods = 0
+
+        for occurrence in occurrences:
+            if rule.until is not None and occurrence > rule.until:
+                return
+            if until is not None and occurrence > until:
+                return
+            # Исключения не уменьшают счетчик COUNT (RFC 5545)
+            produced += 1
+            if rule.count is not None and produced > rule.count:
+                return
+            if after is not None and occurrence < after:
+                continue
+            if occurrence.strftime(DATE_FORMAT) in exdates:
+                continue
+            yield occurrence
+
+
+# Функция для получения ближайшего повторения не раньше after (None, если серия закончилась)
+def next_occurrence(dtstart, rule, exdates=(), after=None):
+    return next(iter_occurrences(dtstart, rule, exdates, after), None)
+
+
+# Функция для получения нескольких ближайших повторений не раньше after
+def upcoming_occurrences(dtstart, rule, exdates=(), after=None, limit=5):
+    return list(itertools.islice(iter_occurrences(dtstart, rule, exdates, after), limit))
+
+
+# Функция для получения верхней границы серии: момента, позже которого повторений нет.
+# Для бесконечных серий возвращает None.
+def series_end(dtstart, rule):
+    if rule.until is not None:
+        return rule.until
+    if rule.count is not None:
+        last = None
+        for last in iter_occurrences(dtstart, rule):
+            pass
+        return last or dtstart
+    return None
@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import namedtuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram Bot API по умолчанию: около 30 сообщений в секунду
+# на бота и не чаще одного сообщения в секунду в один личный чат
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_GLOBAL_RATE = 25
+DEFAULT_PER_CHAT_RATE = 1
+DEFAULT_MAX_RETRIES = 5
+
+# Задание на доставку: fire_at - плановое время отправки в секундах Unix
+ReminderJob = namedtuple("ReminderJob", ["reminder_id", "chat_id", "text", "fire_at"])
+
+
+class TokenBucket:
+    """Ограничитель частоты «ведро токенов».
+
+    Ведро пополняется со скоростью rate токенов в секунду до capacity.
+    acquire() ждет, пока не появится токен. pause() полностью блокирует
+    ведро на заданное время - так обрабатывается ответ Telegram RetryAfter.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Блокирует выдачу токенов на seconds секунд"""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def idle_since(self, now):
+        """Возвращает True, если ведро полное и его можно безопасно удалить"""
+        self._refill(now)
+        return self._tokens >= self.capacity and now >= self._paused_until
+
+    async def acquire(self):
+        """Ожидает и забирает один токен"""
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ReminderDelivery:
+    """Конвейер доставки напоминаний.
+
+    Задания помещаются в ограниченную очередь и отправляются пулом из workers
+    асинхронных обработчиков с учетом общего лимита бота и лимита на один чат.
+    Ответ RetryAfter приостанавливает общий лимит на указанное Telegram время,
+    сетевые ошибки повторяются с экспоненциальной задержкой. После окончательной
+    доставки или отказа вызывается on_complete(job, delivered).
+
+    Объект bot должен предоставлять корутину send_message(chat_id=..., text=...),
+    поэтому вместо telegram.Bot можно передать локальную заглушку.
+    """
+
+    def __init__(self, bot, on_complete=None, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 global_rate=DEFAULT_GLOBAL_RATE, per_chat_rate=DEFAULT_PER_CHAT_RATE,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        self.bot = bot
+        self.on_complete = on_complete
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._tasks = []
+        self.stats = {
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "in_flight": 0,
+            "last_lag": 0.0,
+            "max_lag": 0.0,
+        }
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        """Возвращает снимок метрик доставки"""
+        return dict(self.stats, queue_depth=self.queue_depth)
+
+    def start(self):
+        """Запускает обработчики очереди"""
+        for number in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"reminder-delivery-{number}"))
+
+    async def stop(self, drain=True):
+        """Останавливает обработчики, по умолчанию дождавшись опустошения очереди"""
+        if drain:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job):
+        """Ставит задание в очередь (ожидает, если очередь заполнена)"""
+        await self._queue.put(job)
+
+    async def join(self):
+        """Ожидает доставки всех поставленных в очередь заданий"""
+        await self._queue.join()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                self._prune_chat_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+
+    def _prune_chat_buckets(self):
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.idle_since(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.stats["in_flight"] += 1
+            try:
+                delivered = await self._deliver(job)
+                if self.on_complete is not None:
+                    self.on_complete(job, delivered)
+            except Exception as e:
+                logger.error("Ошибка при обработке напоминания %s: %s", job.reminder_id, e)
+            finally:
+                self.stats["in_flight"] -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, job):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                metrics.REMINDER_RETRIES.inc()
+            
+            await self._chat_bucket(job.chat_id).acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=job.chat_id, text=job.text)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning("Превышен лимит Telegram, пауза %s с", retry_after)
+                self._global_bucket.pause(retry_after)
+            except (Forbidden, BadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен - повторять бессмысленно
+                logger.error("Напоминание %s не доставлено пользователю %s: %s", job.reminder_id, job.chat_id, e)
+                break
+            except NetworkError as e:
+                delay = min(60, 2 ** attempt)
+                logger.warning("Сетевая ошибка при отправке напоминания %s: %s, повтор через %s с", job.reminder_id, e, delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error("Ошибка при отправке напоминания %s: %s", job.reminder_id, e)
+                break
+            else:
+                lag = max(0.0, time.time() - job.fire_at)
+                self.stats["sent"] += 1
+                self.stats["last_lag"] = lag
+                self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+                metrics.REMINDERS_SENT.inc(labels=("sent",))
+                metrics.REMINDER_LATENESS.observe(lag)
+                logger.info("Напоминание отправлено пользователю %s (задержка %.1f с)", job.chat_id, lag,
+                            extra={"user_id": job.chat_id, "sampled": True})
+                return True
+        
+        self.stats["failed"] += 1
+        metrics.REMINDERS_SENT.inc(labels=("failed",))
+        return False
@@ -0,0 +1,136 @@
+import heapq
+import logging
+import time
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Горизонт загрузки очереди по умолчанию в секундах
+DEFAULT_HORIZON = 3600
+
+# Через сколько секунд захват напоминания упавшим экземпляром считается недействительным
+DEFAULT_CLAIM_LEASE = 300
+
+# Имя экземпляра планировщика по умолчанию (параметр SCHEDULER_INSTANCE)
+DEFAULT_INSTANCE = "main"
+
+# Ключ в таблице app_state, под которым хранился общий водяной знак планировщика.
+# Водяной знак каждого экземпляра хранится под ключом WATERMARK_KEY:<имя экземпляра>.
+WATERMARK_KEY = "scheduler_watermark"
+
+
+class ReminderQueue:
+    """Очередь предстоящих напоминаний, упорядоченная по моменту срабатывания.
+
+    Напоминания хранятся в min-куче по абсолютному времени срабатывания в UTC
+    (секунды Unix), поэтому ближайшее напоминание доступно за O(1), а извлечение
+    наступивших - за O(k log n), где k - число наступивших напоминаний.
+    В очередь загружаются только напоминания в пределах горизонта horizon
+    секунд одним диапазонным запросом по индексу reminders(fire_at).
+    Очередь перечитывается, когда горизонт исчерпан или изменился счетчик
+    версий напоминаний (database.get_reminders_version).
+
+    Водяной знак (watermark) - момент, до которого включительно все напоминания
+    уже обработаны этим экземпляром. Он сохраняется в базе данных отдельно
+    для каждого экземпляра (instance), поэтому после перезапуска или долгой
+    паузы очередь загружается начиная с него, и пропущенные напоминания
+    отправляются, а не теряются. Один экземпляр не сдвигает водяной знак
+    другого за напоминания, которые тот еще не отправил.
+
+    Напоминания, захваченные другим (в том числе упавшим) экземпляром,
+    загружаются повторно независимо от водяного знака, когда их захват
+    истекает (через lease секунд): очередь помечается устаревшей к моменту
+    истечения самого раннего захвата.
+    """
+
+    def __init__(self, horizon=DEFAULT_HORIZON, lease=DEFAULT_CLAIM_LEASE, instance=DEFAULT_INSTANCE):
+        self.horizon = horizon
+        self.lease = lease
+        self.watermark_key = f"{WATERMARK_KEY}:{instance}"
+        self.watermark = None
+        self._heap = []
+        self._version = None
+        self._loaded_until = 0
+        self._claims_expire_at = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def is_stale(self, now_ts):
+        """Проверяет, нужно ли перечитать очередь из базы данных"""
+        if self._version is None or now_ts >= self._loaded_until:
+            return True
+        if self._claims_expire_at is not None and now_ts >= self._claims_expire_at:
+            return True
+        return database.get_reminders_version() != self._version
+
+    def invalidate(self):
+        """Помечает очередь устаревшей: при следующем refresh() она будет перечитана"""
+        self._version = None
+
+    def refresh(self, now_ts=None, exclude=()):
+        """Перечитывает очередь из базы данных, если она устарела.
+
+        exclude - идентификаторы напоминаний, которые уже извлечены из очереди
+        и еще доставляются, их не нужно загружать повторно.
+        """
+        if now_ts is None:
+            now_ts = time.time()
+        if not self.is_stale(now_ts):
+            return False
+        
+        minute_start = int(now_ts) - int(now_ts) % 60
+        if self.watermark is None:
+            # При первом запуске экземпляра продолжаем с общего водяного знака
+            # прежних версий, а без него пропущенными считаются только
+            # напоминания текущей минуты
+            self.watermark = database.get_state(
+                self.watermark_key, database.get_state(WATERMARK_KEY, minute_start - 1)
+            )
+        
+        # Напоминания текущей минуты загружаются всегда: пользователь мог
+        # добавить их уже после того, как водяной знак прошел этот момент
+        from_ts = min(self.watermark + 1, minute_start)
+        until_ts = int(now_ts) + self.horizon
+        
+        lease_before = int(now_ts) - self.lease
+        
+        version = database.get_reminders_version()
+        heap = [
+            tuple(row) for row in database.get_reminders_between(from_ts, until_ts, lease_before)
+            if row[1] not in exclude
+        ]
+        # Строки уже отсортированы по fire_at, heapify только подтверждает инвариант
+        heapq.heapify(heap)
+        earliest_claim = database.get_earliest_claim(lease_before)
+        
+        self._heap = heap
+        self._version = version
+        self._loaded_until = until_ts
+        self._claims_expire_at = None if earliest_claim is None else earliest_claim + self.lease + 1
+        logger.debug("Очередь напоминаний перезагружена: %s шт. начиная с %s", len(heap), from_ts)
+        return True
+
+    def advance_watermark(self, watermark):
+        """Сдвигает водяной знак вперед и сохраняет его в базе данных"""
+        if self.watermark is not None and watermark <= self.watermark:
+            return
+        self.watermark = watermark
+        database.set_state(self.watermark_key, watermark)
+
+    def next_wakeup(self):
+        """Возвращает момент (секунды Unix), когда очередь нужно снова проверить"""
+        wakeup = self._loaded_until
+        if self._heap:
+            wakeup = min(wakeup, self._heap[0][0])
+        if self._claims_expire_at is not None:
+            wakeup = min(wakeup, self._claims_expire_at)
+        return wakeup
+
+    def pop_due(self, now_ts):
+        """Извлекает все напоминания, время которых наступило к моменту now_ts"""
+        due = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            due.append(heapq.heappop(self._heap))
+        return due
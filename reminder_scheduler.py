@@ -1,7 +1,9 @@
 import logging
 import asyncio
-import datetime
-import pytz
+import os
+import socket
+import time
+import uuid
 from telegram import Bot
 
 # Импорт конфигурации
@@ -12,85 +14,200 @@ except ImportError:
     exit(1)
 
 # Импорт модулей
+import async_database
 import database
-from handlers.common import get_user_timezone
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL),
-    filename=config.SCHEDULER_LOG_FILE
+import metrics
+from logging_setup import setup_logging
+from reminder_queue import ReminderQueue, DEFAULT_CLAIM_LEASE, DEFAULT_HORIZON, DEFAULT_INSTANCE
+from reminder_delivery import (
+    ReminderDelivery, ReminderJob, DEFAULT_WORKERS, DEFAULT_GLOBAL_RATE,
+    DEFAULT_PER_CHAT_RATE, DEFAULT_MAX_RETRIES
 )
+
 logger = logging.getLogger(__name__)
 
-async def send_reminder(bot, user_id, event_name, event_date, event_time):
-    """Отправляет напоминание пользователю"""
-    try:
-        message = f"🔔 НАПОМИНАНИЕ 🔔\n\nСобытие: {event_name}\nДата: {event_date}\nВремя: {event_time}"
-        await bot.send_message(chat_id=user_id, text=message)
-        logger.info(f"Напоминание отправлено пользователю {user_id} о событии '{event_name}'")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке напоминания: {e}")
+# Политики обработки напоминаний, опоздавших больше чем на REMINDER_MAX_LATENESS
+STALE_POLICY_DROP = "drop"
+STALE_POLICY_FLAG = "flag"
+
+# Функция для формирования текста напоминания
+def format_reminder(event_name, event_date, event_time, lateness=None):
+    message = f"🔔 НАПОМИНАНИЕ 🔔\n\nСобытие: {event_name}\nДата: {event_date}\nВремя: {event_time}"
+    if lateness is not None:
+        message += f"\n\n⚠️ Напоминание доставлено с опозданием на {int(lateness // 60)} мин."
+    return message
+
+# Функция для создания конвейера доставки с настройками из config.py
+def create_delivery(bot, on_complete):
+    return ReminderDelivery(
+        bot,
+        on_complete=on_complete,
+        workers=getattr(config, "DELIVERY_WORKERS", DEFAULT_WORKERS),
+        global_rate=getattr(config, "DELIVERY_GLOBAL_RATE", DEFAULT_GLOBAL_RATE),
+        per_chat_rate=getattr(config, "DELIVERY_PER_CHAT_RATE", DEFAULT_PER_CHAT_RATE),
+        max_retries=getattr(config, "DELIVERY_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+    )
+
+async def check_reminders(bot=None, wakeup=None, on_tick=None):
+    """Проверяет напоминания и отправляет их, если время наступило.
+
+    Предстоящие напоминания хранятся в очереди ReminderQueue, упорядоченной
+    по времени срабатывания в UTC. Планировщик спит до ближайшего напоминания,
+    но не дольше CHECK_INTERVAL: по истечении этого интервала он сверяет
+    счетчик версий напоминаний и перечитывает очередь, только если напоминания
+    были добавлены или удалены. Наступившие напоминания передаются
+    в конвейер доставки ReminderDelivery и отправляются параллельно.
+
+    Перед отправкой наступившие напоминания атомарно захватываются в базе
+    данных, а после доставки удаляются одной транзакцией на итерацию, поэтому
+    можно запускать несколько экземпляров планировщика без повторных отправок.
 
-async def check_reminders():
-    """Проверяет напоминания и отправляет их, если время наступило"""
-    bot = Bot(token=config.BOT_TOKEN)
+    Отправляются все напоминания, время которых наступило после сохраненного
+    водяного знака, поэтому медленная итерация или перезапуск процесса
+    не приводят к потере напоминаний. Напоминания, опоздавшие больше чем
+    на REMINDER_MAX_LATENESS секунд, удаляются без отправки или отправляются
+    с пометкой об опоздании в зависимости от REMINDER_STALE_POLICY.
+
+    Если передано событие wakeup (asyncio.Event), планировщик просыпается
+    досрочно при его установке - так встроенный в бота планировщик узнает
+    о новых напоминаниях сразу, не дожидаясь CHECK_INTERVAL.
     
-    while True:
-        try:
-            # Подключение к базе данных
-            conn = database.sqlite3.connect(config.DB_NAME)
-            cursor = conn.cursor()
-            
-            # Получаем всех пользователей с их часовыми поясами
-            cursor.execute("SELECT DISTINCT user_id FROM user_settings")
-            users = cursor.fetchall()
-            
-            # Если нет пользователей в таблице user_settings, проверяем всех пользователей из таблицы events
-            if not users:
-                cursor.execute("SELECT DISTINCT user_id FROM events")
-                users = cursor.fetchall()
-            
-            # Проверяем напоминания для каждого пользователя в его часовом поясе
-            for user in users:
-                user_id = user[0]
-                timezone_str = get_user_timezone(user_id)
+    Если передана функция on_tick, после каждой итерации она вызывается
+    с длительностью итерации в секундах и числом захваченных напоминаний
+    (используется бенчмарками).
+    """
+    if bot is None:
+        bot = Bot(token=config.BOT_TOKEN)
+    max_lateness = getattr(config, "REMINDER_MAX_LATENESS", 3600)
+    stale_policy = getattr(config, "REMINDER_STALE_POLICY", STALE_POLICY_FLAG)
+    claim_lease = getattr(config, "REMINDER_CLAIM_LEASE", DEFAULT_CLAIM_LEASE)
+    reminder_queue = ReminderQueue(
+        getattr(config, "REMINDER_QUEUE_HORIZON", DEFAULT_HORIZON),
+        claim_lease,
+        getattr(config, "SCHEDULER_INSTANCE", DEFAULT_INSTANCE),
+    )
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    
+    # Напоминания, захваченные этим экземпляром и еще не удаленные: id -> fire_at
+    in_flight = {}
+    # Обработанные напоминания, которые будут удалены одной транзакцией
+    completed = []
+    
+    def on_reminder_delivered(job, delivered):
+        # Удаляем напоминание после отправки (и после окончательной ошибки, как и раньше)
+        completed.append(job.reminder_id)
+    
+    async def flush_completed():
+        if not completed:
+            return
+        batch = completed[:]
+        await async_database.run_write(database.complete_reminders, batch)
+        del completed[:len(batch)]
+        for reminder_id in batch:
+            in_flight.pop(reminder_id, None)
+    
+    delivery = create_delivery(bot, on_reminder_delivered)
+    delivery.start()
+    metrics.DELIVERY_QUEUE_DEPTH.set_function(lambda: delivery.queue_depth)
+    metrics.SCHEDULER_BACKLOG.set_function(lambda: len(in_flight))
+    
+    try:
+        while True:
+            tick_started = time.perf_counter()
+            try:
+                await flush_completed()
                 
-                try:
-                    # Получаем текущее время в часовом поясе пользователя
-                    timezone = pytz.timezone(timezone_str)
-                    now = datetime.datetime.now(timezone)
-                    current_date = now.strftime("%d.%m.%Y")
-                    current_time = now.strftime("%H:%M")
-                    
-                    # Получаем напоминания для этого пользователя, время которых наступило
-                    cursor.execute("""
-                        SELECT r.id, e.user_id, e.name, e.event_date, e.event_time
-                        FROM reminders r
-                        JOIN events e ON r.event_id = e.id
-                        WHERE e.user_id = ? AND r.reminder_date = ? AND r.reminder_time = ?
-                    """, (user_id, current_date, current_time))
+                # Обращения к базе данных выполняются вне цикла событий, чтобы
+                # встроенный планировщик не блокировал обработку обновлений бота
+                now_ts = time.time()
+                await async_database.run_read(reminder_queue.refresh, now_ts, exclude=set(in_flight))
+                
+                due = {item[1]: item for item in reminder_queue.pop_due(now_ts)}
+                # Захватываем наступившие напоминания одной транзакцией. Удаленные
+                # пользователем и захваченные другим экземпляром будут пропущены;
+                # если тот экземпляр упал, напоминание загрузится снова, когда
+                # истечет его захват (ReminderQueue.refresh).
+                claimed = await async_database.run_write(
+                    database.claim_reminders, list(due), owner, int(now_ts), int(now_ts) - claim_lease
+                )
+                
+                for reminder_id in claimed:
+                    fire_at, reminder_id, user_id, event_name, event_date, event_time = due[reminder_id]
+                    in_flight[reminder_id] = fire_at
                     
-                    reminders = cursor.fetchall()
+                    lateness = now_ts - fire_at
+                    if lateness <= max_lateness:
+                        text = format_reminder(event_name, event_date, event_time)
+                    elif stale_policy == STALE_POLICY_DROP:
+                        logger.warning("Напоминание %s опоздало на %d с и удалено без отправки", reminder_id, lateness,
+                                       extra={"user_id": user_id, "sampled": True})
+                        completed.append(reminder_id)
+                        continue
+                    else:
+                        logger.warning("Напоминание %s опоздало на %d с", reminder_id, lateness,
+                                       extra={"user_id": user_id, "sampled": True})
+                        text = format_reminder(event_name, event_date, event_time, lateness)
                     
-                    # Отправляем напоминания
-                    for reminder in reminders:
-                        reminder_id, user_id, event_name, event_date, event_time = reminder
-                        await send_reminder(bot, user_id, event_name, event_date, event_time)
-                        
-                        # Удаляем напоминание после отправки
-                        database.delete_reminder(reminder_id)
+                    await delivery.submit(ReminderJob(reminder_id, user_id, text, fire_at))
                 
-                except Exception as e:
-                    logger.error(f"Ошибка при проверке напоминаний для пользователя {user_id}: {e}")
-            
-            conn.close()
+                # Все напоминания до водяного знака обработаны, кроме еще не удаленных
+                watermark = int(now_ts)
+                if in_flight:
+                    watermark = min(watermark, min(in_flight.values()) - 1)
+                await async_database.run_write(reminder_queue.advance_watermark, watermark)
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Метрики доставки: %s", delivery.metrics())
+                tick_duration = time.perf_counter() - tick_started
+                metrics.SCHEDULER_TICK_DURATION.observe(tick_duration)
+                if on_tick is not None:
+                    on_tick(tick_duration, len(claimed))
+                
+            except Exception as e:
+                logger.error("Ошибка при проверке напоминаний: %s", e)
             
-        except Exception as e:
-            logger.error(f"Ошибка при проверке напоминаний: {e}")
-        
-        # Ждем до следующей проверки
-        await asyncio.sleep(config.CHECK_INTERVAL)
+            # Ждем до ближайшего напоминания, но не дольше интервала проверки
+            delay = max(0, min(config.CHECK_INTERVAL, reminder_queue.next_wakeup() - time.time()))
+            if wakeup is None:
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+    finally:
+        metrics.DELIVERY_QUEUE_DEPTH.set_function(None)
+        metrics.SCHEDULER_BACKLOG.set_function(None)
+        await delivery.stop(drain=False)
+        await flush_completed()
+
+# Режимы запуска планировщика (параметр SCHEDULER_MODE)
+SCHEDULER_MODE_PROCESS = "process"
+SCHEDULER_MODE_EMBEDDED = "embedded"
+
+# Функция для запуска планировщика как фоновой задачи в цикле событий бота.
+# Планировщик использует HTTP-клиент бота, общий пул соединений и кэши процесса,
+# а изменения напоминаний будят его сразу через database.add_change_listener.
+def start_embedded(bot):
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    
+    def on_reminders_changed():
+        loop.call_soon_threadsafe(wakeup.set)
+    
+    database.add_change_listener(on_reminders_changed)
+    task = asyncio.create_task(check_reminders(bot, wakeup), name="reminder-scheduler")
+    logger.info("Встроенный планировщик напоминаний запущен")
+    return task, on_reminders_changed
+
+# Функция для остановки встроенного планировщика
+async def stop_embedded(handle):
+    task, on_reminders_changed = handle
+    database.remove_change_listener(on_reminders_changed)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    logger.info("Встроенный планировщик напоминаний остановлен")
 
 async def main():
     """Основная функция"""
@@ -98,13 +215,23 @@ async def main():
     database.init_db()
     
     logger.info("Планировщик напоминаний запущен")
-    await check_reminders()
+    checkpoints = asyncio.create_task(async_database.run_checkpoints())
+    metrics_server = await metrics.start_metrics_server(
+        getattr(config, "SCHEDULER_METRICS_PORT", metrics.DEFAULT_SCHEDULER_METRICS_PORT)
+    )
+    try:
+        await check_reminders()
+    finally:
+        checkpoints.cancel()
+        if metrics_server is not None:
+            await metrics_server.stop()
 
 if __name__ == "__main__":
+    setup_logging(config.SCHEDULER_LOG_FILE)
     try:
         # Запускаем планировщик напоминаний
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Планировщик напоминаний остановлен")
     except Exception as e:
-        logger.error(f"Неожиданная ошибка: {e}")
\ No newline at end of file
+        logger.error("Неожиданная ошибка: %s", e)
\ No newline at end of file
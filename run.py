@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 """
-Скрипт для одновременного запуска бота и планировщика напоминаний
+Скрипт для одновременного запуска бота и планировщика напоминаний.
+
+Процессы перезапускаются после падения с растущей задержкой, а процессы
+бота при BOT_WORKERS > 1 еще и проверяются запросом к HEALTH_PATH.
 """
 
 import subprocess
 import sys
 import os
 import time
+import secrets
 import signal
 import logging
+import urllib.request
 
 # Импорт конфигурации
 try:
@@ -20,14 +25,15 @@ except ImportError:
 except AttributeError:
     LOG_LEVEL = logging.INFO
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=LOG_LEVEL,
-    filename='run.log'
-)
 logger = logging.getLogger(__name__)
 
+from logging_setup import setup_logging
+from reminder_scheduler import SCHEDULER_MODE_EMBEDDED, SCHEDULER_MODE_PROCESS
+from update_router import (
+    DEFAULT_WORKERS, WORKER_HOST, WORKER_INDEX_ENV, WORKER_SECRET_ENV, get_worker_port
+)
+from webhook_server import HEALTH_PATH
+
 # Проверка наличия конфигурационного файла
 if not os.path.exists('config.py'):
     print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
@@ -56,69 +62,185 @@ for file in required_handler_files:
         print(f"Файл {file} не найден. Убедитесь, что все необходимые файлы находятся в текущей директории.")
         sys.exit(1)
 
-# Список процессов
-processes = []
+# Пауза между проверками состояния процессов (секунды)
+SUPERVISOR_TICK = 1
+
+# Задержка перед перезапуском упавшего процесса: удваивается после каждого
+# падения подряд от RESTART_BACKOFF_MIN до RESTART_BACKOFF_MAX секунд и
+# сбрасывается, если процесс проработал дольше STABLE_RUN_TIME секунд
+RESTART_BACKOFF_MIN = 1
+DEFAULT_RESTART_BACKOFF_MAX = 60
+STABLE_RUN_TIME = 60
+
+# Проверка работоспособности процессов бота: запрос к HEALTH_PATH каждые
+# HEALTH_CHECK_INTERVAL секунд; после HEALTH_CHECK_FAILURES неудачных
+# проверок подряд процесс перезапускается. Первые HEALTH_CHECK_GRACE секунд
+# после запуска процесс не проверяется.
+DEFAULT_HEALTH_CHECK_INTERVAL = 5
+DEFAULT_HEALTH_CHECK_FAILURES = 3
+HEALTH_CHECK_TIMEOUT = 2
+HEALTH_CHECK_GRACE = 10
+
+# Сколько секунд ждать завершения процесса после SIGTERM, прежде чем завершить его принудительно
+STOP_TIMEOUT = 10
+
+
+class Component:
+    """Запускаемый процесс с перезапуском после падения и проверкой работоспособности"""
+
+    def __init__(self, name, script, env=None, health_url=None):
+        self.name = name
+        self.script = script
+        self.env = env
+        self.health_url = health_url
+        self.process = None
+        self.started_at = 0.0
+        # Число падений подряд, время следующего запуска и следующей проверки
+        self.crashes = 0
+        self.start_at = 0.0
+        self.check_at = 0.0
+        self.health_failures = 0
+
+    def start(self):
+        env = dict(os.environ, **self.env) if self.env else None
+        self.process = subprocess.Popen([sys.executable, self.script], env=env)
+        self.started_at = time.monotonic()
+        self.check_at = self.started_at + HEALTH_CHECK_GRACE
+        self.health_failures = 0
+        logger.info("%s запущен (pid %s)", self.name, self.process.pid)
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.warning("%s не завершился за %s с, завершение принудительно", self.name, STOP_TIMEOUT)
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    # Планирование перезапуска с экспоненциально растущей задержкой
+    def schedule_restart(self, now):
+        if now - self.started_at >= STABLE_RUN_TIME:
+            self.crashes = 0
+        delay = min(RESTART_BACKOFF_MIN * 2 ** self.crashes,
+                    getattr(config, "RESTART_BACKOFF_MAX", DEFAULT_RESTART_BACKOFF_MAX))
+        self.crashes += 1
+        self.start_at = now + delay
+        self.process = None
+        return delay
+
+    def check_health(self):
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=HEALTH_CHECK_TIMEOUT) as response:
+                return response.status == 200
+        except (OSError, ValueError):
+            return False
+
+    # Проверка процесса на очередном шаге наблюдения
+    def supervise(self, now):
+        if self.process is None:
+            if now >= self.start_at:
+                self.start()
+            return
+
+        code = self.process.poll()
+        if code is not None:
+            delay = self.schedule_restart(now)
+            print(f"{self.name} неожиданно завершил работу. Перезапуск через {delay} с...")
+            logger.warning("%s завершился с кодом %s, перезапуск через %s с", self.name, code, delay)
+            return
+
+        if self.health_url is None or now < self.check_at:
+            return
+        self.check_at = now + getattr(config, "HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL)
+        if self.check_health():
+            self.health_failures = 0
+            return
+        self.health_failures += 1
+        logger.warning("%s не отвечает на проверку работоспособности (%s)", self.name, self.health_failures)
+        if self.health_failures >= getattr(config, "HEALTH_CHECK_FAILURES", DEFAULT_HEALTH_CHECK_FAILURES):
+            self.stop()
+            delay = self.schedule_restart(now)
+            print(f"{self.name} не отвечает. Перезапуск через {delay} с...")
+            logger.error("%s не отвечает, перезапуск через %s с", self.name, delay)
+
+
+# Список компонентов
+components = []
+
+# Функция для остановки всех компонентов. Маршрутизатор останавливается
+# первым, чтобы успеть передать процессам бота уже полученные обновления.
+def stop_components():
+    for component in sorted(components, key=lambda component: component.script != "update_router.py"):
+        component.stop()
+    logger.info("Все компоненты остановлены")
 
 def signal_handler(sig, frame):
     """Обработчик сигналов для корректного завершения процессов"""
     print("\nЗавершение работы...")
-    for process in processes:
-        if process.poll() is None:  # Если процесс еще работает
-            process.terminate()
+    stop_components()
     sys.exit(0)
 
 # Регистрация обработчика сигналов
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+# Функция для получения списка запускаемых компонентов.
+# При BOT_WORKERS > 1 запускается несколько процессов бота и маршрутизатор
+# update_router, распределяющий между ними обновления по id пользователя.
+def get_components():
+    workers = getattr(config, "BOT_WORKERS", DEFAULT_WORKERS)
+    if workers > 1:
+        secret = secrets.token_urlsafe(32)
+        result = []
+        for index in range(workers):
+            env = {WORKER_INDEX_ENV: str(index), WORKER_SECRET_ENV: secret}
+            health_url = f"http://{WORKER_HOST}:{get_worker_port(index)}{HEALTH_PATH}"
+            result.append(Component(f"Бот (процесс {index + 1} из {workers})", "main.py", env, health_url))
+        result.append(Component("Маршрутизатор обновлений", "update_router.py", {WORKER_SECRET_ENV: secret}))
+    else:
+        result = [Component("Бот", "main.py")]
+    
+    # Во встроенном режиме планировщик работает внутри процесса бота
+    if getattr(config, "SCHEDULER_MODE", SCHEDULER_MODE_PROCESS) != SCHEDULER_MODE_EMBEDDED:
+        result.append(Component("Планировщик напоминаний", "reminder_scheduler.py"))
+    return result
+
 def main():
     """Основная функция"""
+    setup_logging('run.log', LOG_LEVEL)
+    components.extend(get_components())
+    
     try:
-        # Запуск бота
-        print("Запуск бота...")
-        bot_process = subprocess.Popen([sys.executable, 'main.py'])
-        processes.append(bot_process)
-        logger.info("Бот запущен")
-        
-        # Запуск планировщика напоминаний
-        print("Запуск планировщика напоминаний...")
-        scheduler_process = subprocess.Popen([sys.executable, 'reminder_scheduler.py'])
-        processes.append(scheduler_process)
-        logger.info("Планировщик напоминаний запущен")
+        for component in components:
+            print(f"Запуск: {component.name}...")
+            component.start()
         
-        print("Бот и планировщик напоминаний запущены. Нажмите Ctrl+C для завершения.")
+        print("Все компоненты запущены. Нажмите Ctrl+C для завершения.")
         
-        # Ожидание завершения процессов
+        # Наблюдение за процессами: перезапуск упавших и не отвечающих
         while True:
-            # Проверка статуса процессов
-            if bot_process.poll() is not None:
-                print("Бот неожиданно завершил работу. Перезапуск...")
-                bot_process = subprocess.Popen([sys.executable, 'main.py'])
-                processes[0] = bot_process
-                logger.warning("Бот перезапущен после неожиданного завершения")
-            
-            if scheduler_process.poll() is not None:
-                print("Планировщик напоминаний неожиданно завершил работу. Перезапуск...")
-                scheduler_process = subprocess.Popen([sys.executable, 'reminder_scheduler.py'])
-                processes[1] = scheduler_process
-                logger.warning("Планировщик напоминаний перезапущен после неожиданного завершения")
-            
-            time.sleep(5)
+            time.sleep(SUPERVISOR_TICK)
+            now = time.monotonic()
+            for component in components:
+                component.supervise(now)
     
     except KeyboardInterrupt:
         print("\nЗавершение работы...")
-        for process in processes:
-            if process.poll() is None:  # Если процесс еще работает
-                process.terminate()
-        logger.info("Бот и планировщик напоминаний остановлены")
+        stop_components()
     
     except Exception as e:
         print(f"Произошла ошибка: {e}")
-        logger.error(f"Неожиданная ошибка: {e}")
-        for process in processes:
-            if process.poll() is None:  # Если процесс еще работает
-                process.terminate()
+        logger.error("Неожиданная ошибка: %s", e)
+        stop_components()
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
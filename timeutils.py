@@ -0,0 +1,117 @@
+import datetime
+import re
+import pytz
+
+from cache import LRUCache, MISSING
+
+# Форматы даты и времени, в которых пользователи вводят события и напоминания
+DATE_FORMAT = "%d.%m.%Y"
+TIME_FORMAT = "%H:%M"
+
+# Регулярные выражения для тех же форматов: разбор без strptime заметно быстрее
+# при массовой обработке (импорт, пересчет времени напоминаний)
+_DATE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})")
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{1,2})")
+
+# Смещение напоминания относительно начала события: «-15m», «-1h», «-1d 2h», «за 2 дня».
+# Минус (или без знака) - до начала события, плюс - после.
+_OFFSET_RE = re.compile(r"\s*([+-])?\s*((?:\d+\s*[^\d\s]+\s*)+)")
+_OFFSET_PART_RE = re.compile(r"(\d+)\s*([^\d\s]+)")
+_OFFSET_UNITS = {
+    "m": 1, "min": 1, "м": 1, "мин": 1, "минут": 1, "минуты": 1, "минуту": 1,
+    "h": 60, "ч": 60, "час": 60, "часа": 60, "часов": 60,
+    "d": 1440, "д": 1440, "дн": 1440, "день": 1440, "дня": 1440, "дней": 1440,
+    "w": 10080, "н": 10080, "нед": 10080, "неделя": 10080, "недели": 10080, "неделю": 10080, "недель": 10080,
+}
+
+# Кэш объектов часовых поясов: разбор имени часового пояса pytz
+# выполняется один раз, а число разных поясов у пользователей невелико
+timezone_cache = LRUCache(maxsize=128)
+
+
+# Функция для получения объекта часового пояса по имени (с кэшированием)
+def get_timezone(timezone_str):
+    timezone = timezone_cache.get(timezone_str)
+    if timezone is MISSING:
+        timezone = pytz.timezone(timezone_str)
+        timezone_cache.set(timezone_str, timezone)
+    return timezone
+
+
+# Функция для привязки локального datetime без часового пояса к часовому поясу
+# по правилам RFC 5545. Время из «пропущенного» при переходе на летнее время
+# интервала переводится с прежним смещением, то есть сдвигается вперед на длину
+# перехода (02:30 становится 03:30), а время, которое при переводе часов назад
+# повторяется дважды, относится к первому из двух моментов.
+def localize(timezone, local):
+    try:
+        return timezone.localize(local, is_dst=None)
+    except pytz.NonExistentTimeError:
+        return timezone.localize(local, is_dst=False)
+    except pytz.AmbiguousTimeError:
+        return min(timezone.localize(local, is_dst=True), timezone.localize(local, is_dst=False))
+
+
+# Функция для разбора локальных даты (ДД.ММ.ГГГГ) и времени (ЧЧ:ММ) в datetime без часового пояса.
+# При некорректном значении выбрасывает ValueError, как и strptime.
+def parse_local(date_str, time_str):
+    date_match = _DATE_RE.fullmatch(date_str)
+    if not date_match:
+        raise ValueError(f"некорректная дата: {date_str}")
+    time_match = _TIME_RE.fullmatch(time_str)
+    if not time_match:
+        raise ValueError(f"некорректное время: {time_str}")
+    
+    day, month, year = map(int, date_match.groups())
+    hour, minute = map(int, time_match.groups())
+    try:
+        return datetime.datetime(year, month, day, hour, minute)
+    except ValueError:
+        raise ValueError(f"некорректные дата или время: {date_str} {time_str}")
+
+
+# Функция для перевода локальных даты и времени пользователя в секунды Unix (UTC)
+def local_to_timestamp(date_str, time_str, timezone_str):
+    local = parse_local(date_str, time_str)
+    return int(localize(get_timezone(timezone_str), local).timestamp())
+
+
+# Функция для перевода секунд Unix в локальное время пользователя
+def timestamp_to_local(timestamp, timezone_str):
+    return datetime.datetime.fromtimestamp(timestamp, get_timezone(timezone_str))
+
+
+# Функция для разбора смещения напоминания относительно начала события.
+# Возвращает число минут до начала события (отрицательное - после начала)
+# или выбрасывает ValueError.
+def parse_offset(text):
+    text = text.strip().lower()
+    if text.startswith("за "):
+        text = "-" + text[3:]
+    
+    match = _OFFSET_RE.fullmatch(text)
+    if not match:
+        raise ValueError(f"некорректное смещение: {text}")
+    
+    minutes = 0
+    for number, unit in _OFFSET_PART_RE.findall(match.group(2)):
+        if unit not in _OFFSET_UNITS:
+            raise ValueError(f"неизвестная единица времени: {unit}")
+        minutes += int(number) * _OFFSET_UNITS[unit]
+    
+    return -minutes if match.group(1) == "+" else minutes
+
+
+# Функция для описания смещения напоминания (например, «за 1 д 2 ч до начала»)
+def format_offset(minutes):
+    remaining = abs(minutes)
+    parts = []
+    for size, unit in ((1440, "д"), (60, "ч"), (1, "мин")):
+        if remaining >= size:
+            parts.append(f"{remaining // size} {unit}")
+            remaining %= size
+    if not parts:
+        return "в момент начала"
+    if minutes >= 0:
+        return f"за {' '.join(parts)} до начала"
+    return f"через {' '.join(parts)} после начала"
@@ -0,0 +1,81 @@
+"""
+Параллельная обработка обновлений Telegram с сохранением порядка для каждого пользователя.
+
+Состояние разговора (ConversationHandler) и context.user_data относятся
+к пользователю, поэтому два его обновления, обработанные одновременно, могут
+прочитать одно и то же состояние, и один из переходов потеряется.
+PerUserUpdateProcessor выполняет одновременно до max_concurrent_updates
+обновлений разных пользователей, а обновления одного пользователя - строго
+по очереди в порядке поступления.
+"""
+
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+# Во сколько раз число принятых в обработку обновлений (вместе с ожидающими
+# своей очереди у пользователя) может превышать число выполняемых одновременно.
+# Запас нужен, чтобы несколько сообщений подряд от одного пользователя
+# не занимали все места и не задерживали остальных. Свойство
+# max_concurrent_updates возвращает именно число принимаемых обновлений.
+ADMISSION_FACTOR = 4
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений разных пользователей параллельно, одного пользователя - последовательно"""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates * ADMISSION_FACTOR)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # Ключ пользователя -> [блокировка, число обновлений в очереди пользователя]
+        self._users = {}
+
+    # Ключ очереди: пользователь (user_data общий для всех его чатов), иначе чат.
+    # Обновления без пользователя и чата обрабатываются без очереди.
+    @staticmethod
+    def _key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                await self._process(coroutine)
+            return
+
+        entry = self._users.get(key)
+        if entry is None:
+            entry = self._users[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Место среди выполняемых занимается только после своей очереди у пользователя
+            async with entry[0], self._running:
+                await self._process(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._users[key]
+
+    @staticmethod
+    async def _process(coroutine):
+        started = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            metrics.UPDATE_DURATION.observe(time.perf_counter() - started)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
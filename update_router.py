@@ -0,0 +1,320 @@
+"""
+Распределение обновлений Telegram между несколькими процессами бота.
+
+Один процесс main.py обрабатывает обновления на одном ядре процессора.
+При BOT_WORKERS > 1 скрипт run.py запускает несколько процессов бота
+(воркеров) и этот маршрутизатор. Обновления от Telegram получает только
+маршрутизатор (через getUpdates или webhook, в зависимости от BOT_MODE),
+а каждое обновление передается воркеру с номером user_id % BOT_WORKERS.
+Все обновления пользователя попадают в один процесс и в том же порядке,
+поэтому состояние его разговора и user_data в памяти воркера остаются
+согласованными. Общим хранилищем служит база данных SQLite в режиме WAL;
+там же хранится состояние разговоров (persistence), поэтому после изменения
+числа воркеров начатые диалоги продолжаются в новом процессе.
+
+Воркер принимает обновления встроенным сервером webhook_server на 127.0.0.1,
+порт BOT_WORKER_BASE_PORT + номер воркера, с секретом, который run.py
+передает через переменную окружения. Пока воркер перезапускается,
+его обновления ждут в очереди маршрутизатора.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import warnings
+
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.warnings import PTBUserWarning
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+from logging_setup import setup_logging
+from webhook_server import (
+    WebhookServer, get_webhook_settings, register_webhook, create_stop_event
+)
+
+logger = logging.getLogger(__name__)
+
+# getUpdates вызывается через do_api_request, чтобы получить обновления в виде
+# JSON и передать воркерам без разбора в объекты Update и обратно
+warnings.filterwarnings("ignore", message=".*do_api_request", category=PTBUserWarning)
+
+DEFAULT_WORKERS = 1
+DEFAULT_WORKER_BASE_PORT = 8450
+
+# Переменные окружения, через которые run.py передает настройки процессам
+WORKER_INDEX_ENV = "BOT_WORKER_INDEX"
+WORKER_SECRET_ENV = "BOT_WORKER_SECRET"
+
+WORKER_HOST = "127.0.0.1"
+WORKER_PATH = "/updates"
+
+# Число соединений с каждым воркером. Пользователь всегда передается
+# по одному и тому же соединению, поэтому порядок его обновлений сохраняется.
+CONNECTIONS_PER_WORKER = 4
+
+# Сколько обновлений может ждать отправки по одному соединению. При заполнении
+# маршрутизатор перестает получать новые обновления, пока воркер не догонит.
+QUEUE_SIZE = 1000
+
+# Пауза перед повторным подключением к недоступному воркеру (секунды)
+RECONNECT_DELAY = 0.5
+
+# Тайм-аут long polling при получении обновлений (секунды)
+POLL_TIMEOUT = 10
+
+# Сколько секунд при остановке ждать передачи принятых обновлений воркерам
+SHUTDOWN_TIMEOUT = 5
+
+
+# Функция для получения номера воркера текущего процесса (None - процесс
+# запущен без маршрутизатора и получает обновления от Telegram сам)
+def get_worker_index():
+    value = os.environ.get(WORKER_INDEX_ENV)
+    return int(value) if value is not None else None
+
+
+# Функция для определения порта, на котором воркер принимает обновления
+def get_worker_port(index):
+    return getattr(config, "BOT_WORKER_BASE_PORT", DEFAULT_WORKER_BASE_PORT) + index
+
+
+# Функция для создания сервера, на котором воркер принимает обновления от маршрутизатора
+def create_worker_server(application, index):
+    return WebhookServer(
+        application,
+        host=WORKER_HOST,
+        port=get_worker_port(index),
+        path=WORKER_PATH,
+        secret_token=os.environ[WORKER_SECRET_ENV],
+    )
+
+
+# Функция для определения ключа маршрутизации обновления: id пользователя,
+# а для обновлений без пользователя - id чата (как в PerUserUpdateProcessor)
+def get_route_key(data):
+    for name, payload in data.items():
+        if name == "update_id" or not isinstance(payload, dict):
+            continue
+        user = payload.get("from") or payload.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = payload.get("chat")
+        if chat is None and isinstance(payload.get("message"), dict):
+            chat = payload["message"].get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return 0
+
+
+class WorkerLink:
+    """Передача обновлений воркеру по одному постоянному соединению"""
+
+    def __init__(self, index, port, secret_token):
+        self.index = index
+        self.port = port
+        self.secret_token = secret_token
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self._reader = None
+        self._writer = None
+
+    # Отправка обновлений из очереди по порядку. Обновление удаляется
+    # из очереди только после ответа воркера, а при недоступности воркера
+    # отправка повторяется, пока он не будет перезапущен.
+    async def run(self):
+        while True:
+            body = await self.queue.get()
+            failed = False
+            while True:
+                try:
+                    status = await self._post(body)
+                    break
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    if not failed:
+                        logger.warning("Воркер %s недоступен, обновления ждут в очереди: %s", self.index, e)
+                        failed = True
+                    self._close()
+                    await asyncio.sleep(RECONNECT_DELAY)
+            if failed:
+                logger.info("Воркер %s снова принимает обновления", self.index)
+            if status != 200:
+                logger.error("Воркер %s отклонил обновление с кодом %s", self.index, status)
+            self.queue.task_done()
+
+    async def _post(self, body):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(WORKER_HOST, self.port)
+        self._writer.write((
+            f"POST {WORKER_PATH} HTTP/1.1\r\nHost: {WORKER_HOST}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {self.secret_token}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1") + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("воркер закрыл соединение")
+        status = int(status_line.split()[1])
+        keep_alive = True
+        while True:
+            line = (await self._reader.readline()).decode("latin-1").strip().lower()
+            if not line:
+                break
+            if line == "connection: close":
+                keep_alive = False
+        if not keep_alive:
+            self._close()
+        return status
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class UpdateRouter:
+    """Распределение обновлений между воркерами по id пользователя"""
+
+    def __init__(self, workers, secret_token):
+        self.workers = workers
+        self._links = [
+            [WorkerLink(index, get_worker_port(index), secret_token) for _ in range(CONNECTIONS_PER_WORKER)]
+            for index in range(workers)
+        ]
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(link.run())
+            for links in self._links for link in links
+        ]
+
+    # Остановка: обновления, уже принятые от Telegram, передаются воркерам
+    # (не дольше SHUTDOWN_TIMEOUT), после чего отправка прекращается
+    async def stop(self):
+        queues = [link.queue.join() for links in self._links for link in links]
+        try:
+            await asyncio.wait_for(asyncio.gather(*queues), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            lost = sum(link.queue.qsize() for links in self._links for link in links)
+            logger.error("Не удалось передать воркерам %s обновлений до остановки", lost)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for links in self._links:
+            for link in links:
+                link._close()
+
+    # Постановка обновления в очередь его воркера. body - исходный JSON
+    # обновления, если он уже есть (запрос webhook), чтобы не сериализовать заново.
+    async def route(self, data, body=None):
+        key = get_route_key(data)
+        links = self._links[key % self.workers]
+        link = links[key // self.workers % len(links)]
+        if body is None:
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        await link.queue.put(body)
+
+
+class RoutingWebhookServer(WebhookServer):
+    """Сервер webhook, передающий обновления маршрутизатору вместо приложения"""
+
+    def __init__(self, router, **settings):
+        super().__init__(None, **settings)
+        self.router = router
+
+    async def _dispatch(self, body):
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("обновление должно быть объектом JSON")
+        except ValueError as e:
+            logger.warning("Не удалось разобрать обновление из запроса webhook: %s", e)
+            return 400, "Bad Request"
+
+        await self.router.route(data, body)
+        return 200, "OK"
+
+    def is_healthy(self):
+        return True
+
+
+# Функция для получения обновлений через getUpdates и передачи их маршрутизатору
+async def poll_updates(bot, router, stop_event):
+    # Telegram не отдает обновления через getUpdates, пока зарегистрирован webhook
+    await bot.delete_webhook()
+    offset = 0
+    delay = RECONNECT_DELAY
+    stopping = asyncio.create_task(stop_event.wait())
+    while not stop_event.is_set():
+        request = asyncio.create_task(bot.do_api_request(
+            "getUpdates",
+            {"offset": offset, "timeout": POLL_TIMEOUT, "allowed_updates": Update.ALL_TYPES},
+            read_timeout=POLL_TIMEOUT + 10,
+        ))
+        # Долгий запрос getUpdates прерывается при остановке
+        await asyncio.wait([request, stopping], return_when=asyncio.FIRST_COMPLETED)
+        if not request.done():
+            request.cancel()
+            break
+        try:
+            updates = request.result()
+        except TelegramError as e:
+            logger.error("Ошибка при получении обновлений: %s", e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_TIMEOUT)
+            continue
+        delay = RECONNECT_DELAY
+
+        for data in updates:
+            await router.route(data)
+            offset = data["update_id"] + 1
+    stopping.cancel()
+
+    # Подтверждение полученных обновлений, чтобы после перезапуска они не пришли снова
+    if offset:
+        try:
+            await bot.do_api_request("getUpdates", {"offset": offset, "timeout": 0, "limit": 1})
+        except TelegramError as e:
+            logger.warning("Не удалось подтвердить полученные обновления: %s", e)
+
+
+# Функция для работы маршрутизатора до сигнала SIGINT или SIGTERM
+async def run_router():
+    workers = getattr(config, "BOT_WORKERS", DEFAULT_WORKERS)
+    router = UpdateRouter(workers, os.environ[WORKER_SECRET_ENV])
+    stop_event = create_stop_event()
+    router.start()
+
+    async with Bot(config.BOT_TOKEN) as bot:
+        if getattr(config, "BOT_MODE", "polling") == "webhook":
+            server = RoutingWebhookServer(router, **get_webhook_settings())
+            await server.start()
+            try:
+                await register_webhook(bot, server.secret_token)
+                await stop_event.wait()
+            finally:
+                await server.stop()
+        else:
+            await poll_updates(bot, router, stop_event)
+
+    await router.stop()
+
+
+def main():
+    setup_logging(config.LOG_FILE)
+    logger.info("Маршрутизатор обновлений запущен, воркеров: %s", getattr(config, 'BOT_WORKERS', DEFAULT_WORKERS))
+    asyncio.run(run_router())
+    logger.info("Маршрутизатор обновлений остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Получение обновлений Telegram через webhook.
+
+Встроенный HTTP-сервер на asyncio (без дополнительных зависимостей, как
+и сервер подписки feed_server) принимает POST-запросы Telegram по пути
+WEBHOOK_PATH, проверяет секретный токен из заголовка
+X-Telegram-Bot-Api-Secret-Token и передает обновления в очередь приложения.
+Ответ отправляется сразу, не дожидаясь обработки обновления. Соединения
+не закрываются после ответа (keep-alive): Telegram отправляет обновления
+по нескольким постоянным соединениям (WEBHOOK_MAX_CONNECTIONS).
+
+Для локальной проверки достаточно отправить записанное обновление:
+
+    curl -X POST -H "X-Telegram-Bot-Api-Secret-Token: <секрет>" \\
+         --data @update.json http://127.0.0.1:8443/telegram
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+
+from telegram import Update
+
+# Импорт конфигурации
+try:
+    import config
+except ImportError:
+    print("Файл конфигурации не найден. Пожалуйста, создайте файл config.py на основе config.py.example")
+    exit(1)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEBHOOK_HOST = "127.0.0.1"
+DEFAULT_WEBHOOK_PORT = 8443
+DEFAULT_WEBHOOK_PATH = "/telegram"
+DEFAULT_WEBHOOK_MAX_CONNECTIONS = 40
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+# Путь проверки работоспособности (GET): 200, если приложение запущено
+HEALTH_PATH = "/health"
+
+# Ограничения на запрос клиента
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 10
+
+# Сколько секунд держать открытым соединение без запросов
+KEEPALIVE_TIMEOUT = 60
+
+# Сколько секунд при остановке ждать завершения начатых запросов
+SHUTDOWN_TIMEOUT = 5
+
+
+class WebhookServer:
+    """HTTP-сервер, принимающий обновления Telegram для приложения python-telegram-bot"""
+
+    def __init__(self, application, host=DEFAULT_WEBHOOK_HOST, port=DEFAULT_WEBHOOK_PORT,
+                 path=DEFAULT_WEBHOOK_PATH, secret_token=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._server = None
+        self._closing = False
+        # Задачи открытых соединений и соединений, ожидающих следующего запроса
+        self._connections = set()
+        self._idle = set()
+
+    async def start(self):
+        self._closing = False
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Сервер webhook запущен на %s:%s%s", self.host, self.port, self.path)
+
+    # Остановка сервера: новые соединения не принимаются, простаивающие
+    # закрываются, а начатые запросы получают ответ (не дольше SHUTDOWN_TIMEOUT)
+    async def stop(self):
+        if self._server is None:
+            return
+        self._closing = True
+        self._server.close()
+
+        for task in list(self._idle):
+            task.cancel()
+        if self._connections:
+            _, pending = await asyncio.wait(list(self._connections), timeout=SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        await self._server.wait_closed()
+        self._server = None
+        logger.info("Сервер webhook остановлен")
+
+    # Обработка одного соединения: запросы читаются, пока клиент не закроет соединение
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._closing:
+                self._idle.add(task)
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                finally:
+                    self._idle.discard(task)
+                if not request_line:
+                    break
+
+                request = await asyncio.wait_for(self._read_request(reader, request_line), REQUEST_TIMEOUT)
+                if not await self._respond(writer, *request):
+                    break
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            await self._send_status(writer, 400, "Bad Request")
+        except Exception as e:
+            logger.error("Ошибка при обработке запроса webhook: %s", e)
+            await self._send_status(writer, 500, "Internal Server Error")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader, request_line):
+        parts = request_line.decode("latin-1").strip().split()
+        if len(parts) != 3:
+            raise ValueError("некорректная строка запроса")
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("слишком много заголовков")
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise ValueError("некорректный заголовок Content-Length")
+        if length < 0 or length > MAX_BODY_SIZE or "transfer-encoding" in headers:
+            raise ValueError("недопустимое тело запроса")
+        body = await reader.readexactly(length) if length else b""
+
+        keep_alive = parts[2].upper() == "HTTP/1.1"
+        connection = headers.get("connection", "").lower()
+        if connection == "close":
+            keep_alive = False
+        elif connection == "keep-alive":
+            keep_alive = True
+
+        return parts[0].upper(), parts[1], headers, body, keep_alive
+
+    # Ответ на запрос. Возвращает True, если соединение можно использовать дальше.
+    async def _respond(self, writer, method, path, headers, body, keep_alive):
+        keep_alive = keep_alive and not self._closing
+        path = path.split("?", 1)[0]
+
+        if path == HEALTH_PATH and method == "GET":
+            if self.is_healthy():
+                await self._send(writer, 200, "OK", keep_alive)
+            else:
+                await self._send(writer, 503, "Service Unavailable", keep_alive)
+            return keep_alive
+        if path != self.path:
+            await self._send(writer, 404, "Not Found", keep_alive)
+            return keep_alive
+        if method != "POST":
+            await self._send(writer, 405, "Method Not Allowed", keep_alive)
+            return keep_alive
+
+        if self.secret_token is not None:
+            received = headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received.encode("latin-1"), self.secret_token.encode("latin-1")):
+                logger.warning("Запрос webhook с неверным секретным токеном отклонен")
+                await self._send(writer, 403, "Forbidden", keep_alive)
+                return keep_alive
+
+        status, reason = await self._dispatch(body)
+        await self._send(writer, status, reason, keep_alive)
+        return keep_alive
+
+    # Передача обновления из тела запроса на обработку. Возвращает код и текст ответа.
+    async def _dispatch(self, body):
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning("Не удалось разобрать обновление из запроса webhook: %s", e)
+            return 400, "Bad Request"
+
+        await self.application.update_queue.put(update)
+        return 200, "OK"
+
+    def is_healthy(self):
+        return self.application.running
+
+    async def _send(self, writer, status, reason, keep_alive):
+        writer.write((
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+    async def _send_status(self, writer, status, reason):
+        try:
+            await self._send(writer, status, reason, False)
+        except ConnectionError:
+            pass
+
+
+# Функция для получения настроек сервера webhook из config.py.
+# Если адрес webhook задан, а секрет - нет, секрет генерируется при запуске:
+# Telegram получает его при регистрации webhook.
+def get_webhook_settings():
+    secret_token = getattr(config, "WEBHOOK_SECRET_TOKEN", "") or None
+    if secret_token is None and getattr(config, "WEBHOOK_URL", ""):
+        secret_token = secrets.token_urlsafe(32)
+    if secret_token is None:
+        logger.warning("WEBHOOK_SECRET_TOKEN не задан: запросы к webhook не проверяются")
+
+    return {
+        "host": getattr(config, "WEBHOOK_HOST", DEFAULT_WEBHOOK_HOST),
+        "port": getattr(config, "WEBHOOK_PORT", DEFAULT_WEBHOOK_PORT),
+        "path": getattr(config, "WEBHOOK_PATH", DEFAULT_WEBHOOK_PATH),
+        "secret_token": secret_token,
+    }
+
+
+# Функция для создания сервера webhook по настройкам из config.py
+def create_webhook_server(application):
+    return WebhookServer(application, **get_webhook_settings())
+
+
+# Функция для регистрации webhook в Telegram. Без внешнего адреса
+# webhook не регистрируется (например, при локальной проверке).
+async def register_webhook(bot, secret_token):
+    webhook_url = getattr(config, "WEBHOOK_URL", "")
+    if not webhook_url:
+        return
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=secret_token,
+        allowed_updates=Update.ALL_TYPES,
+        max_connections=getattr(config, "WEBHOOK_MAX_CONNECTIONS", DEFAULT_WEBHOOK_MAX_CONNECTIONS),
+    )
+    logger.info("Webhook зарегистрирован: %s", webhook_url)
+
+
+# Функция для создания события, которое устанавливается по сигналу SIGINT или SIGTERM
+def create_stop_event():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    return stop_event
+
+
+# Функция для работы бота в режиме webhook до сигнала SIGINT или SIGTERM.
+# Повторяет жизненный цикл Application.run_polling: post_init после инициализации,
+# а при остановке сервер перестает принимать обновления, уже принятые
+# обрабатываются до конца, затем вызываются post_stop и post_shutdown.
+# Если сервер передан (процесс бота за маршрутизатором update_router),
+# webhook в Telegram не регистрируется.
+async def run_webhook(application, server=None):
+    register = server is None
+    if server is None:
+        server = create_webhook_server(application)
+    stop_event = create_stop_event()
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+
+        if register:
+            await register_webhook(application.bot, server.secret_token)
+
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)